@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Script to compare the compile time, peak compiler memory and binary size
+of the different lowerings (lazybenchmark_compile.csv)
+"""
+
+import argparse
+import csv
+from enum import IntEnum
+
+class CompileColName(IntEnum):
+    BENCHMARK = 0
+    SUFFIX = 1
+    PARALLEL_FRAMEWORK = 2
+    TASK_SCHEDULER = 3
+    PFOR_MAXGRAINSIZE = 4
+    IGNORE_USERS_PFORGRAINSIZE = 5
+    STATUS = 6
+    COMPILE_TIME = 7
+    USER_TIME = 8
+    SYS_TIME = 9
+    PEAK_RSS = 10
+    OBJECT_SIZE = 11
+    BINARY_SIZE = 12
+    ERROR_MSG = 13
+
+fp_format = '.2f'
+
+# Columns added up by each metric
+metric2col = {
+    "time": [CompileColName.COMPILE_TIME],
+    "cpu": [CompileColName.USER_TIME, CompileColName.SYS_TIME],
+    "rss": [CompileColName.PEAK_RSS],
+    "object": [CompileColName.OBJECT_SIZE],
+    "binary": [CompileColName.BINARY_SIZE],
+}
+
+# Order in which the lowerings are displayed. Baseline is OpenCilk.
+lowering_order = ['t', 'uf', 'lf', 'ef', 's']
+
+baseline_suffix = "pnnt"
+
+def get_lowering(suffix):
+    for lowering in lowering_order:
+        if suffix.endswith(lowering):
+            return lowering
+    return suffix
+
+def suffix_key(suffix):
+    lowering = get_lowering(suffix)
+    if lowering in lowering_order:
+        return (lowering_order.index(lowering), suffix)
+    return (len(lowering_order), suffix)
+
+# Read the csv result. Cached or failed compiles are skipped.
+def getresult(input_file, metric):
+    cols = [int(col) for col in metric2col[metric]]
+    list_of_results = {}
+    set_of_suffix = set()
+
+    with open(input_file) as myfile:
+        csvreader = csv.reader(myfile)
+        for row in csvreader:
+            if not row or row[int(CompileColName.BENCHMARK)] in ["", "BENCHMARK"]:
+                continue
+            if row[int(CompileColName.STATUS)] != "OK" or any(row[col] == "" for col in cols):
+                continue
+
+            benchname = row[int(CompileColName.BENCHMARK)].replace('/', '-')
+            suffix = row[int(CompileColName.SUFFIX)]
+            set_of_suffix.add(suffix)
+
+            if benchname not in list_of_results:
+                list_of_results[benchname] = {}
+            list_of_results[benchname][suffix] = sum(float(row[col]) for col in cols)
+
+    return sorted(set_of_suffix, key=suffix_key), list_of_results
+
+def geomean(values):
+    prod = 1.0
+    for val in values:
+        prod *= val
+    return prod ** (1.0/len(values))
+
+# Generate the table: the baseline is shown as an absolute value, the other
+# variants as the percentage increase over the baseline.
+def process_results(set_of_suffix, list_of_results, metric, tex):
+    perc = '%'
+    if(tex):
+        perc = '\\%'
+
+    table_result = [["Benchmark"]]
+    for suffix in set_of_suffix:
+        if suffix == baseline_suffix:
+            table_result[0].append(f'{suffix} ({metric})')
+        else:
+            table_result[0].append(f'{suffix} ({perc})')
+
+    ratios = {}
+    for benchname in sorted(list_of_results.keys()):
+        row = [benchname]
+        results = list_of_results[benchname]
+        baseline = results.get(baseline_suffix, -1)
+        for suffix in set_of_suffix:
+            if suffix not in results:
+                row.append("N/A")
+            elif suffix == baseline_suffix:
+                row.append(format(baseline, fp_format))
+            elif baseline <= 0:
+                row.append(format(results[suffix], fp_format))
+            else:
+                increase = (results[suffix] - baseline)/baseline * 100
+                row.append(f'{format(increase, fp_format)} {perc}')
+                if suffix not in ratios:
+                    ratios[suffix] = []
+                ratios[suffix].append(results[suffix]/baseline)
+        table_result.append(row)
+
+    row = ["Geomean"]
+    for suffix in set_of_suffix:
+        if suffix in ratios:
+            row.append(f'{format((geomean(ratios[suffix])-1)*100, fp_format)} {perc}')
+        else:
+            row.append("")
+    table_result.append(row)
+
+    row = ["Max"]
+    for suffix in set_of_suffix:
+        if suffix in ratios:
+            row.append(f'{format((max(ratios[suffix])-1)*100, fp_format)} {perc}')
+        else:
+            row.append("")
+    table_result.append(row)
+
+    return table_result
+
+def generate_table(table_results, tex):
+    for i, row in enumerate(table_results):
+        if(tex):
+            if(i == 0):
+                print("\\toprule")
+            elif(i == 1):
+                print("\\midrule")
+            print(" & ".join(str(col) for col in row) + " \\\\ ")
+        else:
+            print(", ".join(str(col) for col in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the compile cost of the lowerings')
+    parser.add_argument("--ifile", required=True, help="lazybenchmark_compile.csv to analyze")
+    parser.add_argument("--metric", default="time", choices=list(metric2col.keys()),
+                        help="Compile wall time, compiler cpu time (user + system), peak compiler rss(KB), object size or binary size. Default: time")
+    parser.add_argument("--tex", action='store_true', help="Generate in latex format. Default is csv")
+
+    flags = parser.parse_args()
+
+    set_of_suffix, results = getresult(flags.ifile, flags.metric)
+    table_results = process_results(set_of_suffix, results, flags.metric, flags.tex)
+    generate_table(table_results, flags.tex)
+
+# Main entry
+main()
@@ -13,10 +13,11 @@ import multiprocessing
 import time
 import shutil
 import statistics
-from scipy.stats import gmean
 from enum import Enum
 from enum import IntEnum
 
+import steady_state
+
 class ColName(IntEnum):
     BENCHMARK = 0;
     COMPILES = 1
@@ -60,17 +61,81 @@ def getImplNameArg(opt):
     else:
         return opt
 
+# Lowering of the LazyD frameworks, whose polling modes getImplNameArg maps
+# to the same implementation
+polling2arg = {"LazyD with Frequent Polling": "lazyd2", "LazyD with InFrequent Polling": "lazyd0"}
+
+# Name of the implementation that keeps the polling mode of LazyD, e.g.
+# LazyD+lazyd0 and LazyD+lazyd2
+def getPollingImplName(framework, opt):
+    impl = getImplNameArg(opt)
+    if framework in polling2arg:
+        impl += "+" + polling2arg[framework]
+    return impl
+
+# Allocator and THP mode of the row, appended to the name of the
+# implementation when they are not the default
+def getRuntimeName(row, allocator_col, thp_col):
+    name = ""
+    if allocator_col is not None and row[allocator_col] not in ["", "glibc"]:
+        name += f"+{row[allocator_col]}"
+    if thp_col is not None and row[thp_col] not in ["", "system"]:
+        name += f"+thp-{row[thp_col]}"
+    return name
+
 def ignore_impl (impl, baseline_impl_name, tex):
     if (impl == baseline_impl_name) or (tex and '+' in impl):
         return 1
 
+# Rounds of every invocation of a cell, from the lazybenchmark_samples.csv
+# next to input_file: invocations[(benchmark, dataset, num cores)]. Empty
+# for the sweeps written before the samples were recorded.
+def getinvocations(input_file):
+  invocations = {}
+  samples_file = os.path.join(os.path.dirname(input_file), "lazybenchmark_samples.csv")
+  if not os.path.exists(samples_file):
+      return invocations
+  with open(samples_file) as myfile:
+    csvreader = csv.reader(myfile)
+    header = next(csvreader, None)
+    if header is None or "ROUND" not in header:
+        return invocations
+    round_col = header.index("ROUND")
+    for row in csvreader:
+      if len(row) <= round_col or not row[round_col].isdigit():
+          continue
+      benchname = row[0].split('/')
+      cell = (f'{benchname[-2]}-{benchname[-1]}', row[1].replace('_', '-'), row[2])
+      invocations[cell] = max(invocations.get(cell, 0), int(row[round_col]) + 1)
+  return invocations
+
+# Split the rounds of a row into those of each invocation (--samples), the
+# whole row being one invocation when per_invocation is unknown
+def split_invocations(rounds, per_invocation=None):
+    if not per_invocation:
+        return [rounds]
+    return [rounds[i:i+per_invocation] for i in range(0, len(rounds), per_invocation)]
+
+# Mean of the rounds after dropping the warmup rounds of every invocation, -1
+# if the cell failed
+def steady_mean(rounds, warmup, per_invocation=None):
+    if any(val < 0 for val in rounds):
+        return statistics.mean(rounds)
+    steady, dropped = steady_state.steady_rounds(split_invocations(rounds, per_invocation), warmup)
+    return statistics.mean(steady)
+
 def calculate_mr (imisses, ihits):
     if imisses < 0:
         return -1
     return 100* imisses/(imisses + ihits)
 
 # Generate the table
-def process_results(set_of_impl, list_of_results, samples, tex, icache):
+# invocations (see getinvocations) splits the rows before dropping the warmup
+# rounds.
+def process_results(set_of_impl, list_of_results, samples, tex, icache, warmup="none", invocations=None):
+    # scipy takes most of the startup time, only pay for it when processing
+    from scipy.stats import gmean
+
     set_of_impl = sorted(set_of_impl)
 
     perc = '%'
@@ -79,6 +144,11 @@ def process_results(set_of_impl, list_of_results, samples, tex, icache):
 
     baseline_impl_name = "OpenCilk+PBBS+2048+cg"
     baseline_impl_name = getImplNameArg(baseline_impl_name)
+    if baseline_impl_name not in list_of_results:
+        # Every THP mode was set explicitly, compare to the first one of glibc
+        candidates = sorted(impl for impl in list_of_results if impl.startswith(baseline_impl_name + "+thp-"))
+        if candidates:
+            baseline_impl_name = candidates[0]
 
     myKeys = list(list_of_results[baseline_impl_name].keys())
     myKeys.sort()
@@ -122,7 +192,8 @@ def process_results(set_of_impl, list_of_results, samples, tex, icache):
                     ihits = baselinesamples[samples-1]
                     baselineavg = calculate_mr(imisses, ihits)
                 else:
-                    baselineavg = statistics.mean(baselinesamples[0:samples])
+                    per_invocation = invocations.get((key1, key2, key3)) if invocations else None
+                    baselineavg = steady_mean(baselinesamples[0:samples], warmup, per_invocation)
                 
                 if(baselineavg < 0):
                     table_result[i].append("N/A")
@@ -143,7 +214,7 @@ def process_results(set_of_impl, list_of_results, samples, tex, icache):
                                     ihits = othersample[samples-1]
                                     otheravg = calculate_mr(imisses, ihits)
                                 else:
-                                    otheravg = statistics.mean(othersample[0:samples])
+                                    otheravg = steady_mean(othersample[0:samples], warmup, per_invocation)
                        
                                 if(baselineavg <= 0 or baselineavg == "N/A"):
                                     table_result[i].append("N/A")
@@ -215,8 +286,33 @@ def process_results(set_of_impl, list_of_results, samples, tex, icache):
 
     return table_result
         
-# Read the csv result
-def getresult(input_file):
+# Noise factor of every results row of a sweep run with --sentinel, from its
+# lazybenchmark_noise.csv: factors[(benchmark, dataset, num cores, impl)]
+def getnoise(noise_file):
+  factors = {}
+  with open(noise_file) as myfile:
+    csvreader = csv.reader(myfile)
+    header = next(csvreader)
+    allocator_col = header.index("ALLOCATOR")
+    thp_col = header.index("THP")
+    factor_col = header.index("FACTOR")
+    for row in csvreader:
+      if not row:
+          continue
+      benchname = row[int(ColName.BENCHMARK)].split('/')
+      cg = "nocg" if row[int(ColName.IGNORE_USERS_PFORGRAINSIZE)] == "Yes" else "cg"
+      impl = getImplNameArg(f"{row[int(ColName.PARALLEL_FRAMEWORK)]}+{row[int(ColName.TASK_SCHEDULER)]}+{row[int(ColName.PFOR_MAXGRAINSIZE)]}+{cg}")
+      impl += getRuntimeName(row, allocator_col, thp_col)
+      factors[(f'{benchname[-2]}-{benchname[-1]}', row[int(ColName.DATASET)].replace('_', '-'), row[int(ColName.NUM_CORES)], impl)] = float(row[factor_col])
+  return factors
+
+# Times of a row divided by its noise factor, failed rounds (-1) are kept
+def normalize(times, factor):
+    return [val / factor if val >= 0 else val for val in times]
+
+# Read the csv result. With noise (see getnoise), the times are normalized by
+# the noise factor of their row.
+def getresult(input_file, noise=None):
   myfile = open(input_file)
   csvreader = csv.reader(myfile)
 
@@ -224,17 +320,30 @@ def getresult(input_file):
 
   set_of_impl = set()
 
+  # Files written before the allocator and THP were swept have no such columns
+  time_col = int(ColName.TIME)
+  err_col = int(ColName.ERROR_MSG)
+  allocator_col = None
+  thp_col = None
+
   # Get the results
   for row in csvreader:
     benchmark_name = row[int(ColName.BENCHMARK)]
 
+    if benchmark_name == "BENCHMARK" and "ALLOCATOR" in row:
+        allocator_col = row.index("ALLOCATOR")
+        thp_col = row.index("THP")
+        time_col = row.index("TIME(sec)")
+        err_col = row.index("ERROR MSG")
+
     # Skip if empty data or header
     if(benchmark_name == "" or benchmark_name == "BENCHMARK"):
         continue
 
     #benchname = benchmark_name.replace('\\/', '-')
+    # pbbs_v2 names are <benchmark>/<impl>/<binary>, cilk5 names <benchmark>/<binary>
     benchname = benchmark_name.split('/')
-    benchname = f'{benchname[1]}-{benchname[2]}'
+    benchname = f'{benchname[-2]}-{benchname[-1]}'
 
     # Get the actual benchmark name
     compiles = row[int(ColName.COMPILES)]
@@ -246,15 +355,15 @@ def getresult(input_file):
     task_scheduler = row[int(ColName.TASK_SCHEDULER)]
     pfor_grainsize = row[int(ColName.PFOR_MAXGRAINSIZE)]
     ignore_user_grainsize = row[int(ColName.IGNORE_USERS_PFORGRAINSIZE)]
-    time = row[int(ColName.TIME):len(row)-1]
-    err = row[int(ColName.ERROR_MSG)]
+    time = row[time_col:len(row)-1]
+    err = row[err_col]
     
     cg = "cg"
     if(ignore_user_grainsize == "Yes"):
         cg = "nocg"
     
     name_of_impl = f"{parallel_framework}+{task_scheduler}+{pfor_grainsize}+{cg}"
-    name_of_impl = getImplNameArg(name_of_impl)
+    name_of_impl = getImplNameArg(name_of_impl) + getRuntimeName(row, allocator_col, thp_col)
     set_of_impl.add(name_of_impl)
 
     if(name_of_impl not in list_of_results):
@@ -268,8 +377,10 @@ def getresult(input_file):
         list_of_results[name_of_impl][benchname][dataset] = {}
         
     num_time = [-1] * len(time)
-    if(not (err in ["Verification failed", "Benchmark failed to run"])):
+    if(status == "Correct" and not (err in ["Verification failed", "Benchmark failed to run"])):
         num_time = [ float(val) if val or val.isnumeric() else -1 for val in time]
+        if noise is not None and (benchname, dataset, num_cores, name_of_impl) in noise:
+            num_time = normalize(num_time, noise[(benchname, dataset, num_cores, name_of_impl)])
 
     list_of_results[name_of_impl][benchname][dataset][num_cores] = (num_time)
   
@@ -308,12 +419,133 @@ def generate_table(table_results, tex):
             print("")
 
 
+# Returns cells[(benchmark, dataset, num cores, impl)][(allocator, thp)] = mean
+# time of the rows that ran correctly, normalized with noise (see getnoise)
+def getruntimes(input_file, warmup, noise=None):
+  cells = {}
+  invocations = getinvocations(input_file)
+  cols = None
+  with open(input_file) as myfile:
+    for row in csv.reader(myfile):
+      if row and row[0] == "BENCHMARK":
+          cols = {name: row.index(name) for name in ["ALLOCATOR", "THP", "TIME(sec)"] if name in row}
+          continue
+      if not row or row[0] == "" or not cols or "ALLOCATOR" not in cols:
+          continue
+      if row[int(ColName.STATUS)] != "Correct":
+          continue
+      benchname = row[int(ColName.BENCHMARK)].split('/')
+      cg = "nocg" if row[int(ColName.IGNORE_USERS_PFORGRAINSIZE)] == "Yes" else "cg"
+      impl = getImplNameArg(f"{row[int(ColName.PARALLEL_FRAMEWORK)]}+{row[int(ColName.TASK_SCHEDULER)]}+{row[int(ColName.PFOR_MAXGRAINSIZE)]}+{cg}")
+      cell = (f'{benchname[-2]}-{benchname[-1]}', row[int(ColName.DATASET)].replace('_', '-'), row[int(ColName.NUM_CORES)], impl)
+      times = [float(val) for val in row[cols["TIME(sec)"]:len(row)-1] if val and val != "N/A"]
+      noise_key = cell[:3] + (impl + getRuntimeName(row, cols["ALLOCATOR"], cols["THP"]),)
+      if noise is not None and noise_key in noise:
+          times = normalize(times, noise[noise_key])
+      if times:
+          cells.setdefault(cell, {})[(row[cols["ALLOCATOR"]], row[cols["THP"]])] = steady_mean(times, warmup, invocations.get(cell[:3]))
+  return cells
+
+# Table of the allocator and THP mode with the lowest time of every cell and
+# its gain over glibc
+def process_runtimes(cells, tex):
+    perc = '\%' if tex else '%'
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Impl", "Allocator", "THP", "Best(s)", "glibc(s)", f"Gain({perc})"]]
+    for cell in sorted(cells):
+        runtimes = cells[cell]
+        best = min(runtimes, key=lambda runtime: runtimes[runtime])
+        defaults = sorted(runtime for runtime in runtimes if runtime[0] == "glibc")
+        default = ("glibc", "system") if ("glibc", "system") in runtimes else (defaults[0] if defaults else None)
+        row = list(cell) + [best[0], best[1], format(runtimes[best], fp_format)]
+        if default is None:
+            row += ["N/A", "N/A"]
+        else:
+            row += [format(runtimes[default], fp_format), format((runtimes[default]/runtimes[best] - 1)*100, fp_format)]
+        table_result.append(row)
+    return table_result
+
+# Returns cells[(benchmark, dataset, num cores, impl)] = [time of the rounds,
+# rounds, wall time, energy] summed over the runs of lazybenchmark_energy.csv
+# (--energy) that ran correctly. The polling modes of LazyD are kept apart.
+def getenergy(energy_file):
+  cells = {}
+  with open(energy_file) as myfile:
+    csvreader = csv.reader(myfile)
+    header = next(csvreader)
+    cols = {name: header.index(name) for name in header}
+    for row in csvreader:
+      if not row or row[cols["STATUS"]] != "Correct" or not row[cols["ENERGY(J)"]] or not row[cols["TIME(sec)"]]:
+          continue
+      benchname = row[cols["BENCHMARK"]].split('/')
+      cg = "nocg" if row[cols["IGNORE_USERS_PFORGRAINSIZE"]] == "Yes" else "cg"
+      framework = row[cols['PARALLEL_FRAMEWORK']]
+      impl = getPollingImplName(framework, f"{framework}+{row[cols['TASK_SCHEDULER']]}+{row[cols['PFOR_MAXGRAINSIZE']]}+{cg}")
+      impl += getRuntimeName(row, cols["ALLOCATOR"], cols["THP"])
+      cell = (f'{benchname[-2]}-{benchname[-1]}', row[cols["DATASET"]].replace('_', '-'), row[cols["NUM CORES"]], impl)
+      sums = cells.setdefault(cell, [0.0, 0, 0.0, 0.0])
+      for i, name in enumerate(["TIME(sec)", "ROUNDS", "WALL(sec)", "ENERGY(J)"]):
+          sums[i] += float(row[cols[name]]) if i != 1 else int(row[cols[name]])
+  return cells
+
+# Table of the average power, the energy and the energy-delay product (EDP)
+# of a round of every implementation, and their gain over the baseline. The
+# energy of a round is the average power of its runs times its mean time.
+def process_energy(cells, tex):
+    from scipy.stats import gmean
+
+    perc = '\%' if tex else '%'
+    baseline_impl_name = getImplNameArg("OpenCilk+PBBS+2048+cg")
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Impl", "Time(s)", "Power(W)", "Energy(J)", "EDP(Js)",
+                     f"Energy Gain({perc})", f"EDP Gain({perc})"]]
+    metrics = {}
+    for cell, (time_sum, rounds, wall, joules) in cells.items():
+        # Runs shorter than the update period of the counters may read no energy
+        if rounds == 0 or wall <= 0 or joules <= 0:
+            continue
+        power = joules / wall
+        delay = time_sum / rounds
+        metrics[cell] = (delay, power, power * delay, power * delay * delay)
+
+    edp_gains = {}
+    for cell in sorted(metrics):
+        delay, power, round_energy, edp = metrics[cell]
+        row = list(cell) + [format(delay, '.4f'), format(power, fp_format), format(round_energy, '.4f'), format(edp, '.4f')]
+        base = metrics.get(cell[:3] + (baseline_impl_name,))
+        if cell[3] == baseline_impl_name or base is None or base[2] <= 0:
+            table_result.append(row + ["", ""])
+            continue
+        row.append(f'{format((base[2] - round_energy)/base[2] * 100, fp_format)} {perc}')
+        edp_gain = (base[3] - edp)/base[3]
+        row.append(f'{format(edp_gain * 100, fp_format)} {perc}')
+        table_result.append(row)
+        edp_gains.setdefault(cell[3], []).append(edp_gain + 1)
+
+    # Geomean of the EDP gain of every implementation
+    for impl in sorted(edp_gains):
+        table_result.append(["Geomean", "", "", impl, "", "", "", "", "", f'{format((gmean(edp_gains[impl])-1)*100, fp_format)} {perc}'])
+    return table_result
+
+# Returns the table of the results in input_file, see generate_table
+def analyze(input_file, tex=False, icache=False, warmup="none", noise=None):
+    set_of_impl, results, samples = getresult(input_file, noise)
+    return process_results(set_of_impl, results, samples, tex, icache, warmup, getinvocations(input_file))
+
 def main():
     # Pargse the argument
     parser = argparse.ArgumentParser(description='Option to ')
     parser.add_argument("--ifile", required=True, help="CSV to analyze")    
     parser.add_argument("--icache", action='store_true', help="Analyze the icache misses")
     parser.add_argument("--tex", action='store_true', help="Generate in latex format. Default is csv")    
+    parser.add_argument("--warmup", default="none", choices=["mser", "none"],
+                        help="Rule to drop the warmup rounds of every invocation before averaging. mser: MSER truncation, none: keep every round. Default: none")
+    parser.add_argument("--runtime", action='store_true', help="Show the allocator and THP mode with the lowest time of every benchmark")
+    parser.add_argument("--normalize", action='store_true',
+                        help="Divide the times of every row by its noise factor, measured by the sentinel of a sweep run with --sentinel")
+    parser.add_argument("--noise", default=None, help="Noise factors of --normalize. Default: lazybenchmark_noise.csv next to --ifile")
+    parser.add_argument("--energy", action='store_true',
+                        help="Show the power, energy and energy-delay product of every implementation and their gain over OpenCilk, "
+                        "from the lazybenchmark_energy.csv of a sweep run with --energy")
+    parser.add_argument("--energy_file", default=None, help="Energy of the runs of --energy. Default: lazybenchmark_energy.csv next to --ifile")
 
     
     flags = parser.parse_args()
@@ -324,14 +556,29 @@ def main():
     if(icache):
         fp_format = '.5f'
 
-    # Read the files
-    set_of_impl, results, samples = getresult(ifile);
-    
-    # Do the processing
-    table_results = process_results(set_of_impl, results, samples, tex, icache)
+    noise = None
+    if flags.normalize:
+        if icache:
+            parser.error("--normalize only applies to times, not to --icache")
+        noise_file = flags.noise if flags.noise else os.path.join(os.path.dirname(ifile), "lazybenchmark_noise.csv")
+        if not os.path.exists(noise_file):
+            parser.error(f"No noise factors in {noise_file}, run the sweep with --sentinel")
+        noise = getnoise(noise_file)
+
+    # Read the files and do the processing
+    if flags.energy:
+        energy_file = flags.energy_file if flags.energy_file else os.path.join(os.path.dirname(ifile), "lazybenchmark_energy.csv")
+        if not os.path.exists(energy_file):
+            parser.error(f"No energy measurements in {energy_file}, run the sweep with --energy")
+        table_results = process_energy(getenergy(energy_file), tex)
+    elif flags.runtime:
+        table_results = process_runtimes(getruntimes(ifile, flags.warmup, noise), tex)
+    else:
+        table_results = analyze(ifile, tex, icache, flags.warmup, noise)
 
     # Generate table
     generate_table(table_results, tex)
     
 # Main entry
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Script to check the samples (lazybenchmark_samples.csv) of each cell for
+drift over the course of the sweep
+"""
+
+import argparse
+import csv
+from enum import IntEnum
+
+class SampleColName(IntEnum):
+    BENCHMARK = 0
+    DATASET = 1
+    NUM_CORES = 2
+    SUFFIX = 3
+    ORDER = 4
+    SAMPLE = 5
+    POSITION = 6
+    TIMESTAMP = 7
+    ROUND = 8
+    STATUS = 9
+    TIME = 10
+
+fp_format = '.2f'
+
+# Read the csv result. Returns results[(benchmark, dataset, cores)][suffix] =
+# [(position, round, timestamp, time)]
+def getresult(input_file):
+    list_of_results = {}
+    with open(input_file) as myfile:
+        csvreader = csv.reader(myfile)
+        for row in csvreader:
+            if not row or row[int(SampleColName.BENCHMARK)] in ["", "BENCHMARK"]:
+                continue
+            if row[int(SampleColName.STATUS)] != "Correct":
+                continue
+            try:
+                res = float(row[int(SampleColName.TIME)])
+            except ValueError:
+                continue
+            cell = (row[int(SampleColName.BENCHMARK)], row[int(SampleColName.DATASET)], int(row[int(SampleColName.NUM_CORES)]))
+            suffix = row[int(SampleColName.SUFFIX)]
+            sample = (int(row[int(SampleColName.POSITION)]), int(row[int(SampleColName.ROUND)]),
+                      float(row[int(SampleColName.TIMESTAMP)]), res)
+            list_of_results.setdefault(cell, {}).setdefault(suffix, []).append(sample)
+    return list_of_results
+
+def mean(values):
+    return sum(values)/len(values)
+
+# Least-squares slope of ys over xs
+def slope(xs, ys):
+    mx = mean(xs)
+    my = mean(ys)
+    sxx = sum((x-mx)**2 for x in xs)
+    if sxx == 0:
+        return 0
+    return sum((x-mx)*(y-my) for x, y in zip(xs, ys)) / sxx
+
+# For every variant of a cell, the slope of the time over the order in which
+# the samples ran (in % of the mean per sample) and the change from the
+# first to the second half of its samples.  The variants of the cell are
+# normalized by their mean and pooled to estimate the drift common to the
+# cell; its change is the slope over all the samples of the cell.
+def process_results(list_of_results, threshold):
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Suffix", "Samples", "Mean(s)", "Slope(%/sample)", "Change(%)", "Drift"]]
+
+    for cell in sorted(list_of_results):
+        pooled_x = []
+        pooled_y = []
+        # Rank of each (position, round) inside the cell
+        ranks = sorted(set((pos, rnd) for samples in list_of_results[cell].values() for pos, rnd, ts, res in samples))
+        rank_of = {key: i for i, key in enumerate(ranks)}
+
+        for suffix in sorted(list_of_results[cell]):
+            samples = sorted(list_of_results[cell][suffix])
+            xs = [rank_of[(pos, rnd)] for pos, rnd, ts, res in samples]
+            ys = [res for pos, rnd, ts, res in samples]
+            avg = mean(ys)
+            row = list(cell) + [suffix, len(ys), format(avg, '.4f')]
+            if len(ys) < 2 or avg <= 0:
+                table_result.append(row + ["N/A", "N/A", ""])
+                continue
+
+            rel_slope = slope(xs, ys) / avg * 100
+            half = len(ys)//2
+            halves = (mean(ys[half:]) - mean(ys[:half])) / avg * 100
+            flag = "DRIFT" if abs(halves) > threshold else ""
+            table_result.append(row + [format(rel_slope, fp_format), format(halves, fp_format), flag])
+
+            pooled_x.extend(xs)
+            pooled_y.extend([y/avg for y in ys])
+
+        if len(set(pooled_x)) > 1:
+            rel_slope = slope(pooled_x, pooled_y) * 100
+            drift = rel_slope * (len(ranks) - 1)
+            flag = "DRIFT" if abs(drift) > threshold else ""
+            table_result.append(list(cell) + ["[cell]", len(pooled_y), "", format(rel_slope, fp_format), format(drift, fp_format), flag])
+
+    return table_result
+
+def generate_table(table_results):
+    for row in table_results:
+        print(", ".join(str(col) for col in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the samples of each cell for drift')
+    parser.add_argument("--ifile", required=True, help="lazybenchmark_samples.csv to analyze")
+    parser.add_argument("--threshold", default=2.0, type=float, help="Flag a drift larger than this percentage. Default: 2")
+
+    flags = parser.parse_args()
+
+    results = getresult(flags.ifile)
+    generate_table(process_results(results, flags.threshold))
+
+# Main entry
+main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Script to compare the folded stacks recorded with --profile between lowerings
+"""
+
+import argparse
+import os
+
+import perf_profile
+
+fp_format = '.2f'
+
+categories = ["user", "runtime", "polling", "kernel"]
+
+# Returns {cell: {suffix: folded file}} for the folded files in idir
+def getprofiles(idir):
+    profiles = {}
+    for fname in sorted(os.listdir(idir)):
+        if not fname.endswith(".folded"):
+            continue
+        cell, suffix = fname[:-len(".folded")].rsplit("__", 1)
+        profiles.setdefault(cell, {})[suffix] = os.path.join(idir, fname)
+    return profiles
+
+def category_samples(samples):
+    res = {category: 0 for category in categories}
+    for symbol, count in samples.items():
+        res[perf_profile.classify_symbol(symbol)] += count
+    return res
+
+def share(count, total):
+    return 100 * count / total if total else 0
+
+# Self samples of the variant against the baseline.  Since both profiles use
+# the same sampling frequency, a change in samples is a change in cpu time.
+def process_cell(cell, baseline_suffix, baseline_file, suffix, profile_file, top):
+    base = perf_profile.self_samples(perf_profile.read_folded(baseline_file))
+    other = perf_profile.self_samples(perf_profile.read_folded(profile_file))
+    base_total = sum(base.values())
+    other_total = sum(other.values())
+
+    table_result = [[f"{cell}: {suffix} vs {baseline_suffix}", "Category",
+                     f"{baseline_suffix} samples", f"{suffix} samples", "Delta samples",
+                     f"{baseline_suffix} %", f"{suffix} %"]]
+
+    base_cat = category_samples(base)
+    other_cat = category_samples(other)
+    for category in categories:
+        table_result.append([f"[{category}]", category, base_cat[category], other_cat[category],
+                             other_cat[category] - base_cat[category],
+                             format(share(base_cat[category], base_total), fp_format),
+                             format(share(other_cat[category], other_total), fp_format)])
+    table_result.append(["[total]", "", base_total, other_total, other_total - base_total, "", ""])
+
+    symbols = set(base) | set(other)
+    ranked = sorted(symbols, key=lambda sym: -abs(other.get(sym, 0) - base.get(sym, 0)))
+    for symbol in ranked[:top]:
+        table_result.append([symbol, perf_profile.classify_symbol(symbol),
+                             base.get(symbol, 0), other.get(symbol, 0),
+                             other.get(symbol, 0) - base.get(symbol, 0),
+                             format(share(base.get(symbol, 0), base_total), fp_format),
+                             format(share(other.get(symbol, 0), other_total), fp_format)])
+    return table_result
+
+def generate_table(table_results):
+    for row in table_results:
+        print(", ".join(str(col) for col in row))
+    print("")
+
+def main():
+    parser = argparse.ArgumentParser(description='Differential profile between lowerings')
+    parser.add_argument("--idir", required=True, help="profiles directory of a run (oDir/lazybenchmark_output_files*/profiles)")
+    parser.add_argument("--baseline", default="pnnt", help="Suffix of the baseline variant. Default: pnnt (OpenCilk+PBBS+2048+cg)")
+    parser.add_argument("--top", default=20, type=int, help="Number of functions listed per comparison. Default: 20")
+
+    flags = parser.parse_args()
+
+    profiles = getprofiles(flags.idir)
+    for cell in sorted(profiles):
+        if flags.baseline not in profiles[cell]:
+            print(f"{cell}: no profile for baseline {flags.baseline}\n")
+            continue
+        for suffix in sorted(profiles[cell]):
+            if suffix == flags.baseline:
+                continue
+            generate_table(process_cell(cell, flags.baseline, profiles[cell][flags.baseline],
+                                        suffix, profiles[cell][suffix], flags.top))
+
+# Main entry
+main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Script to fit the time of every implementation over the input sizes of a
+--size_sweep run and find the crossover size from which it beats the
+baseline
+"""
+
+import argparse
+import math
+
+from analyzecsv import getImplNameArg
+from comparecsv import getcells
+import size_sweep
+
+fp_format = '.4f'
+
+# Exponents of n^p and rates of r^n tried by the fit
+power_grid = [p / 20 for p in range(10, 81)]
+exp_grid = [r / 20 for r in range(22, 161)]
+
+# Number of sizes from which the exponent is fitted, the nominal exponent of
+# size_sweep is used below
+min_fit_sizes = 4
+
+# Group the mean time of the cells by series: results[(benchmark, family,
+# cores)][impl] = {size: mean}, and growth[(benchmark, family, cores)]
+def getseries(input_file, warmup, cores):
+    results = {}
+    growth = {}
+    for (benchname, dataset, num_cores, impl), times in getcells(input_file, warmup).items():
+        if not times or (cores is not None and int(num_cores) != cores):
+            continue
+        parsed = size_sweep.parse_input(benchname.split('-')[-1], dataset)
+        if parsed is None:
+            continue
+        family, size, series_growth = parsed
+        key = (benchname, family, int(num_cores))
+        results.setdefault(key, {}).setdefault(impl, {})[size] = sum(times)/len(times)
+        growth[key] = series_growth
+    return results, growth
+
+def transform(kind, exponent, n):
+    return n ** exponent if kind == "power" else exponent ** n
+
+# Weighted least squares fit of t = a + b x, with weights 1/t^2 so that every
+# size counts by its relative error. Returns (a, b), None if degenerate.
+def linear_fit(xs, ts):
+    ws = [1 / (t * t) for t in ts]
+    s = sum(ws)
+    sx = sum(w * x for w, x in zip(ws, xs))
+    sy = sum(w * t for w, t in zip(ws, ts))
+    sxx = sum(w * x * x for w, x in zip(ws, xs))
+    sxy = sum(w * x * t for w, x, t in zip(ws, xs, ts))
+    det = s * sxx - sx * sx
+    if det <= 0:
+        return None
+    b = (s * sxy - sx * sy) / det
+    return (sy - b * sx) / s, b
+
+# Fit t(n) = a + b g(n), g(n) = n^p (power growth) or r^n (exp growth), g
+# normalized by its value at the largest size. The exponent is the nominal
+# one of the benchmark with few sizes, else the one of the grid with the
+# least relative error. Returns (a, b, exponent, rms relative error %), None
+# if the time does not grow with the size.
+def fit(points, growth):
+    kind, nominal = growth
+    sizes = sorted(points)
+    ts = [points[n] for n in sizes]
+    if len(sizes) < 2 or min(ts) <= 0:
+        return None
+    grid = [nominal]
+    if len(sizes) >= min_fit_sizes:
+        grid = power_grid if kind == "power" else exp_grid
+    best = None
+    for exponent in grid:
+        top = transform(kind, exponent, sizes[-1])
+        xs = [transform(kind, exponent, n) / top for n in sizes]
+        coefs = linear_fit(xs, ts)
+        if coefs is None or coefs[1] <= 0:
+            continue
+        a, b = coefs
+        err = math.sqrt(sum(((a + b * x) / t - 1) ** 2 for x, t in zip(xs, ts)) / len(ts)) * 100
+        if best is None or err < best[3]:
+            best = (a, b, exponent, err)
+    return best
+
+def predict(model, kind, n, top_size):
+    a, b, exponent, err = model
+    return a + b * transform(kind, exponent, n) / transform(kind, exponent, top_size)
+
+# Sizes between the smallest and the largest one, evenly spaced in log (power
+# growth) or linearly (exp growth)
+def size_grid(kind, lo, hi, steps=200):
+    if kind == "power":
+        return [lo * (hi / lo) ** (i / steps) for i in range(steps + 1)]
+    return [lo + (hi - lo) * i / steps for i in range(steps + 1)]
+
+# Where the fitted time of the implementation crosses the one of the
+# baseline in the measured range. Returns (crossover size or None, where the
+# implementation is faster: above, below, always or never).
+def crossover(model, base_model, kind, sizes):
+    lo, hi = min(sizes), max(sizes)
+    grid = size_grid(kind, lo, hi)
+    diffs = [predict(model, kind, n, hi) - predict(base_model, kind, n, hi) for n in grid]
+    for i in range(1, len(grid)):
+        if (diffs[i - 1] < 0) != (diffs[i] < 0):
+            # Linear interpolation of the zero of the difference
+            n = grid[i - 1] + (grid[i] - grid[i - 1]) * diffs[i - 1] / (diffs[i - 1] - diffs[i])
+            return n, "above" if diffs[-1] < 0 else "below"
+    return None, "always" if diffs[-1] < 0 else "never"
+
+def format_size(n):
+    return str(int(round(n))) if n is not None else "-"
+
+# One row per implementation of every series: its fit, on how many sizes it
+# beat the baseline and the crossover size
+def process_results(results, growth, baseline):
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Impl", "Sizes", "Overhead(s)", "Exponent", "Fit Err(%)", "Wins",
+                     "Faster", "Crossover"]]
+    for key in sorted(results):
+        kind = growth[key][0]
+        series = results[key]
+        if baseline not in series:
+            continue
+        base_points = series[baseline]
+        base_model = fit(base_points, growth[key])
+        for impl in [baseline] + sorted(impl for impl in series if impl != baseline):
+            points = series[impl]
+            model = fit(points, growth[key])
+            row = list(key) + [impl, len(points)]
+            if model is None:
+                table_result.append(row + ["N/A", "N/A", "N/A", "", "", ""])
+                continue
+            row += [format(model[0], fp_format), format(model[2], '.2f'), format(model[3], '.2f')]
+            if impl == baseline:
+                table_result.append(row + ["", "", ""])
+                continue
+            common = [n for n in points if n in base_points]
+            wins = f"{sum(1 for n in common if points[n] < base_points[n])}/{len(common)}"
+            if base_model is None or len(common) < 2:
+                table_result.append(row + [wins, "N/A", "-"])
+                continue
+            size, faster = crossover(model, base_model, kind, common)
+            table_result.append(row + [wins, faster, format_size(size)])
+    return table_result
+
+def generate_table(table_results):
+    for row in table_results:
+        print(", ".join(str(col) for col in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the input size from which every implementation beats the baseline')
+    parser.add_argument("--ifile", required=True, help="lazybenchmark_results.csv of a --size_sweep run")
+    parser.add_argument("--baseline", default="OpenCilk+PBBS+2048+cg", help="Implementation compared against. Default: OpenCilk+PBBS+2048+cg")
+    parser.add_argument("--cores", default=None, type=int, help="Only the cells of this number of cores. Default: all")
+    parser.add_argument("--warmup", default="mser", choices=["mser", "none"], help="Rule to drop the warmup rounds. Default: mser")
+
+    flags = parser.parse_args()
+
+    results, growth = getseries(flags.ifile, flags.warmup, flags.cores)
+    generate_table(process_results(results, growth, getImplNameArg(flags.baseline)))
+
+# Main entry
+main()
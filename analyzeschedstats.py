@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Script to relate the scheduler counters (lazybenchmark_schedstats.csv) to speedup
+"""
+
+import argparse
+import csv
+from enum import IntEnum
+
+class SchedColName(IntEnum):
+    BENCHMARK = 0
+    DATASET = 1
+    NUM_CORES = 2
+    STATUS = 3
+    PARALLEL_FRAMEWORK = 4
+    TASK_SCHEDULER = 5
+    PFOR_MAXGRAINSIZE = 6
+    IGNORE_USERS_PFORGRAINSIZE = 7
+    TIME = 8
+    STATS = 9
+
+fp_format = '.2f'
+
+# Counters shown in the table, in order
+metrics = ["STEALS", "PROMOTED_TASKS", "WORK_REQUESTS", "REQUESTS_SERVED", "AVG_WORK_SIZE"]
+
+def to_float(val):
+    try:
+        return float(val)
+    except ValueError:
+        return -1
+
+# Read the csv result.  Returns results[benchname][dataset][impl][cores] = dict
+def getresult(input_file):
+    list_of_results = {}
+
+    with open(input_file) as myfile:
+        csvreader = csv.reader(myfile)
+        header = None
+        for row in csvreader:
+            if not row or row[int(SchedColName.BENCHMARK)] == "":
+                continue
+            if row[int(SchedColName.BENCHMARK)] == "BENCHMARK":
+                header = row
+                continue
+
+            cg = "cg"
+            if(row[int(SchedColName.IGNORE_USERS_PFORGRAINSIZE)] == "Yes"):
+                cg = "nocg"
+            impl = f"{row[int(SchedColName.PARALLEL_FRAMEWORK)]}+{row[int(SchedColName.TASK_SCHEDULER)]}+{row[int(SchedColName.PFOR_MAXGRAINSIZE)]}+{cg}"
+            benchname = row[int(SchedColName.BENCHMARK)].replace('/', '-')
+            dataset = row[int(SchedColName.DATASET)]
+            cores = int(row[int(SchedColName.NUM_CORES)])
+
+            cell = {"TIME": to_float(row[int(SchedColName.TIME)])}
+            for i in range(int(SchedColName.STATS), len(row)):
+                cell[header[i]] = to_float(row[i])
+
+            list_of_results.setdefault(benchname, {}).setdefault(dataset, {}).setdefault(impl, {})[cores] = cell
+
+    return list_of_results
+
+def pearson(xs, ys):
+    n = len(xs)
+    if n < 2:
+        return None
+    mx = sum(xs)/n
+    my = sum(ys)/n
+    sxy = sum((x-mx)*(y-my) for x, y in zip(xs, ys))
+    sxx = sum((x-mx)**2 for x in xs)
+    syy = sum((y-my)**2 for y in ys)
+    if sxx == 0 or syy == 0:
+        return None
+    return sxy / (sxx*syy) ** 0.5
+
+# Generate the table. Speedup is relative to the same implementation on the
+# smallest core count; steal rate is steals per second of run time.
+def process_results(list_of_results):
+    table_result = [["Benchmark", "Dataset", "Impl", "Num Cores", "Time(s)", "Speedup", "Steals/s"] + metrics]
+
+    correlation_samples = {}
+    for benchname in sorted(list_of_results):
+        for dataset in sorted(list_of_results[benchname]):
+            for impl in sorted(list_of_results[benchname][dataset]):
+                results = list_of_results[benchname][dataset][impl]
+                base_time = results[min(results)]["TIME"]
+                for cores in sorted(results):
+                    cell = results[cores]
+                    row = [benchname, dataset, impl, cores]
+                    if cell["TIME"] <= 0:
+                        row.extend(["N/A"] * (3 + len(metrics)))
+                        table_result.append(row)
+                        continue
+
+                    speedup = base_time/cell["TIME"] if base_time > 0 else -1
+                    steals = cell.get("STEALS", -1)
+                    steal_rate = steals/cell["TIME"] if steals >= 0 else -1
+                    row.append(format(cell["TIME"], fp_format))
+                    row.append(format(speedup, fp_format) if speedup > 0 else "N/A")
+                    row.append(format(steal_rate, fp_format) if steal_rate >= 0 else "N/A")
+                    for metric in metrics:
+                        val = cell.get(metric, -1)
+                        row.append(format(val, fp_format) if val >= 0 else "N/A")
+                    table_result.append(row)
+
+                    if speedup > 0 and steal_rate >= 0 and cores > 1:
+                        samples = correlation_samples.setdefault(impl, ([], []))
+                        samples[0].append(steal_rate)
+                        samples[1].append(speedup)
+
+    # Correlation between steal rate and speedup per implementation
+    summary = [["Impl", "Correlation(Steals/s, Speedup)"]]
+    for impl in sorted(correlation_samples):
+        r = pearson(*correlation_samples[impl])
+        summary.append([impl, format(r, fp_format) if r is not None else "N/A"])
+
+    return table_result, summary
+
+def generate_table(table_results, tex):
+    for i, row in enumerate(table_results):
+        if(tex):
+            if(i == 0):
+                print("\\toprule")
+            elif(i == 1):
+                print("\\midrule")
+            print(" & ".join(str(col) for col in row) + " \\\\ ")
+        else:
+            print(", ".join(str(col) for col in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='Relate scheduler statistics to speedup')
+    parser.add_argument("--ifile", required=True, help="lazybenchmark_schedstats.csv to analyze")
+    parser.add_argument("--tex", action='store_true', help="Generate in latex format. Default is csv")
+
+    flags = parser.parse_args()
+
+    results = getresult(flags.ifile)
+    table_results, summary = process_results(results)
+    generate_table(table_results, flags.tex)
+    print("")
+    generate_table(summary, flags.tex)
+
+# Main entry
+main()
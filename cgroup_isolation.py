@@ -0,0 +1,177 @@
+"""
+Contains helper code required to run every measured benchmark process in its
+own cgroup v2 leaf, with a cpuset of the cores it uses and an optional memory
+limit, while the harness and the rest of its work (verification, data set
+generation, compression) run in a low-priority background leaf.
+"""
+
+import os
+import threading
+
+controllers = ["cpuset", "cpu", "memory"]
+
+# Path of the cgroup v2 hierarchy, None if not mounted
+def find_root():
+    try:
+        with open("/proc/mounts") as ifile:
+            for line in ifile:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] == "cgroup2":
+                    return fields[1]
+    except OSError:
+        pass
+    return None
+
+def read_file(path):
+    try:
+        with open(path) as ifile:
+            return ifile.read().strip()
+    except OSError:
+        return ""
+
+def write_file(path, value):
+    with open(path, "w") as ofile:
+        ofile.write(value)
+
+# cgroup of the process in the v2 hierarchy, relative to the root
+def get_process_cgroup(pid="self"):
+    for line in read_file(f"/proc/{pid}/cgroup").splitlines():
+        if line.startswith("0::"):
+            return line[3:]
+    return "/"
+
+# Parses "key value" lines, e.g. cpu.stat
+def read_keyed(path):
+    values = {}
+    for line in read_file(path).splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[1].isdigit():
+            values[fields[0]] = int(fields[1])
+    return values
+
+# Total time in usec some task waited for a cpu, from cpu.pressure
+def read_pressure_total(path):
+    for line in read_file(path).splitlines():
+        if line.startswith("some "):
+            for field in line.split():
+                if field.startswith("total="):
+                    return int(field[len("total="):])
+    return None
+
+# List of cpus of a cpuset like "0-3,8,10-11"
+def parse_cpus(cpus):
+    result = []
+    for part in cpus.split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            result.extend(range(int(lo), int(hi) + 1))
+        elif part:
+            result.append(int(part))
+    return result
+
+def format_cpus(cpus):
+    return ",".join(str(cpu) for cpu in cpus)
+
+# The cgroup of the sweep (<root>/lazybenchmark_<pid>), with the background
+# leaf the harness moves into and a leaf for every measured run
+class Isolation(object):
+    def __init__(self, root=None, memory_limit=None):
+        self.root = root if root else find_root()
+        if self.root is None:
+            raise OSError("cgroup v2 is not mounted")
+        self.memory_limit = memory_limit
+        self.path = os.path.join(self.root, f"lazybenchmark_{os.getpid()}")
+        self.background = os.path.join(self.path, "background")
+        self.original = os.path.join(self.root, get_process_cgroup().lstrip("/"))
+        self.runs = 0
+        self.lock = threading.Lock()     # The runs of --smoke create their leaves in parallel
+        self.warnings = []
+
+        available = read_file(os.path.join(self.root, "cgroup.controllers")).split()
+        self.controllers = [controller for controller in controllers if controller in available]
+        for controller in controllers:
+            if controller not in self.controllers:
+                self.warnings.append(f"{controller} controller not available in {self.root}")
+
+        try:
+            self.create()
+        except OSError:
+            self.cleanup()
+            raise
+
+    # Create the cgroup of the sweep and its background leaf, and move the
+    # harness into it
+    def create(self):
+        os.mkdir(self.path)
+        subtree = " ".join("+" + controller for controller in self.controllers)
+        if subtree:
+            write_file(os.path.join(self.root, "cgroup.subtree_control"), subtree)
+            write_file(os.path.join(self.path, "cgroup.subtree_control"), subtree)
+        os.mkdir(self.background)
+        if "cpu" in self.controllers:
+            write_file(os.path.join(self.background, "cpu.weight"), "1")
+            if os.path.exists(os.path.join(self.background, "cpu.idle")):
+                write_file(os.path.join(self.background, "cpu.idle"), "1")
+
+        cpus = read_file(os.path.join(self.root, "cpuset.cpus.effective"))
+        self.cpus = parse_cpus(cpus) if cpus else sorted(os.sched_getaffinity(0))
+        self.mems = read_file(os.path.join(self.root, "cpuset.mems.effective"))
+
+        # Everything the harness starts is background work, unless moved
+        write_file(os.path.join(self.background, "cgroup.procs"), str(os.getpid()))
+
+    # Create the leaf of a run on num_cores cores, the first ones or cpus,
+    # returns its path
+    def create_run_leaf(self, num_cores, cpus=None):
+        with self.lock:
+            self.runs += 1
+            leaf = os.path.join(self.path, f"run_{self.runs}")
+        os.mkdir(leaf)
+        if "cpuset" in self.controllers:
+            if cpus is None:
+                cpus = self.cpus[:max(1, int(num_cores))]
+            write_file(os.path.join(leaf, "cpuset.cpus"), format_cpus(cpus))
+            if self.mems:
+                write_file(os.path.join(leaf, "cpuset.mems"), self.mems)
+        if "memory" in self.controllers and self.memory_limit is not None:
+            write_file(os.path.join(leaf, "memory.max"), str(int(self.memory_limit)))
+        return leaf
+
+    # Shell command that moves the shell running cmd, and so cmd, into the leaf
+    def prefix(self, leaf):
+        return f"echo $$ > {os.path.join(leaf, 'cgroup.procs')} && "
+
+    # cpu.stat, memory.peak and cpu pressure of the leaf
+    def read_stats(self, leaf):
+        cpu_stat = read_keyed(os.path.join(leaf, "cpu.stat"))
+        stats = {
+            "cpus": read_file(os.path.join(leaf, "cpuset.cpus")) or format_cpus(self.cpus),
+            "usage_usec": cpu_stat.get("usage_usec"),
+            "user_usec": cpu_stat.get("user_usec"),
+            "system_usec": cpu_stat.get("system_usec"),
+            "throttled_usec": cpu_stat.get("throttled_usec"),
+            "pressure_usec": read_pressure_total(os.path.join(leaf, "cpu.pressure")),
+            "memory_peak": None,
+            "oom_kill": read_keyed(os.path.join(leaf, "memory.events")).get("oom_kill"),
+        }
+        peak = read_file(os.path.join(leaf, "memory.peak"))
+        if peak.isdigit():
+            stats["memory_peak"] = int(peak)
+        return stats
+
+    def remove_leaf(self, leaf):
+        try:
+            os.rmdir(leaf)
+        except OSError:
+            pass
+
+    # Move the harness back and remove the cgroups of the sweep
+    def cleanup(self):
+        try:
+            write_file(os.path.join(self.original, "cgroup.procs"), str(os.getpid()))
+        except OSError:
+            pass
+        for name in sorted(os.listdir(self.path)) if os.path.isdir(self.path) else []:
+            if os.path.isdir(os.path.join(self.path, name)):
+                self.remove_leaf(os.path.join(self.path, name))
+        self.remove_leaf(self.path)
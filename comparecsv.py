@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Script to compare a new result csv file against a baseline one and fail
+when a cell regressed
+"""
+
+import argparse
+import sys
+
+from analyzecsv import getinvocations, getresult, split_invocations
+import steady_state
+
+fp_format = '.2f'
+
+# Returns cells[(benchmark, dataset, cores, impl)] = [times] of the
+# steady-state rounds that ran. The warmup rounds are dropped from every
+# invocation, like in lazybenchmark_stats.csv.
+def getcells(input_file, warmup):
+    set_of_impl, list_of_results, samples = getresult(input_file)
+    invocations = getinvocations(input_file)
+    cells = {}
+    for impl in list_of_results:
+        for benchname in list_of_results[impl]:
+            for dataset in list_of_results[impl][benchname]:
+                for num_cores, times in list_of_results[impl][benchname][dataset].items():
+                    rounds = split_invocations(times, invocations.get((benchname, dataset, num_cores)))
+                    steady, dropped = steady_state.steady_rounds([[t for t in chunk if t > 0] for chunk in rounds], warmup)
+                    cells[(benchname, dataset, num_cores, impl)] = steady
+    return cells
+
+def mean(values):
+    return sum(values)/len(values)
+
+# Two-sided p-value of the difference between the two samples, None if
+# there are not enough rounds to test
+def pvalue(base, new, test):
+    from scipy.stats import mannwhitneyu, ttest_ind
+    if len(base) < 2 or len(new) < 2:
+        return None
+    if len(set(base + new)) == 1:
+        return 1.0
+    if test == "welch":
+        return ttest_ind(base, new, equal_var=False).pvalue
+    return mannwhitneyu(base, new, alternative="two-sided").pvalue
+
+# Adjust the p-values {cell: p} for the number of cells tested
+def correct_pvalues(pvalues, correction):
+    cells = sorted(pvalues, key=lambda cell: pvalues[cell])
+    m = len(cells)
+    adjusted = {}
+    if correction == "holm":
+        running = 0.0
+        for i, cell in enumerate(cells):
+            running = max(running, min(1.0, (m - i) * pvalues[cell]))
+            adjusted[cell] = running
+    elif correction == "bh":
+        running = 1.0
+        for i in reversed(range(m)):
+            cell = cells[i]
+            running = min(running, pvalues[cell] * m / (i + 1))
+            adjusted[cell] = running
+    else:
+        adjusted = dict(pvalues)
+    return adjusted
+
+# Returns the rows [cell, base mean, new mean, change(%), p, adjusted p,
+# verdict] of every cell of the baseline
+def compare(base_cells, new_cells, threshold, alpha, test, correction):
+    pvalues = {}
+    for cell in base_cells:
+        if cell in new_cells and base_cells[cell] and new_cells[cell]:
+            p = pvalue(base_cells[cell], new_cells[cell], test)
+            if p is not None:
+                pvalues[cell] = p
+    adjusted = correct_pvalues(pvalues, correction)
+
+    rows = []
+    for cell in sorted(base_cells):
+        base = base_cells[cell]
+        if not base:
+            continue
+        new = new_cells.get(cell)
+        if new is None:
+            rows.append([cell, mean(base), None, None, None, None, "MISSING"])
+            continue
+        if not new:
+            rows.append([cell, mean(base), None, None, None, None, "FAILED"])
+            continue
+
+        change = (mean(new) - mean(base)) / mean(base) * 100
+        verdict = ""
+        if cell in adjusted and adjusted[cell] < alpha:
+            if change > threshold:
+                verdict = "REGRESSION"
+            elif change < -threshold:
+                verdict = "IMPROVEMENT"
+        rows.append([cell, mean(base), mean(new), change, pvalues.get(cell), adjusted.get(cell), verdict])
+    return rows
+
+def format_val(val, fmt=fp_format):
+    return "N/A" if val is None else format(val, fmt)
+
+def print_rows(title, rows):
+    print(title)
+    print("Benchmark, Dataset, Num Cores, Impl, Baseline(s), New(s), Change(%), p, Adjusted p, Verdict")
+    for cell, base, new, change, p, adj, verdict in rows:
+        print(", ".join([str(val) for val in cell] + [format_val(base, '.4f'), format_val(new, '.4f'),
+                                                      format_val(change), format_val(p, '.4f'), format_val(adj, '.4f'), verdict]))
+    print("")
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare a result csv file against a baseline')
+    parser.add_argument("--baseline", required=True, help="lazybenchmark_results.csv of the baseline")
+    parser.add_argument("--new", required=True, help="lazybenchmark_results.csv to check")
+    parser.add_argument("--threshold", default=5.0, type=float, help="Slowdown in percent of the mean that counts as a regression. Default: 5")
+    parser.add_argument("--alpha", default=0.05, type=float, help="Significance level after correction. Default: 0.05")
+    parser.add_argument("--test", default="welch", choices=["welch", "mannwhitney"],
+                        help="Per-cell test of the rounds. welch: Welch t-test, mannwhitney: Mann-Whitney U, which needs more rounds to survive the correction. Default: welch")
+    parser.add_argument("--correction", default="holm", choices=["holm", "bh", "none"],
+                        help="Multiple-comparison correction. holm: Holm-Bonferroni, bh: Benjamini-Hochberg. Default: holm")
+    parser.add_argument("--warmup", default="mser", choices=["mser", "none"],
+                        help="Rule to drop the warmup rounds before testing. mser: MSER truncation, none: keep every round. Default: mser")
+    parser.add_argument("--all", action='store_true', help="Also print the cells without a significant change")
+
+    flags = parser.parse_args()
+
+    rows = compare(getcells(flags.baseline, flags.warmup), getcells(flags.new, flags.warmup), flags.threshold, flags.alpha, flags.test, flags.correction)
+
+    # Failed cells first, then the largest slowdowns
+    regressions = [row for row in rows if row[6] in ["FAILED", "MISSING"]]
+    regressions += sorted([row for row in rows if row[6] == "REGRESSION"], key=lambda row: -row[3])
+    improvements = sorted([row for row in rows if row[6] == "IMPROVEMENT"], key=lambda row: row[3])
+
+    print_rows("Regressions", regressions)
+    print_rows("Improvements", improvements)
+    if flags.all:
+        print_rows("Unchanged", [row for row in rows if row[6] == ""])
+
+    tested = len([row for row in rows if row[4] is not None])
+    print(f"{len(rows)} cells, {tested} tested, {len(regressions)} regressed, {len(improvements)} improved")
+    if regressions:
+        sys.exit(1)
+
+# Main entry
+if __name__ == "__main__":
+    main()
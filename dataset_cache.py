@@ -0,0 +1,134 @@
+"""
+Contains helper code required to convert the text inputs of the pbbs_v2
+benchmarks once into the binary format of the suite and to cache the
+converted files next to the text originals.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+
+cache_dir_name = ".binary"
+
+# Header of the text input -> (converter built in the data directory, option
+# of the benchmark binaries that read the converted file)
+converters = {"AdjacencyGraph": ("adjToBinary", "-b")}
+
+convert_timeout = 30 * 60 # In seconds.
+
+# Binary path -> does its usage list the option
+accepted_options = {}
+
+def cache_path(data_path):
+    data_dir, name = os.path.split(data_path)
+    return os.path.join(data_dir, cache_dir_name, name + ".bin")
+
+def meta_path(data_path):
+    return cache_path(data_path) + ".json"
+
+def read_header(data_path):
+    with open(data_path, "rb") as ifile:
+        return ifile.readline(256).decode("utf-8", "replace").strip()
+
+def file_checksum(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as ifile:
+        for block in iter(lambda: ifile.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def source_id(data_path):
+    st = os.stat(data_path)
+    return st.st_size, st.st_mtime_ns
+
+# Returns the path of the converted input if it is up to date, else None.
+# The checksum of the text file is only recomputed when its size or mtime
+# changed since the conversion, e.g. after the data set was regenerated.
+def lookup(data_path):
+    bin_path = cache_path(data_path)
+    if not os.path.isfile(bin_path) or not os.path.isfile(meta_path(data_path)):
+        return None
+    with open(meta_path(data_path)) as ifile:
+        meta = json.load(ifile)
+    size, mtime_ns = source_id(data_path)
+    if [size, mtime_ns] == [meta["size"], meta["mtime_ns"]]:
+        return bin_path
+    if size != meta["size"] or file_checksum(data_path) != meta["sha256"]:
+        return None
+    meta["mtime_ns"] = mtime_ns
+    write_meta(data_path, meta)
+    return bin_path
+
+def write_meta(data_path, meta):
+    with open(meta_path(data_path) + ".tmp", "w") as ofile:
+        json.dump(meta, ofile, indent=1)
+    os.replace(meta_path(data_path) + ".tmp", meta_path(data_path))
+
+def remove_tmp(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Convert the text input with the converter of the data directory, building
+# it if needed. Returns the path of the converted input and an error message,
+# the path is None if it could not be converted or timed out: the run then
+# reads the text input.
+def convert(data_path, data_dir):
+    if lookup(data_path):
+        return cache_path(data_path), ""
+    header = read_header(data_path).split(" ")[0]
+    if header not in converters:
+        return None, f"No binary format for {header}"
+    converter = converters[header][0]
+
+    if not os.path.isfile(os.path.join(data_dir, converter)):
+        try:
+            p_process = subprocess.run(["make", converter], cwd=data_dir, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, timeout=convert_timeout)
+        except subprocess.TimeoutExpired:
+            return None, f"Building {converter} timed out after {convert_timeout} seconds"
+        if p_process.returncode:
+            return None, f"Could not build {converter}"
+
+    size, mtime_ns = source_id(data_path)
+    checksum = file_checksum(data_path)
+    bin_path = cache_path(data_path)
+    os.makedirs(os.path.dirname(bin_path), exist_ok=True)
+    try:
+        p_process = subprocess.run([os.path.abspath(os.path.join(data_dir, converter)), os.path.abspath(data_path), bin_path + ".tmp"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=convert_timeout)
+    except subprocess.TimeoutExpired:
+        remove_tmp(bin_path + ".tmp")
+        return None, f"{converter} timed out after {convert_timeout} seconds"
+    if p_process.returncode or not os.path.isfile(bin_path + ".tmp"):
+        remove_tmp(bin_path + ".tmp")
+        return None, f"{converter} failed: " + p_process.stdout.decode("utf-8", "replace").strip()[-200:]
+    os.replace(bin_path + ".tmp", bin_path)
+    write_meta(data_path, {"source": os.path.basename(data_path), "size": size, "mtime_ns": mtime_ns,
+                           "sha256": checksum, "converter": converter, "option": converters[header][1]})
+    return bin_path, ""
+
+# Returns the converted input and the option of the benchmark binaries to
+# read it, None if the input was not converted or changed since.
+def binary_input(data_path):
+    bin_path = lookup(data_path)
+    if bin_path is None:
+        return None
+    with open(meta_path(data_path)) as ifile:
+        return bin_path, json.load(ifile)["option"]
+
+# Does the benchmark binary list the option in its usage? The pbbs binaries
+# print their usage, e.g. "[-o <outFile>] [-r <rounds>] [-b] <inFile>", when
+# run without an input.
+def accepts_option(binary_path, option):
+    key = (os.path.abspath(binary_path), option)
+    if key not in accepted_options:
+        try:
+            p_process = subprocess.run([os.path.abspath(binary_path)], stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, timeout=10)
+            accepted_options[key] = f"[{option}]" in p_process.stdout.decode("utf-8", "replace")
+        except (OSError, subprocess.TimeoutExpired):
+            accepted_options[key] = False
+    return accepted_options[key]
@@ -0,0 +1,149 @@
+"""
+Contains helper code required to stage the data sets of the benchmarks in
+memory (tmpfs) before their runs, to prewarm them and to measure how much of
+a file is in the page cache.
+"""
+
+import atexit
+import collections
+import ctypes
+import ctypes.util
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+
+# Parses a size like "16G", "512M", "100K" or "4096" into bytes
+def parse_size(size):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    size = size.strip().upper().rstrip("B")
+    try:
+        if size and size[-1] in units:
+            return float(size[:-1]) * units[size[-1]]
+        return float(size)
+    except ValueError:
+        raise ValueError(f"{size} is not a valid size")
+
+def format_size(size):
+    for unit, scale in [("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)]:
+        if size >= scale:
+            return f"{size / scale:.1f}{unit}"
+    return f"{size:.0f}"
+
+# Read the file ahead and touch every page so that the first run does not pay
+# for the I/O
+def prewarm(path):
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as ifile:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(ifile.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+        with mmap.mmap(ifile.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            for offset in range(0, size, mmap.PAGESIZE):
+                mm[offset]
+
+libc = None
+
+def get_libc():
+    global libc
+    if libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+    return libc
+
+# Percentage of the pages of the file in memory (mincore), None if it cannot
+# be measured
+def residency(path):
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return 100.0
+        c = get_libc()
+        fd = os.open(path, os.O_RDONLY)
+    except (OSError, AttributeError):
+        return None
+    try:
+        addr = c.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            return None
+        try:
+            pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+            vec = (ctypes.c_ubyte * pages)()
+            if c.mincore(addr, size, vec) != 0:
+                return None
+            return sum(page & 1 for page in vec) * 100.0 / pages
+        finally:
+            c.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+# Copies of the data sets in a directory of stage_root (e.g. /dev/shm), at
+# most budget bytes. The least recently used data sets are evicted first.
+# The directory is removed by cleanup(), or at exit if the sweep did not get
+# to it.
+class Stager(object):
+    def __init__(self, stage_root, budget=None):
+        self.stage_dir = tempfile.mkdtemp(prefix="lazybenchmark_stage_", dir=stage_root)
+        if budget is None:
+            st = os.statvfs(self.stage_dir)
+            budget = st.f_bavail * st.f_frsize / 2
+        self.budget = budget
+        # real path of the data set -> (staged path, size, mtime), least recently used first
+        self.staged = collections.OrderedDict()
+        self.used = 0
+        self.lock = threading.Lock()
+        atexit.register(self.cleanup)
+
+    # Returns the staged copy of the file, None if it does not fit
+    def stage(self, path):
+        with self.lock:
+            return self.stage_locked(path)
+
+    def stage_locked(self, path):
+        key = os.path.realpath(path)
+        st = os.stat(key)
+        if key in self.staged:
+            staged_path, size, mtime_ns = self.staged[key]
+            if (size, mtime_ns) == (st.st_size, st.st_mtime_ns):
+                self.staged.move_to_end(key)
+                return staged_path
+            self.evict(key)
+
+        if st.st_size > self.budget:
+            return None
+        while self.used + st.st_size > self.budget:
+            self.evict(next(iter(self.staged)))
+
+        name = hashlib.sha1(key.encode()).hexdigest()[:12] + "_" + os.path.basename(key)
+        staged_path = os.path.join(self.stage_dir, name)
+        try:
+            shutil.copyfile(key, staged_path)
+        except OSError:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+            return None
+        prewarm(staged_path)
+        self.staged[key] = (staged_path, st.st_size, st.st_mtime_ns)
+        self.used += st.st_size
+        return staged_path
+
+    def evict(self, key):
+        staged_path, size, mtime_ns = self.staged.pop(key)
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        self.used -= size
+
+    def is_staged(self, path):
+        return os.path.dirname(path) == self.stage_dir
+
+    def cleanup(self):
+        atexit.unregister(self.cleanup)
+        shutil.rmtree(self.stage_dir, ignore_errors=True)
+        self.staged.clear()
+        self.used = 0
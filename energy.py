@@ -0,0 +1,108 @@
+"""
+Contains helper code required to measure the energy of a run with the Linux
+powercap interface: the package and DRAM domains of the RAPL zones in
+sys/class/powercap/intel-rapl*.  Every path is relative to root so a fake
+sysfs tree can be used.
+
+The energy_uj counter of a domain wraps around at max_energy_range_uj, after
+a few minutes to an hour under load, so the meter reads it every interval
+seconds during the run and adds up the increments, counting a decrease as
+one wraparound.
+"""
+
+import glob
+import os
+import threading
+import time
+
+powercap_dir = "sys/class/powercap"
+
+# Kinds of the domains that are measured.  core and uncore are part of the
+# package and psys includes it, they are not added.
+domain_kinds = ["package", "dram"]
+
+def read_file(path):
+    try:
+        with open(path) as ifile:
+            return ifile.read().strip()
+    except OSError:
+        return None
+
+# Value of a counter, None if it cannot be read
+def read_int(path):
+    value = read_file(path)
+    if value is None or not value.isdigit():
+        return None
+    return int(value)
+
+# Returns the measured domains {label: (path of energy_uj, max_energy_range_uj)},
+# the label being the kind and the package, e.g. package-0 or dram-1.  Empty
+# without powercap or when the counters are not readable (root only since
+# Linux 5.10).  The zones of the MMIO interface repeat those of the MSRs and
+# are skipped.
+def find_domains(root="/"):
+    domains = {}
+    for path in sorted(glob.glob(os.path.join(root, powercap_dir, "intel-rapl:*"))):
+        name = read_file(os.path.join(path, "name"))
+        if name is None or name.split("-")[0] not in domain_kinds:
+            continue
+        package = os.path.basename(path).split(":")[1]
+        energy_path = os.path.join(path, "energy_uj")
+        max_range = read_int(os.path.join(path, "max_energy_range_uj"))
+        if read_int(energy_path) is None or max_range is None:
+            continue
+        domains[f"{name.split('-')[0]}-{package}"] = (energy_path, max_range)
+    return domains
+
+# Increment of a counter from before to after, which wrapped around once if it
+# decreased
+def delta(before, after, max_range):
+    if after < before:
+        return after + max_range + 1 - before
+    return after - before
+
+# Reads the counters of the domains until stopped
+class EnergyMeter(threading.Thread):
+    def __init__(self, domains, interval=1.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.domains = domains
+        self.interval = interval
+        self.energy = {label: 0 for label in domains}   # uJ
+        self.last = {}
+        self.start_time = None
+        self.stop_event = threading.Event()
+
+    def read(self):
+        for label, (path, max_range) in self.domains.items():
+            value = read_int(path)
+            if value is None:
+                continue
+            if label in self.last:
+                self.energy[label] += delta(self.last[label], value, max_range)
+            self.last[label] = value
+
+    def start(self):
+        self.read()
+        self.start_time = time.time()
+        threading.Thread.start(self)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.read()
+
+    # Stops the meter. Returns the energy of every domain in joules and the
+    # seconds it ran.
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.read()
+        return {label: uj / 1e6 for label, uj in self.energy.items()}, time.time() - self.start_time
+
+# Energy of the packages and of the DRAM in joules, None when no domain of
+# that kind was measured
+def split_kinds(joules):
+    totals = {}
+    for kind in domain_kinds:
+        values = [value for label, value in joules.items() if label.startswith(kind + "-")]
+        totals[kind] = sum(values) if values else None
+    return totals
@@ -0,0 +1,37 @@
+"""
+Importable interface of the harness: plan, build and run a sweep described by
+LazyBenchmarkOptions, and analyze its results.
+
+    from lazybenchmark import LazyBenchmarkOptions, parse_csv, run, analyze
+    options = LazyBenchmarkOptions(benchmarks_to_run=parse_csv("lazybenchmark.csv"), num_cores=["1", "8"])
+    result = run(options)
+    table = analyze(result.results_file)
+
+A sweep spec (see sweep_spec) replaces the benchmarks and the matrix:
+
+    options = LazyBenchmarkOptions()
+    apply_spec(options, load_spec("sweep.toml"))
+"""
+
+from testBenchmark_compile import (LazyBenchmarkOptions, SweepResult, SweepError, CilkLowering, parse_csv,
+                                   check_options, apply_spec, plan, build, run)
+
+__all__ = ["LazyBenchmarkOptions", "SweepResult", "SweepError", "CilkLowering", "parse_csv", "check_options",
+           "apply_spec", "plan", "build", "run", "load_spec", "analyze", "generate_table"]
+
+# load_spec, analyze and generate_table, imported on first use so that
+# importing the interface does not load the spec parser and analyzecsv. The
+# imports under TYPE_CHECKING only name them for type checkers and linters.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from sweep_spec import load as load_spec
+    from analyzecsv import analyze, generate_table
+
+def __getattr__(name):
+    if name == "load_spec":
+        from sweep_spec import load as load_spec
+        return load_spec
+    if name in ("analyze", "generate_table"):
+        import analyzecsv
+        return getattr(analyzecsv, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
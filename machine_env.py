@@ -0,0 +1,184 @@
+"""
+Contains helper code required to fingerprint the machine state (cpufreq,
+turbo, throttling, SMT, THP, kernel, compiler and runtime) before and during
+a run.  Every path is relative to root so a fake sysfs tree can be used.
+"""
+
+import glob
+import json
+import os
+import subprocess
+import threading
+
+# Fields of the fingerprint that are compared against a pinned profile
+profile_fields = ["governor", "turbo", "smt", "thp", "kernel", "compiler", "runtime"]
+
+def read_file(root, path):
+    try:
+        with open(os.path.join(root, path.lstrip("/"))) as ifile:
+            return ifile.read().strip()
+    except OSError:
+        return None
+
+def get_cpus(root):
+    cpus = []
+    for path in glob.glob(os.path.join(root, "sys/devices/system/cpu/cpu[0-9]*")):
+        cpus.append(int(os.path.basename(path)[3:]))
+    return sorted(cpus)
+
+# Governors in use, e.g. "performance" or "performance,powersave"
+def get_governor(root):
+    governors = set()
+    for cpu in get_cpus(root):
+        governor = read_file(root, f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_governor")
+        if governor:
+            governors.add(governor)
+    return ",".join(sorted(governors)) if governors else "unknown"
+
+# Current frequency of every cpu in kHz
+def get_cur_freqs(root):
+    freqs = []
+    for cpu in get_cpus(root):
+        freq = read_file(root, f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq")
+        if freq and freq.isnumeric():
+            freqs.append(int(freq))
+    return freqs
+
+def get_turbo(root):
+    no_turbo = read_file(root, "/sys/devices/system/cpu/intel_pstate/no_turbo")
+    if no_turbo is not None:
+        return "off" if no_turbo == "1" else "on"
+    boost = read_file(root, "/sys/devices/system/cpu/cpufreq/boost")
+    if boost is not None:
+        return "on" if boost == "1" else "off"
+    return "unknown"
+
+def get_smt(root):
+    control = read_file(root, "/sys/devices/system/cpu/smt/control")
+    return control if control else "unknown"
+
+# Selected mode of "always [madvise] never"
+def get_thp(root):
+    enabled = read_file(root, "/sys/kernel/mm/transparent_hugepage/enabled")
+    if enabled and "[" in enabled:
+        return enabled[enabled.index("[")+1:enabled.index("]")]
+    return "unknown"
+
+# Sum of the core and package throttle counters, None if not exposed
+def get_throttle_count(root):
+    total = None
+    for cpu in get_cpus(root):
+        for counter in ["core_throttle_count", "package_throttle_count"]:
+            count = read_file(root, f"/sys/devices/system/cpu/cpu{cpu}/thermal_throttle/{counter}")
+            if count and count.isnumeric():
+                total = (total or 0) + int(count)
+    return total
+
+def get_kernel(root):
+    import platform
+
+    kernel = read_file(root, "/proc/sys/kernel/osrelease")
+    return kernel if kernel else platform.release()
+
+# First line of `clang --version`, which contains the hash of the compiler
+def get_compiler(compiler="clang"):
+    try:
+        p_process = subprocess.run([compiler, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        lines = p_process.stdout.decode("utf-8", "replace").splitlines()
+        return lines[0] if lines else "unknown"
+    except OSError:
+        return "unknown"
+
+# Short sha256 of the runtime libraries, "name:hash,..."
+def get_runtime(runtime_globs):
+    import hashlib
+
+    hashes = []
+    for pattern in runtime_globs:
+        for path in sorted(glob.glob(pattern)):
+            if not os.path.isfile(path):
+                continue
+            sha = hashlib.sha256()
+            with open(path, "rb") as ifile:
+                for chunk in iter(lambda: ifile.read(1 << 20), b""):
+                    sha.update(chunk)
+            hashes.append(f"{os.path.basename(path)}:{sha.hexdigest()[:12]}")
+    return ",".join(hashes) if hashes else "unknown"
+
+# Libraries linked into the benchmarks: the OpenCilk runtime and LazyD's
+# unwind scheduler (found through LIBRARY_PATH).
+def get_runtime_globs():
+    runtime_globs = ["../opencilk/cheetah/build/lib/*/libopencilk*"]
+    for path in os.environ.get("LIBRARY_PATH", "").split(":"):
+        if path:
+            runtime_globs.append(os.path.join(path, "libunwind_scheduler.a"))
+    return runtime_globs
+
+# State of the machine that should not change during a sweep
+def get_fingerprint(root="/"):
+    freqs = get_cur_freqs(root)
+    return {
+        "governor": get_governor(root),
+        "turbo": get_turbo(root),
+        "smt": get_smt(root),
+        "thp": get_thp(root),
+        "kernel": get_kernel(root),
+        "compiler": get_compiler(),
+        "runtime": get_runtime(get_runtime_globs()),
+        "num_cpus": len(get_cpus(root)),
+        "cur_freq_khz": sum(freqs)//len(freqs) if freqs else None,
+        "throttle_count": get_throttle_count(root),
+    }
+
+# Cheap part of the fingerprint that is sampled before every run
+def get_run_state(root="/"):
+    return {
+        "governor": get_governor(root),
+        "turbo": get_turbo(root),
+        "smt": get_smt(root),
+        "thp": get_thp(root),
+        "throttle_count": get_throttle_count(root),
+    }
+
+def save_profile(fingerprint, path):
+    with open(path, "w") as ofile:
+        json.dump({field: fingerprint[field] for field in profile_fields}, ofile, indent=2)
+
+def load_profile(path):
+    with open(path) as ifile:
+        return json.load(ifile)
+
+# Returns a list of "field: expected X, found Y" for every field of the pinned
+# profile that the state deviates from.
+def check_profile(state, profile):
+    deviations = []
+    for field, expected in profile.items():
+        if field in state and str(state[field]) != str(expected):
+            deviations.append(f"{field}: expected {expected}, found {state[field]}")
+    return deviations
+
+# Samples the mean frequency of the cpus every interval seconds while a run
+# is in progress.
+class FreqSampler(threading.Thread):
+    def __init__(self, root="/", interval=0.5):
+        threading.Thread.__init__(self, daemon=True)
+        self.root = root
+        self.interval = interval
+        self.samples = []
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            freqs = get_cur_freqs(self.root)
+            if freqs:
+                self.samples.append(sum(freqs)/len(freqs))
+            if self.stop_event.wait(self.interval):
+                break
+
+    # Stops the sampler. Returns the min, mean and max frequency in MHz.
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        if not self.samples:
+            return None, None, None
+        return (min(self.samples)/1000, sum(self.samples)/len(self.samples)/1000, max(self.samples)/1000)
@@ -0,0 +1,115 @@
+"""
+Contains helper code required to turn `perf record` profiles into folded
+stacks and to classify the sampled functions.
+"""
+
+import gzip
+import os
+import shutil
+import subprocess
+
+# Symbols that belong to the OpenCilk (cheetah) or LazyD (unwind scheduler)
+# runtime.  Matched as prefixes of the function name.
+runtime_prefixes = ["__cilkrts", "cilkrts", "__cilk_", "cilk_", "Cilk_", "Closure_", "worker_",
+                    "steal", "do_what_it_says", "promote_", "setup_for_execution", "unconditional_steal",
+                    "push_workctx", "pop_workctx", "resume2scheduler", "suspend2scheduler",
+                    "sync_work", "runparallel", "prepare_work", "finish_working", "resuming_ready_task",
+                    "synchronize_children", "allocate_more_stacklets", "get_stacklet", "deallocate_",
+                    "unwind_", "postunwind", "preunwind", "recv_request", "clear_pending_request",
+                    "request_", "handle_failed_steal_attempts", "fiber", "sched_yield", "__sched_yield"]
+
+# Symbols of the polling checks of LazyD.  Polling checks inlined into the
+# user code are attributed to the user function.
+polling_substrings = ["poll", "Poll", "POLL", "uli_", "_uli", "ULI"]
+
+# Folded stack frames of the OS kernel are annotated with this suffix.
+kernel_annotation = "_[k]"
+
+# Returns runtime, polling, kernel or user for a function of a folded stack.
+def classify_symbol(symbol):
+    if symbol.endswith(kernel_annotation):
+        return "kernel"
+    for substring in polling_substrings:
+        if substring in symbol:
+            return "polling"
+    for prefix in runtime_prefixes:
+        if symbol.startswith(prefix):
+            return "runtime"
+    return "user"
+
+# Converts one frame line of `perf script` ("addr sym+off (dso)") to its name.
+def parse_frame(line):
+    fields = line.strip().split(None, 1)
+    if len(fields) < 2:
+        return None
+    rest = fields[1]
+    dso = ""
+    if rest.endswith(")") and " (" in rest:
+        rest, dso = rest.rsplit(" (", 1)
+        dso = dso[:-1]
+    symbol = rest
+    if "+0x" in symbol:
+        symbol = symbol[:symbol.rindex("+0x")]
+    if symbol in ["[unknown]", ""]:
+        symbol = f"[{os.path.basename(dso)}]" if dso else "[unknown]"
+    if "kernel.kallsyms" in dso or dso.startswith("[kernel"):
+        symbol = symbol + kernel_annotation
+    return symbol.replace(";", ":").replace(" ", "_")
+
+# Folds the output of `perf script` into {"root;...;leaf": samples}.
+def fold_perf_script(text):
+    folded = {}
+    frames = []
+    in_sample = False
+    for line in text.splitlines() + [""]:
+        if not line.strip():
+            if in_sample and frames:
+                stack = ";".join(reversed(frames))
+                folded[stack] = folded.get(stack, 0) + 1
+            frames = []
+            in_sample = False
+        elif line[0] in " \t":
+            frame = parse_frame(line)
+            if frame is not None:
+                frames.append(frame)
+        else:
+            # Header line of a sample: "comm pid [cpu] time: period event:"
+            in_sample = True
+    return folded
+
+def write_folded(folded, path):
+    with open(path, "w") as ofile:
+        for stack in sorted(folded, key=lambda k: -folded[k]):
+            ofile.write(f"{stack} {folded[stack]}\n")
+
+def read_folded(path):
+    folded = {}
+    with open(path) as ifile:
+        for line in ifile:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            stack, count = line.rsplit(" ", 1)
+            folded[stack] = folded.get(stack, 0) + int(count)
+    return folded
+
+# Returns the samples in which each function is the leaf (self samples).
+def self_samples(folded):
+    samples = {}
+    for stack, count in folded.items():
+        leaf = stack.rsplit(";", 1)[-1]
+        samples[leaf] = samples.get(leaf, 0) + count
+    return samples
+
+# Runs `perf script` on perf_data, writes the folded stacks to folded_path and
+# replaces perf_data with a gzip compressed copy.  Returns the folded stacks.
+def fold_and_compress(perf_data, folded_path):
+    p_process = subprocess.run(["perf", "script", "-i", perf_data],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    folded = fold_perf_script(p_process.stdout.decode("utf-8", "replace"))
+    write_folded(folded, folded_path)
+
+    with open(perf_data, "rb") as ifile, gzip.open(perf_data + ".gz", "wb") as ofile:
+        shutil.copyfileobj(ifile, ofile)
+    os.remove(perf_data)
+    return folded
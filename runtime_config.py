@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Contains helper code required to run the benchmarks with another memory
+allocator (LD_PRELOAD) and transparent huge page (THP) mode.
+
+Run as a script, it disables THP for a command and its children:
+    ./runtime_config.py --thp_disable <command> [args]
+"""
+
+import glob
+import os
+import sys
+
+import machine_env
+
+default_allocator = "glibc"
+
+# Libraries preloaded for each allocator, the first one found is used
+allocator_libs = {
+    "jemalloc": ["libjemalloc.so*"],
+    "tcmalloc": ["libtcmalloc.so*", "libtcmalloc_minimal.so*"],
+    "mimalloc": ["libmimalloc.so*"],
+}
+
+lib_dirs = ["/usr/lib/x86_64-linux-gnu", "/usr/lib64", "/usr/lib", "/usr/local/lib", "/usr/local/lib64"]
+
+allocators = [default_allocator] + list(allocator_libs)
+
+thp_modes = ["always", "madvise", "never"]
+
+thp_file = "/sys/kernel/mm/transparent_hugepage/enabled"
+
+PR_SET_THP_DISABLE = 41
+
+# Path of the library of the allocator, "" for glibc and None if not found
+def find_allocator(name):
+    if name == default_allocator:
+        return ""
+    for pattern in allocator_libs[name]:
+        for lib_dir in lib_dirs:
+            libs = sorted(glob.glob(os.path.join(lib_dir, pattern)))
+            if libs:
+                return libs[0]
+    return None
+
+# Allocators found on the system
+def find_allocators():
+    return [name for name in allocators if find_allocator(name) is not None]
+
+# The allocators of --allocator, "all" stands for every allocator found.
+# Raises ValueError for an allocator that is not installed.
+def resolve_allocators(names):
+    resolved = []
+    for name in names:
+        for allocator in (find_allocators() if name == "all" else [name]):
+            if find_allocator(allocator) is None:
+                raise ValueError(f"{allocator} not found in {', '.join(lib_dirs)}")
+            if allocator not in resolved:
+                resolved.append(allocator)
+    return resolved
+
+# How the THP mode is applied: "" if the system is already in this mode,
+# "sysfs" if the system mode can be changed, "prctl" to disable THP for the
+# run only, None if the mode cannot be set
+def thp_method(mode):
+    if machine_env.get_thp("/") == mode:
+        return ""
+    if os.access(thp_file, os.W_OK):
+        return "sysfs"
+    if mode == "never":
+        return "prctl"
+    return None
+
+# Raises ValueError for a THP mode that cannot be set
+def check_thp_modes(modes):
+    for mode in modes:
+        if mode is not None and thp_method(mode) is None:
+            raise ValueError(f"THP mode {mode} cannot be set: {thp_file} is not writable and the system is in {machine_env.get_thp('/')}")
+
+def set_system_thp(mode):
+    with open(thp_file, "w") as ofile:
+        ofile.write(mode)
+
+# Environment variables and wrapper put before the command of a run, and the
+# THP mode to set system-wide before the run (None to leave it). A run in the
+# system mode (thp None) gets back original, the mode of the system before the
+# sweep changed it.
+def get_run_prefix(allocator, thp, original=None):
+    env = ""
+    if allocator and allocator != default_allocator:
+        env = f"LD_PRELOAD={find_allocator(allocator)}"
+    wrapper = ""
+    system_thp = None
+    if thp is None and original is not None and thp_method(original) == "sysfs":
+        system_thp = original
+    elif thp is not None:
+        method = thp_method(thp)
+        if method == "sysfs":
+            system_thp = thp
+        elif method == "prctl":
+            wrapper = f"{sys.executable} {os.path.abspath(__file__)} --thp_disable"
+    return env, wrapper, system_thp
+
+def main():
+    import ctypes
+
+    if len(sys.argv) < 3 or sys.argv[1] != "--thp_disable":
+        sys.exit(__doc__)
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_THP_DISABLE, 1, 0, 0, 0) != 0:
+        sys.exit(f"prctl(PR_SET_THP_DISABLE) failed: {os.strerror(ctypes.get_errno())}")
+    os.execvp(sys.argv[2], sys.argv[2:])
+
+# Main entry
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Contains helper code required to calibrate the machine during a sweep: a
+short fixed workload (the sentinel) run on the cores of the next cell every
+few units, the drift of its time from the baseline of the sweep, and the
+noise factor of the units run between two sentinels.
+
+The sentinel is the serial build of a cilk5 kernel on a reduced input, so
+that its time follows the speed of the cores (thermal state, neighbours,
+background daemons) and not the scheduler being measured. The units run
+between two sentinels form a window. Its noise factor is the mean ratio of
+the two sentinels to the baseline, and its units are run again at the end
+of the sweep when either sentinel drifted by more than the threshold.
+"""
+
+import statistics
+
+from parse_lazybenchmark_csv import Benchmark
+
+# cilk5 kernels usable as sentinel, with a reduced input of a few tens of
+# milliseconds
+workloads = {"fib": "32 ", "matmul": "-n 512  -r "}
+
+# Suffix of the serial build of a cilk5 kernel (see makeExeSuffix)
+serial_suffix = "pnns"
+
+# Rounds of every sentinel run, its time is their median
+rounds = 3
+
+# Number of the first sentinels of a core count whose median is its baseline
+baseline_runs = 3
+
+# The benchmark of the sentinel workload
+def make_benchmark(workload):
+    data_set = workloads[workload]
+    return Benchmark("cilk5", workload, workload, "", workload, [data_set], [data_set])
+
+class Calibration(object):
+    def __init__(self, every, threshold, max_requeues):
+        self.every = every                  # Units between two sentinels
+        self.threshold = threshold          # Drift in % from which the units of a window are run again
+        self.max_requeues = max_requeues    # Times a unit is run again at most
+        self.times = {}                     # num_cores -> time of its sentinels
+        self.num_cores = None               # Cores of the last sentinel
+        self.opening = None                 # Ratio to the baseline of the sentinel opening the window, None before the first one
+        self.window = []                    # (key, rerun, results rows) of the units run since
+        self.rows = []                      # Results rows of the unit being run
+        self.requeued = []                  # rerun of the units to run again
+        self.requeues = {}                  # key -> times the unit was run again
+
+    # Is a sentinel due before the next unit?
+    def due(self):
+        return self.opening is None or len(self.window) >= self.every
+
+    def baseline(self, num_cores):
+        return statistics.median(self.times[num_cores][:baseline_runs])
+
+    # Record the time of a sentinel on num_cores. Returns its ratio to the
+    # baseline of num_cores.
+    def record(self, num_cores, seconds):
+        self.times.setdefault(num_cores, []).append(seconds)
+        self.num_cores = num_cores
+        return seconds / self.baseline(num_cores)
+
+    def add_row(self, row):
+        self.rows.append(row)
+
+    # A unit was run: key identifies it and rerun() runs it again
+    def add_unit(self, key, rerun):
+        self.window.append((key, rerun, self.rows))
+        self.rows = []
+
+    # Close the window with the ratio of the sentinel run after it, which
+    # opens the next one. Returns the factor and drift in % of the window and
+    # [(results row, action)] of its units, the action being ok, requeued or
+    # kept (drifted but run again too many times already).
+    def close_window(self, ratio):
+        opening = self.opening if self.opening is not None else ratio
+        factor = (opening + ratio) / 2
+        drift = max(abs(opening - 1), abs(ratio - 1)) * 100
+        rows = []
+        for key, rerun, unit_rows in self.window:
+            action = "ok"
+            if drift > self.threshold:
+                action = "kept"
+                if self.requeues.get(key, 0) < self.max_requeues:
+                    self.requeues[key] = self.requeues.get(key, 0) + 1
+                    self.requeued.append(rerun)
+                    action = "requeued"
+            rows.extend((row, action) for row in unit_rows)
+        self.opening = ratio
+        self.window = []
+        return factor, drift, rows
+
+    # The units to run again, in the order they were run. A new sentinel
+    # opens their window, not the one that drifted.
+    def take_requeued(self):
+        requeued = self.requeued
+        self.requeued = []
+        if requeued:
+            self.opening = None
+        return requeued
@@ -0,0 +1,153 @@
+"""
+Contains helper code required to sweep the input size of the benchmarks:
+the geometric series of inputs of --size_sweep, generated from the standard
+input of a benchmark, and the size of an input.
+
+The size of a pbbs_v2 input is the last number of its name, which the
+generators of the data directories take as a parameter (rMatGraph_JR_12_<n>,
+2DinCube_<n>, randomSeq_<n>_double). The size of a cilk5 input is the value
+of the arguments of cilk5_sizes. The inputs of the series differ in work by
+a constant factor, e.g. matmul -n 2800, 2222, 1764 for a factor of 2.
+"""
+
+import math
+import re
+
+# Arguments of the cilk5 benchmarks that hold the size of the input (an
+# index for a positional argument), scaled together, how the work grows with
+# the size (power: work ~ n^k, exp: work ~ k^n) and the multiple the sizes
+# are rounded to (0: a power of 2)
+cilk5_sizes = {
+    "cilksort": {"args": ["-n"], "growth": ("power", 1)},
+    "heat": {"args": ["-nx", "-ny"], "growth": ("power", 2)},
+    "matmul": {"args": ["-n"], "growth": ("power", 3)},
+    "strassen": {"args": ["-n"], "growth": ("power", 2.81), "align": 0},
+    "lu": {"args": ["-n"], "growth": ("power", 3), "align": 16},
+    "rectmul": {"args": ["-x", "-y", "-z"], "growth": ("power", 3), "align": 16},
+    "fft": {"args": ["-n"], "growth": ("power", 1)},
+    "cholesky": {"args": ["-n", "-z"], "growth": ("power", 1)},
+    "nqueens": {"args": [0], "growth": ("exp", 5)},
+    "fib": {"args": [0], "growth": ("exp", 1.618)},
+}
+
+# Growth of the work of the pbbs_v2 inputs with their size
+pbbs_growth = ("power", 1)
+
+# Smallest size of a series
+min_size = 2
+
+# Number of a pbbs_v2 input name, e.g. 2250000 or 10M. None if not a number.
+def parse_count(token):
+    match = re.fullmatch(r"(\d+)([KM]?)", token)
+    if not match:
+        return None
+    return int(match.group(1)) * {"": 1, "K": 1000, "M": 1000000}[match.group(2)]
+
+# Positions of the size arguments in the tokens of a cilk5 input
+def size_positions(tokens, args):
+    positions = []
+    for arg in args:
+        if isinstance(arg, int):
+            position = arg
+        elif arg in tokens:
+            position = tokens.index(arg) + 1
+        else:
+            return []
+        if position >= len(tokens) or not tokens[position].isdigit():
+            return []
+        positions.append(position)
+    return positions
+
+# Returns (family, size, growth) of the input of a binary, the family being
+# the input with its size replaced by {n}: the inputs of a series share it.
+# None if the size of the input is not known (e.g. wikipedia250M.txt). The
+# '_' of pbbs_v2 names may have been replaced by '-' (see analyzecsv).
+def parse_input(binary, data_set):
+    if binary in cilk5_sizes:
+        info = cilk5_sizes[binary]
+        tokens = data_set.split()
+        positions = size_positions(tokens, info["args"])
+        if not positions:
+            return None
+        family = [("{n}" if position in positions else token) for position, token in enumerate(tokens)]
+        return " ".join(family), int(tokens[positions[0]]), info["growth"]
+
+    parts = re.split(r"([_-])", data_set)
+    for index in range(len(parts) - 1, -1, -2):
+        size = parse_count(parts[index])
+        if size is not None:
+            return "".join(parts[:index] + ["{n}"] + parts[index + 1:]).replace("_", "-"), size, pbbs_growth
+    return None
+
+def align(size, multiple):
+    if multiple == 0:
+        return 2 ** max(1, int(round(math.log2(size))))
+    return max(multiple, int(round(size / multiple)) * multiple)
+
+# The input of the binary of size n, from its standard input data_set. The
+# other size arguments of a cilk5 input are scaled by the same ratio.
+def make_input(binary, data_set, n):
+    if binary in cilk5_sizes:
+        info = cilk5_sizes[binary]
+        tokens = data_set.split()
+        positions = size_positions(tokens, info["args"])
+        ratio = n / int(tokens[positions[0]])
+        for position in positions:
+            value = n if position == positions[0] else int(tokens[position]) * ratio
+            tokens[position] = str(align(value, info.get("align", 1)))
+        return " ".join(tokens) + " "
+
+    parts = re.split(r"([_-])", data_set)
+    for index in range(len(parts) - 1, -1, -2):
+        if parse_count(parts[index]) is not None:
+            parts[index] = str(n)
+            return "".join(parts)
+    return data_set
+
+# Work of the input derived for --smoke from a standard input, relative to it
+smoke_factor = 1000
+
+# The input of the binary with factor times less work than data_set, used
+# by --smoke when the benchmark csv file gives no small input. None if the
+# size of data_set is not known or it cannot be reduced.
+def small_input(binary, data_set, factor=smoke_factor):
+    parsed = parse_input(binary, data_set)
+    if parsed is None:
+        return None
+    family, size, growth = parsed
+    sizes = get_sizes(size, growth, 2, factor, cilk5_sizes.get(binary, {}).get("align", 1))
+    if len(sizes) < 2:
+        return None
+    return make_input(binary, data_set, sizes[0])
+
+# Sizes of the series of points sizes ending at size, the work of each one
+# factor times the work of the previous one
+def get_sizes(size, growth, points, factor, multiple=1):
+    sizes = []
+    kind, rate = growth
+    for step in range(points - 1, 0, -1):
+        if kind == "exp":
+            n = size - step * max(1, int(round(math.log(factor) / math.log(rate))))
+        else:
+            n = align(size / factor ** (step / rate), multiple)
+        if n >= min_size and n not in sizes and n < size:
+            sizes.append(n)
+    return sizes + [size]
+
+# The inputs of the size sweep of a benchmark: the series of points inputs
+# ending at each of its standard inputs, by increasing size. An input whose
+# size is not known is run alone.
+def get_series(benchmark_obj, points, factor):
+    inputs = []
+    for data_set in benchmark_obj.standard_inputs:
+        parsed = parse_input(benchmark_obj.binary, data_set)
+        if parsed is None:
+            inputs.append(data_set)
+            continue
+        family, size, growth = parsed
+        multiple = cilk5_sizes.get(benchmark_obj.binary, {}).get("align", 1)
+        for n in get_sizes(size, growth, points, factor, multiple):
+            data_set_n = data_set if n == size else make_input(benchmark_obj.binary, data_set, n)
+            if data_set_n not in inputs:
+                inputs.append(data_set_n)
+    return inputs
@@ -0,0 +1,81 @@
+"""
+Contains helper code required to drop the warmup rounds of a benchmark and
+to summarize the distribution of the remaining (steady-state) rounds.
+"""
+
+import math
+import statistics
+
+# Bimodality coefficient above which a distribution is flagged. 5/9 is the
+# value of the uniform distribution.
+bimodal_threshold = 5/9
+
+# Number of leading rounds to drop (MSER rule): the truncation point d that
+# minimizes the squared standard error of the mean of rounds[d:], at most
+# half of the rounds.
+def mser_truncation(rounds):
+    n = len(rounds)
+    if n < 3:
+        return 0
+    best_d = 0
+    best_score = None
+    for d in range(0, n//2 + 1):
+        rest = rounds[d:]
+        avg = sum(rest)/len(rest)
+        score = sum((x-avg)**2 for x in rest) / len(rest)**2
+        if best_score is None or score < best_score:
+            best_d = d
+            best_score = score
+    return best_d
+
+# Drop the warmup rounds of every invocation, rounds_per_sample is a list of
+# the rounds of each invocation. Returns the steady-state rounds and the
+# number of rounds dropped.
+def steady_rounds(rounds_per_sample, warmup="mser"):
+    steady = []
+    dropped = 0
+    for rounds in rounds_per_sample:
+        d = mser_truncation(rounds) if warmup == "mser" else 0
+        steady.extend(rounds[d:])
+        dropped += d
+    return steady, dropped
+
+# Percentile with linear interpolation between the closest ranks
+def percentile(values, p):
+    values = sorted(values)
+    pos = (len(values) - 1) * p / 100
+    lo = math.floor(pos)
+    hi = math.ceil(pos)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+# Sample bimodality coefficient, None with less than 4 values
+def bimodality_coefficient(values):
+    n = len(values)
+    if n < 4:
+        return None
+    avg = sum(values)/n
+    m2 = sum((x-avg)**2 for x in values)/n
+    if m2 == 0:
+        return 0.0
+    m3 = sum((x-avg)**3 for x in values)/n
+    m4 = sum((x-avg)**4 for x in values)/n
+    skew = m3 / m2**1.5
+    kurt = m4 / m2**2 - 3
+    # Small sample corrections of the skewness and excess kurtosis
+    skew = skew * math.sqrt(n*(n-1)) / (n-2)
+    kurt = ((n+1)*kurt + 6) * (n-1) / ((n-2)*(n-3))
+    return (skew**2 + 1) / (kurt + 3*(n-1)**2/((n-2)*(n-3)))
+
+# Summary of the steady-state rounds
+def summarize(values):
+    bc = bimodality_coefficient(values)
+    avg = statistics.mean(values)
+    return {
+        "mean": avg,
+        "median": statistics.median(values),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "min": min(values),
+        "cv": statistics.stdev(values)/avg*100 if len(values) > 1 and avg > 0 else 0.0,
+        "bimodal": bc is not None and bc > bimodal_threshold,
+    }
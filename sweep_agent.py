@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Agent that leases work units from sweep_coordinator.py, runs each of them
+with testBenchmark_compile.py and streams the results back.
+
+Usage: ./sweep_agent.py --coordinator http://<host>:<port> [--name NAME]
+"""
+
+import argparse
+import csv
+import fcntl
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import machine_env
+import sweep_spec
+
+def post(coordinator, path, request):
+    data = json.dumps(request).encode()
+    req = urllib.request.Request(coordinator + path, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=60) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+# post(), retried up to retries times with an exponential backoff when the
+# coordinator cannot be reached
+def post_with_retries(coordinator, path, request, retries, backoff):
+    attempt = 0
+    while True:
+        try:
+            return post(coordinator, path, request)
+        except (urllib.error.URLError, OSError) as error:
+            if attempt >= retries:
+                raise
+            delay = backoff * 2**attempt
+            print(f"POST {path} failed ({error}), retrying in {delay} seconds")
+            time.sleep(delay)
+            attempt = attempt + 1
+
+# Take the lock of the checkout: the agents of a checkout share its benchmark
+# directories and every unit runs make clean && make in them, so a second
+# agent would delete the binary of the first one while it runs. Returns the
+# open lock file, None if another agent holds it.
+def lock_checkout(checkout):
+    lock_file = open(os.path.join(checkout, ".sweep_agent.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+# Renew the lease of the unit until stopped
+class LeaseRenewer(threading.Thread):
+    def __init__(self, coordinator, lease):
+        threading.Thread.__init__(self, daemon=True)
+        self.coordinator = coordinator
+        self.lease = lease
+        self.stop_event = threading.Event()
+
+    def run(self):
+        request = {"unit_id": self.lease["unit_id"], "lease_id": self.lease["lease_id"]}
+        while not self.stop_event.wait(max(1, self.lease["lease"]/3)):
+            try:
+                post(self.coordinator, "/renew", request)
+            except (urllib.error.URLError, OSError):
+                pass
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+# Read the csv files written by testBenchmark_compile.py
+def read_results(output_dir):
+    files = {}
+    if not os.path.isdir(output_dir):
+        return files
+    for fname in sorted(os.listdir(output_dir)):
+        if fname.endswith(".csv"):
+            with open(os.path.join(output_dir, fname)) as ifile:
+                files[fname] = [row for row in csv.reader(ifile)]
+    return files
+
+# Returns "ok" if every row of the results ran correctly, otherwise "failed"
+# and the error message.
+def get_status(returncode, files):
+    if returncode:
+        return "failed", f"testBenchmark_compile.py exited with {returncode}"
+    rows = files.get("lazybenchmark_results.csv", [])
+    if len(rows) < 2:
+        return "failed", "No results"
+    status_col = rows[0].index("STATUS")
+    err_col = rows[0].index("ERROR MSG")
+    for row in rows[1:]:
+        if len(row) <= status_col or row[status_col] != "Correct":
+            return "failed", row[err_col] if len(row) > err_col and row[err_col] else "Benchmark failed"
+    return "ok", ""
+
+# The benchmark csv file with only the dataset of the unit
+def write_unit_file(unit, input_file):
+    with open(input_file, "w", newline="") as ofile:
+        ofile.write("# Work unit\n")
+        csv.writer(ofile).writerow(unit["benchmark"] + [unit["dataset"]])
+
+# Command line of testBenchmark_compile.py that runs the unit of the lease
+# on input_file, with the settings sent with the unit
+def unit_command(harness, lease, input_file, output_dir):
+    unit = lease["unit"]
+    cmd = [sys.executable, harness] + lease["run_args"] + [
+        "--ifile", input_file,
+        "--num_cores", str(unit["num_cores"]),
+        "--parallel_framework", unit["parallel_framework"],
+        "--schedule_tasks", unit["schedule_tasks"],
+        "--fg", unit["fg"],
+        "--noopt", unit["noopt"],
+        "--odir", output_dir]
+    for setting in sweep_spec.unit_settings:
+        if setting in unit:
+            values = unit[setting] if isinstance(unit[setting], list) else [unit[setting]]
+            cmd += [f"--{setting}"] + [str(value) for value in values]
+    return cmd
+
+def run_unit(harness, lease, keep):
+    unit = lease["unit"]
+    workdir = tempfile.mkdtemp(prefix="sweep_agent_")
+    input_file = os.path.join(workdir, "unit.csv")
+    output_dir = os.path.join(workdir, "out")
+
+    write_unit_file(unit, input_file)
+    cmd = unit_command(harness, lease, input_file, output_dir)
+    p_process = subprocess.run(cmd, cwd=os.path.dirname(harness), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    files = read_results(output_dir)
+    status, error = get_status(p_process.returncode, files)
+    if not keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return status, error, files
+
+def main():
+    parser = argparse.ArgumentParser(description='Run work units of a distributed sweep')
+    parser.add_argument("--coordinator", required=True, help="URL of the coordinator, e.g. http://localhost:8765")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="Name of the agent. Default: <hostname>-<pid>")
+    parser.add_argument("--keep", action='store_true', help="Keep the working directory of every unit")
+    parser.add_argument("--retries", type=int, default=5, help="Times a request to the coordinator is retried. Default: 5")
+    parser.add_argument("--retry_backoff", type=float, default=2, help="Seconds before the first retry, doubled at every retry. Default: 2")
+
+    flags = parser.parse_args()
+    coordinator = flags.coordinator.rstrip("/")
+    checkout = os.path.dirname(os.path.abspath(__file__))
+    harness = os.path.join(checkout, "testBenchmark_compile.py")
+    lock_file = lock_checkout(checkout)
+    if lock_file is None:
+        print(f"{flags.name}: another agent runs in {checkout}, start every agent from its own checkout")
+        sys.exit(1)
+    fingerprint = machine_env.get_fingerprint()
+
+    while True:
+        try:
+            lease = post_with_retries(coordinator, "/lease", {"agent": flags.name, "fingerprint": fingerprint},
+                                      flags.retries, flags.retry_backoff)
+        except (urllib.error.URLError, OSError):
+            print(f"{flags.name}: coordinator unreachable, exiting")
+            return
+        if lease.get("done"):
+            break
+        if "wait" in lease:
+            time.sleep(lease["wait"])
+            continue
+
+        unit = lease["unit"]
+        print(f"{flags.name}: {unit['benchmark'][1]} {unit['dataset']} {unit['suffix']} {unit['num_cores']}")
+        renewer = LeaseRenewer(coordinator, lease)
+        renewer.start()
+        status, error, files = run_unit(harness, lease, flags.keep)
+
+        # The lease is renewed until the result is delivered
+        result = {"unit_id": lease["unit_id"], "lease_id": lease["lease_id"],
+                  "agent": flags.name, "status": status, "error": error, "files": files}
+        try:
+            post_with_retries(coordinator, "/result", result, flags.retries, flags.retry_backoff)
+        except (urllib.error.URLError, OSError):
+            result_file = os.path.abspath(f"sweep_agent_unit{lease['unit_id']}.json")
+            with open(result_file, "w") as ofile:
+                json.dump(result, ofile)
+            print(f"{flags.name}: coordinator unreachable, result of unit {lease['unit_id']} saved to {result_file}, exiting")
+            return
+        finally:
+            renewer.stop()
+
+# Main entry
+if __name__ == "__main__":
+    main()
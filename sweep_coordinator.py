@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Coordinator that splits a sweep into (benchmark, dataset, suffix, cores) work
+units and leases them to sweep_agent.py processes over HTTP.  The results
+streamed back by the agents are merged into one output directory.
+
+Usage: ./sweep_coordinator.py [--port PORT] [--lease SEC] [--retries N] -- <testBenchmark_compile.py options>
+"""
+
+import argparse
+import csv
+import hashlib
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import machine_env
+import sweep_spec
+
+# Options of testBenchmark_compile.py that the agent sets for each unit
+unit_options = ["--ifile", "--num_cores", "--parallel_framework", "--schedule_tasks", "--fg", "--noopt", "--odir", "--list_units", "--spec", "--size_sweep", "--size_factor",
+                "--allocator", "--thp"]
+
+# Fields of a unit that select it
+unit_fields = ["benchmark", "dataset", "suffix", "schedule_tasks", "noopt", "fg", "parallel_framework", "num_cores"]
+
+units_file_categories = ["UNIT", "BENCHMARK", "DATASET", "SUFFIX", "NUM CORES", "STATUS", "ATTEMPTS", "AGENT", "FINGERPRINT", "ERROR MSG"]
+
+class UnitStatus:
+    PENDING = "PENDING"
+    LEASED = "LEASED"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+# Short id of the parts of a machine fingerprint that should be identical
+# on every node
+def fingerprint_id(fingerprint):
+    pinned = {field: fingerprint.get(field) for field in machine_env.profile_fields}
+    return hashlib.sha256(json.dumps(pinned, sort_keys=True).encode()).hexdigest()[:12]
+
+# Returns the work units of the sweep, as listed by testBenchmark_compile.py
+def list_units(harness, sweep_args):
+    p_process = subprocess.run([sys.executable, harness] + sweep_args + ["--list_units"],
+                               stdout=subprocess.PIPE, cwd=os.path.dirname(harness))
+    if p_process.returncode:
+        sys.exit("Failed to list the work units of the sweep")
+    return json.loads(p_process.stdout.decode("utf-8"))
+
+# Options of the sweep sent to every agent: the agents set the options that
+# select the unit and its settings themselves
+def get_run_args(sweep_args):
+    run_args = []
+    skip = False
+    for arg in sweep_args:
+        if skip and arg.startswith("-"):
+            skip = False
+        if arg.split("=")[0] in unit_options:
+            skip = "=" not in arg
+            continue
+        if not skip:
+            run_args.append(arg)
+    return run_args
+
+class Coordinator(object):
+    def __init__(self, units, run_args, output_dir, lease_time, retries):
+        self.units = units
+        self.run_args = run_args
+        self.output_dir = output_dir
+        self.lease_time = lease_time
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.agents = {}        # agent -> fingerprint
+        self.headers = set()    # merged csv files whose header was written
+        for unit_id, unit in enumerate(units):
+            unit["id"] = unit_id
+            unit["status"] = UnitStatus.PENDING
+            unit["attempts"] = 0
+            unit["failed_agents"] = []
+            unit["lease_id"] = None
+            unit["deadline"] = 0
+            unit["agent"] = ""
+            unit["error"] = ""
+
+    def remaining(self):
+        return [unit for unit in self.units if unit["status"] in [UnitStatus.PENDING, UnitStatus.LEASED]]
+
+    # Give the agent the first pending unit that has not failed on it yet
+    def lease(self, agent, fingerprint):
+        with self.lock:
+            if agent not in self.agents:
+                self.agents[agent] = fingerprint
+                ids = set(fingerprint_id(fp) for fp in self.agents.values())
+                if len(ids) > 1:
+                    print(f"Warning: agents have different machine fingerprints: {sorted(ids)}")
+                self.write_agents()
+
+            if not self.remaining():
+                return {"done": True}
+            pending = [unit for unit in self.units if unit["status"] == UnitStatus.PENDING]
+            if not pending:
+                return {"wait": 1}
+            candidates = [unit for unit in pending if agent not in unit["failed_agents"]]
+            unit = candidates[0] if candidates else pending[0]
+
+            unit["status"] = UnitStatus.LEASED
+            unit["lease_id"] = uuid.uuid4().hex
+            unit["deadline"] = time.time() + self.lease_time
+            unit["agent"] = agent
+            unit["attempts"] += 1
+            # The settings of the sweep spec and the allocators and THP modes
+            # go with the unit
+            fields = unit_fields + [setting for setting in sweep_spec.unit_settings if setting in unit]
+            return {"unit_id": unit["id"],
+                    "lease_id": unit["lease_id"],
+                    "lease": self.lease_time,
+                    "unit": {field: unit[field] for field in fields},
+                    "run_args": self.run_args}
+
+    def current_unit(self, request):
+        unit_id = request.get("unit_id")
+        if not isinstance(unit_id, int) or unit_id < 0 or unit_id >= len(self.units):
+            return None
+        unit = self.units[unit_id]
+        if unit["status"] != UnitStatus.LEASED or unit["lease_id"] != request.get("lease_id"):
+            return None
+        return unit
+
+    def renew(self, request):
+        with self.lock:
+            unit = self.current_unit(request)
+            if unit is None:
+                return {"ok": False}
+            unit["deadline"] = time.time() + self.lease_time
+            return {"ok": True}
+
+    # Retry the unit on another agent, or give up after self.retries retries
+    def retry_or_fail(self, unit, error):
+        unit["error"] = error
+        unit["lease_id"] = None
+        if unit["agent"] not in unit["failed_agents"]:
+            unit["failed_agents"].append(unit["agent"])
+        if unit["attempts"] <= self.retries:
+            unit["status"] = UnitStatus.PENDING
+            print(f"Unit {unit['id']} failed on {unit['agent']} ({error}), retrying")
+        else:
+            unit["status"] = UnitStatus.FAILED
+            print(f"Unit {unit['id']} failed {unit['attempts']} times ({error})")
+            self.write_unit(unit)
+
+    def result(self, request):
+        with self.lock:
+            unit = self.current_unit(request)
+            if unit is None:
+                # The lease expired and the unit was given to another agent
+                return {"ok": False}
+            if request.get("status") != "ok":
+                self.retry_or_fail(unit, request.get("error", "failed"))
+                return {"ok": True}
+
+            self.merge_files(request.get("files", {}))
+            unit["status"] = UnitStatus.DONE
+            unit["lease_id"] = None
+            unit["error"] = ""
+            self.write_unit(unit)
+            return {"ok": True}
+
+    def expire_leases(self):
+        with self.lock:
+            now = time.time()
+            for unit in self.units:
+                if unit["status"] == UnitStatus.LEASED and unit["deadline"] < now:
+                    self.retry_or_fail(unit, "Lease expired")
+
+    # Append the rows of the agent's csv files to the merged ones
+    def merge_files(self, files):
+        for fname, rows in files.items():
+            fname = os.path.basename(fname)
+            if not fname.endswith(".csv") or not rows:
+                continue
+            with open(os.path.join(self.output_dir, fname), "a", newline="") as merged_file:
+                csv_writer = csv.writer(merged_file)
+                if fname not in self.headers:
+                    csv_writer.writerow(rows[0])
+                    self.headers.add(fname)
+                csv_writer.writerows(rows[1:])
+
+    def write_unit(self, unit):
+        agent = unit["agent"]
+        row = [unit["id"], unit["benchmark"][1], unit["dataset"], unit["suffix"], unit["num_cores"], unit["status"],
+               unit["attempts"], agent, fingerprint_id(self.agents.get(agent, {})), unit["error"]]
+        with open(os.path.join(self.output_dir, "lazybenchmark_units.csv"), "a", newline="") as units_file:
+            csv.writer(units_file).writerow(row)
+
+    def write_agents(self):
+        agents = {agent: {"fingerprint_id": fingerprint_id(fp), "fingerprint": fp} for agent, fp in self.agents.items()}
+        with open(os.path.join(self.output_dir, "agents.json"), "w") as agents_file:
+            json.dump(agents, agents_file, indent=2)
+
+    def status(self):
+        with self.lock:
+            counts = {}
+            for unit in self.units:
+                counts[unit["status"]] = counts.get(unit["status"], 0) + 1
+            return {"units": len(self.units), "status": counts, "agents": sorted(self.agents)}
+
+class CoordinatorHandler(http.server.BaseHTTPRequestHandler):
+    coordinator = None
+
+    def reply(self, response):
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.reply(self.coordinator.status())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        except ValueError:
+            self.send_error(400)
+            return
+        if self.path == "/lease":
+            self.reply(self.coordinator.lease(request.get("agent", self.client_address[0]), request.get("fingerprint", {})))
+        elif self.path == "/renew":
+            self.reply(self.coordinator.renew(request))
+        elif self.path == "/result":
+            self.reply(self.coordinator.result(request))
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        return
+
+def main():
+    parser = argparse.ArgumentParser(description='Distribute a sweep over sweep_agent.py processes',
+                                     usage='%(prog)s [options] -- <testBenchmark_compile.py options>')
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on. Default: 0.0.0.0")
+    parser.add_argument("--port", default=8765, type=int, help="Port to listen on. Default: 8765")
+    parser.add_argument("--lease", default=1800, type=int, help="Seconds an agent holds a unit without renewing it. Default: 1800")
+    parser.add_argument("--retries", default=2, type=int, help="Number of times a failed unit is retried. Default: 2")
+    parser.add_argument("--linger", default=10, type=int, help="Seconds to keep answering agents once the sweep is done. Default: 10")
+    parser.add_argument("--odir", default=None, help="Output directory. Default: oDir/lazybenchmark_distributed_<timestamp>")
+    parser.add_argument("sweep_args", nargs=argparse.REMAINDER, help="Options passed to testBenchmark_compile.py")
+
+    flags = parser.parse_args()
+    sweep_args = [arg for arg in flags.sweep_args if arg != "--"]
+
+    harness = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testBenchmark_compile.py")
+    units = list_units(harness, sweep_args)
+
+    run_args = get_run_args(sweep_args)
+
+    output_dir = flags.odir or "oDir/lazybenchmark_distributed_" + time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs(output_dir)
+    with open(os.path.join(output_dir, "lazybenchmark_units.csv"), "w", newline="") as units_file:
+        csv.writer(units_file).writerow(units_file_categories)
+
+    coordinator = Coordinator(units, run_args, output_dir, flags.lease, flags.retries)
+    CoordinatorHandler.coordinator = coordinator
+    server = http.server.ThreadingHTTPServer((flags.host, flags.port), CoordinatorHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    print(f"Serving {len(units)} units on {flags.host}:{flags.port}, results in {output_dir}")
+    while coordinator.remaining():
+        time.sleep(1)
+        coordinator.expire_leases()
+
+    status = coordinator.status()
+    print(f"Sweep done: {status['status']}")
+    time.sleep(flags.linger)
+    server.shutdown()
+    if status["status"].get(UnitStatus.FAILED):
+        sys.exit(1)
+
+# Main entry
+if __name__ == "__main__":
+    main()
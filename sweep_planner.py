@@ -0,0 +1,256 @@
+"""
+Contains helper code required to estimate the cost of the work units of a
+sweep from past results and to choose which of them fit in a time budget.
+"""
+
+import csv
+import glob
+import os
+
+phases = ["compile", "datagen", "run", "verify"]
+
+# Used when a phase was never measured for any unit of the benchmark
+default_cost = {"compile": 60.0, "datagen": 60.0, "run": 60.0, "verify": 30.0}
+
+baseline_suffix = "pnnt"
+
+# Parses a budget like "4h", "1h30m", "45m", "90s" or "3600" into seconds
+def parse_budget(budget):
+    seconds = 0.0
+    number = ""
+    units = {"h": 3600, "m": 60, "s": 1}
+    for c in budget.strip().lower():
+        if c.isdigit() or c == ".":
+            number += c
+        elif c in units and number:
+            seconds += float(number) * units[c]
+            number = ""
+        else:
+            raise ValueError(f"{budget} is not a valid budget")
+    if number:
+        seconds += float(number)
+    return seconds
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds//3600}h{(seconds%3600)//60:02d}m{seconds%60:02d}s"
+
+def unit_benchmark(unit):
+    return unit["benchmark"][1] + "/" + unit["benchmark"][2]
+
+class History(object):
+    def __init__(self):
+        # samples[phase][key] = [wall seconds], key depends on the phase
+        self.samples = {phase: {} for phase in phases}
+
+    def add(self, phase, key, wall):
+        self.samples[phase].setdefault(key, []).append(wall)
+
+    # Mean of the samples whose key starts with prefix, None if there are none
+    def mean(self, phase, prefix):
+        values = []
+        for key, walls in self.samples[phase].items():
+            if key[:len(prefix)] == prefix:
+                values.extend(walls)
+        return sum(values)/len(values) if values else None
+
+def to_float(val):
+    try:
+        return float(val)
+    except ValueError:
+        return None
+
+# Reads lazybenchmark_timing.csv of every result directory, and the compile
+# and results csv files of the directories written before timing was recorded.
+def load_history(result_dirs):
+    history = History()
+    for result_dir in result_dirs:
+        timing_path = os.path.join(result_dir, "lazybenchmark_timing.csv")
+        if os.path.exists(timing_path):
+            with open(timing_path) as ifile:
+                for row in csv.reader(ifile):
+                    if len(row) < 6 or row[0] == "BENCHMARK" or row[4] not in phases:
+                        continue
+                    wall = to_float(row[5])
+                    if wall is not None:
+                        history.add(row[4], (row[0], row[1], row[2], row[3]), wall)
+            continue
+
+        compile_path = os.path.join(result_dir, "lazybenchmark_compile.csv")
+        if os.path.exists(compile_path):
+            with open(compile_path) as ifile:
+                for row in csv.reader(ifile):
+                    if len(row) < 8 or row[0] == "BENCHMARK":
+                        continue
+                    wall = to_float(row[7])
+                    if wall is not None:
+                        history.add("compile", (row[0], "", row[1], ""), wall)
+
+        # The sum of the rounds underestimates the run, but is all we have
+        results_path = os.path.join(result_dir, "lazybenchmark_results.csv")
+        if os.path.exists(results_path):
+            with open(results_path) as ifile:
+                for row in csv.reader(ifile):
+                    if len(row) < 12 or row[0] in ["", "BENCHMARK"] or row[4] != "Correct":
+                        continue
+                    times = [to_float(val) for val in row[10:len(row)-1]]
+                    times = [val for val in times if val is not None]
+                    if times:
+                        history.add("run", (row[0], row[2], "", row[3]), sum(times))
+    return history
+
+def default_history_dirs():
+    return sorted(glob.glob("oDir/lazybenchmark_output_files_*")) + sorted(glob.glob("oDir/lazybenchmark_distributed_*"))
+
+# Estimated seconds of each phase of a unit.  The most specific measurement
+# available is used: same cell, then same variant/dataset on any core count,
+# then anything of the benchmark, then the default.
+def estimate_unit(history, unit):
+    bench = unit_benchmark(unit)
+    dataset = unit["dataset"]
+    suffix = unit["suffix"]
+    cores = str(unit["num_cores"])
+
+    cost = {}
+    measured = True
+    # Compile keys are (bench, "", suffix, ""), datagen keys (bench, dataset, "", "")
+    keys = {
+        "compile": [(bench, "", suffix), (bench,)],
+        "datagen": [(bench, dataset), (bench,)],
+        "run": [(bench, dataset, suffix, cores), (bench, dataset, "", cores), (bench, dataset, suffix), (bench, dataset), (bench,)],
+        "verify": [(bench, dataset, suffix, cores), (bench, dataset), (bench,)],
+    }
+    for phase in phases:
+        cost[phase] = None
+        for prefix in keys[phase]:
+            cost[phase] = history.mean(phase, prefix)
+            if cost[phase] is not None:
+                break
+        if cost[phase] is None:
+            cost[phase] = default_cost[phase]
+            if phase == "run":
+                measured = False
+    # cilk5 benchmarks have no input file or checker
+    if unit["benchmark"][0] != "pbbs_v2":
+        cost["datagen"] = 0.0
+        cost["verify"] = 0.0
+    return cost, measured
+
+# Paths of the executable and of the input (None for cilk5) of a unit, as laid
+# out by testBenchmark_compile.py
+def unit_paths(unit):
+    benchmark_name, name, binary, check_binary, data_dir = unit["benchmark"][:5]
+    if benchmark_name == "pbbs_v2":
+        return (f"{benchmark_name}/{name}/{binary}.{unit['suffix']}",
+                f"{benchmark_name}/{name}/../{data_dir}/data/{unit['dataset']}")
+    return f"{benchmark_name}/{binary}.{unit['suffix']}", None
+
+# The compiles and datasets that are already on disk: {(benchmark, suffix)}
+# of the units whose executable exists, {(benchmark, dataset)} of those
+# whose input exists
+def existing_artifacts(units):
+    compiled = set()
+    generated = set()
+    for unit in units:
+        exename, data_path = unit_paths(unit)
+        if os.path.exists(exename):
+            compiled.add((unit_benchmark(unit), unit["suffix"]))
+        # A data set with a .partial marker was truncated (see ensure_dataset)
+        if data_path is not None and os.path.isfile(data_path) and not os.path.exists(data_path + ".partial"):
+            generated.add((unit_benchmark(unit), unit["dataset"]))
+    return compiled, generated
+
+# Cost of a unit given the compiles and datasets already paid for
+def marginal_cost(unit, cost, compiled, generated):
+    total = cost["run"] + cost["verify"]
+    if (unit_benchmark(unit), unit["suffix"]) not in compiled:
+        total += cost["compile"]
+    if (unit_benchmark(unit), unit["dataset"]) not in generated:
+        total += cost["datagen"]
+    return total
+
+# Information of a unit for the comparison tables: the baseline is needed by
+# every comparison, 1 core and the largest core count are the main columns,
+# and a cell that was never measured tells us more than a repeat.
+def unit_information(unit, measured, max_cores):
+    info = 1.0
+    if unit["suffix"] == baseline_suffix:
+        info += 2.0
+    if unit["num_cores"] in [1, max_cores]:
+        info += 1.0
+    if not measured:
+        info *= 2.0
+    return info
+
+# Returns [(unit, cost, marginal cost)] in the order they should run and the
+# total estimated seconds.  Without a budget every unit is kept.
+def plan(units, history, budget=None, order="longest", execute_only=False):
+    estimates = []
+    for unit in units:
+        cost, measured = estimate_unit(history, unit)
+        if execute_only:
+            cost["compile"] = 0.0
+        estimates.append((unit, cost, measured))
+
+    max_cores = max([unit["num_cores"] for unit in units], default=1)
+    if order == "info":
+        estimates.sort(key=lambda e: -unit_information(e[0], e[2], max_cores) / (e[1]["run"] + e[1]["verify"]))
+    else:
+        estimates.sort(key=lambda e: -(e[1]["run"] + e[1]["verify"]))
+
+    baselines = {}
+    for unit, cost, measured in estimates:
+        if unit["suffix"] == baseline_suffix:
+            baselines[(unit_benchmark(unit), unit["dataset"], unit["num_cores"])] = (unit, cost, measured)
+
+    selected = []
+    selected_ids = set()
+    # The executables and inputs on disk cost nothing
+    compiled, generated = existing_artifacts(units)
+    total = 0.0
+
+    def take(unit, cost):
+        nonlocal total
+        marginal = marginal_cost(unit, cost, compiled, generated)
+        selected.append((unit, cost, marginal))
+        selected_ids.add(id(unit))
+        compiled.add((unit_benchmark(unit), unit["suffix"]))
+        generated.add((unit_benchmark(unit), unit["dataset"]))
+        total += marginal
+
+    for unit, cost, measured in estimates:
+        if id(unit) in selected_ids:
+            continue
+        group = [(unit, cost)]
+        # A variant is only useful in the tables together with its baseline
+        baseline = baselines.get((unit_benchmark(unit), unit["dataset"], unit["num_cores"]))
+        if order == "info" and baseline and id(baseline[0]) not in selected_ids and baseline[0] is not unit:
+            group.insert(0, (baseline[0], baseline[1]))
+
+        group_cost = 0.0
+        group_compiled = set(compiled)
+        group_generated = set(generated)
+        for gunit, gcost in group:
+            group_cost += marginal_cost(gunit, gcost, group_compiled, group_generated)
+            group_compiled.add((unit_benchmark(gunit), gunit["suffix"]))
+            group_generated.add((unit_benchmark(gunit), gunit["dataset"]))
+        if budget is not None and total + group_cost > budget:
+            continue
+        for gunit, gcost in group:
+            take(gunit, gcost)
+
+    return selected, total
+
+def print_plan(selected, all_units, total, budget):
+    print("BENCHMARK, DATASET, SUFFIX, NUM CORES, COMPILE(s), DATAGEN(s), RUN(s), VERIFY(s), COST(s), ETA")
+    elapsed = 0.0
+    for unit, cost, marginal in selected:
+        elapsed += marginal
+        print(f"{unit_benchmark(unit)}, {unit['dataset']}, {unit['suffix']}, {unit['num_cores']}, "
+              f"{cost['compile']:.1f}, {cost['datagen']:.1f}, {cost['run']:.1f}, {cost['verify']:.1f}, "
+              f"{marginal:.1f}, {format_duration(elapsed)}")
+    print(f"Selected {len(selected)} of {len(all_units)} units, estimated total {format_duration(total)}", end="")
+    if budget is not None:
+        print(f" (budget {format_duration(budget)})")
+    else:
+        print("")
@@ -0,0 +1,243 @@
+"""
+Contains helper code required to follow a sweep while it runs: the live
+counters and gauges of the harness (units done, failed and remaining, the
+current cell and phase, the last timings, the throughput and ETA), served on
+localhost in the Prometheus text format (/metrics) and as JSON (/status), and
+shown on a refreshing status line.
+
+A unit is one row of lazybenchmark_results.csv: a (benchmark, dataset,
+variant, cores) cell.
+"""
+
+import json
+import sys
+import threading
+import time
+
+# Counters and gauges of the sweep, updated by the harness
+class Progress(object):
+    def __init__(self, total=0):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.runs = 0
+        self.failed_runs = 0
+        self.retries = 0
+        self.compiles = 0
+        self.failed_compiles = 0
+        self.quarantined = 0
+        self.last_run = None        # Seconds of the last run
+        self.last_compile = None    # Seconds of the last compile
+        self.cell = {}              # benchmark, dataset, variant, cores of the current run
+        self.phase = ""
+
+    def set_cell(self, benchmark, dataset, variant, cores):
+        with self.lock:
+            self.cell = {"benchmark": benchmark, "dataset": dataset.strip(), "variant": variant, "cores": str(cores)}
+
+    def set_phase(self, phase):
+        self.phase = phase
+
+    def record_run(self, seconds, ok):
+        with self.lock:
+            self.runs += 1
+            self.failed_runs += 0 if ok else 1
+            self.last_run = seconds
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def record_compile(self, seconds, ok):
+        with self.lock:
+            self.compiles += 1
+            self.failed_compiles += 0 if ok else 1
+            if seconds is not None:
+                self.last_compile = seconds
+
+    def record_quarantine(self):
+        with self.lock:
+            self.quarantined += 1
+
+    def finish_unit(self, ok):
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    # Units that will not run (the variant failed to compile or was
+    # quarantined, the data set could not be created)
+    def skip_units(self, count):
+        with self.lock:
+            self.skipped += count
+
+    # Units added to the sweep while it runs (run again after a drift)
+    def add_units(self, count):
+        with self.lock:
+            self.total += count
+
+    # The counters and gauges, with the remaining units, the throughput of
+    # the units that ran and the ETA at that throughput
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            ran = self.done + self.failed
+            remaining = max(0, self.total - ran - self.skipped)
+            per_hour = ran / elapsed * 3600 if elapsed > 0 else 0.0
+            return {
+                "elapsed_seconds": elapsed,
+                "units_total": self.total,
+                "units_done": self.done,
+                "units_failed": self.failed,
+                "units_skipped": self.skipped,
+                "units_remaining": remaining,
+                "units_per_hour": per_hour,
+                "eta_seconds": remaining / per_hour * 3600 if per_hour > 0 else None,
+                "runs": self.runs,
+                "failed_runs": self.failed_runs,
+                "retries": self.retries,
+                "compiles": self.compiles,
+                "failed_compiles": self.failed_compiles,
+                "quarantined_variants": self.quarantined,
+                "last_run_seconds": self.last_run,
+                "last_compile_seconds": self.last_compile,
+                "cell": dict(self.cell),
+                "phase": self.phase,
+            }
+
+# Metrics of the snapshot in the Prometheus text exposition format
+def format_prometheus(snapshot):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP lazybenchmark_{name} {help_text}")
+        lines.append(f"# TYPE lazybenchmark_{name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(f'{key}="{escape(val)}"' for key, val in labels.items())
+            lines.append(f"lazybenchmark_{name}{{{label_text}}} {value}" if label_text else f"lazybenchmark_{name} {value}")
+
+    metric("units", "gauge", "Units of the sweep", [({}, snapshot["units_total"])])
+    metric("units_finished_total", "counter", "Units finished, by status",
+           [({"status": "done"}, snapshot["units_done"]), ({"status": "failed"}, snapshot["units_failed"]),
+            ({"status": "skipped"}, snapshot["units_skipped"])])
+    metric("units_remaining", "gauge", "Units not run yet", [({}, snapshot["units_remaining"])])
+    metric("units_per_hour", "gauge", "Units run per hour since the start of the sweep", [({}, round(snapshot["units_per_hour"], 3))])
+    metric("eta_seconds", "gauge", "Seconds until the remaining units are run at the current throughput",
+           [({}, round(snapshot["eta_seconds"], 1) if snapshot["eta_seconds"] is not None else None)])
+    metric("elapsed_seconds", "gauge", "Seconds since the start of the sweep", [({}, round(snapshot["elapsed_seconds"], 1))])
+    metric("runs_total", "counter", "Benchmark runs, by status",
+           [({"status": "ok"}, snapshot["runs"] - snapshot["failed_runs"]), ({"status": "failed"}, snapshot["failed_runs"])])
+    metric("retries_total", "counter", "Runs retried after a transient failure", [({}, snapshot["retries"])])
+    metric("compiles_total", "counter", "Variants compiled, by status",
+           [({"status": "ok"}, snapshot["compiles"] - snapshot["failed_compiles"]), ({"status": "failed"}, snapshot["failed_compiles"])])
+    metric("quarantined_variants", "gauge", "Variants quarantined after repeated failures", [({}, snapshot["quarantined_variants"])])
+    metric("last_run_seconds", "gauge", "Wall time of the last run",
+           [({}, round(snapshot["last_run_seconds"], 3) if snapshot["last_run_seconds"] is not None else None)])
+    metric("last_compile_seconds", "gauge", "Wall time of the last compile",
+           [({}, round(snapshot["last_compile_seconds"], 3) if snapshot["last_compile_seconds"] is not None else None)])
+    if snapshot["cell"]:
+        metric("current_cell", "gauge", "Cell being run", [(dict(snapshot["cell"], phase=snapshot["phase"]), 1)])
+    return "\n".join(lines) + "\n"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+# One line: the units finished out of the total, the failures, the
+# throughput and ETA, then the current cell and phase
+def format_status_line(snapshot, width=None):
+    ran = snapshot["units_done"] + snapshot["units_failed"] + snapshot["units_skipped"]
+    line = (f"[{ran}/{snapshot['units_total']} units, {snapshot['units_failed']} failed, {snapshot['units_skipped']} skipped"
+            f" | {snapshot['units_per_hour']:.1f}/h | ETA {format_duration(snapshot['eta_seconds'])}]")
+    cell = snapshot["cell"]
+    if cell:
+        line += f" {cell['benchmark']} {cell['dataset']} {cell['variant']} {cell['cores']}c"
+    if snapshot["phase"]:
+        line += f" {snapshot['phase']}"
+    if snapshot["last_run_seconds"] is not None:
+        line += f" (last run {snapshot['last_run_seconds']:.2f}s)"
+    if width is not None and len(line) > width - 1:
+        line = line[:width - 4] + "..."
+    return line
+
+# Requests of the metrics endpoint, mixed into http.server's handler by
+# serve(), which imports http.server only when the metrics are served
+class ProgressHandler(object):
+    progress = None
+
+    def reply(self, body, content_type):
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self.reply(format_prometheus(self.progress.snapshot()), "text/plain; version=0.0.4")
+        elif self.path == "/status":
+            self.reply(json.dumps(self.progress.snapshot()), "application/json")
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        return
+
+# Serve the metrics of progress on host:port in a daemon thread. Returns the
+# server, to shut down at the end of the sweep.
+def serve(progress, port, host="127.0.0.1"):
+    import http.server
+
+    handler = type("Handler", (ProgressHandler, http.server.BaseHTTPRequestHandler), {"progress": progress})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Status line of progress on the terminal, refreshed every interval seconds
+# by a daemon thread
+class StatusLine(object):
+    def __init__(self, progress, interval=1.0, stream=sys.stderr):
+        self.progress = progress
+        self.interval = interval
+        self.stream = stream
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def draw(self):
+        import shutil
+
+        width = shutil.get_terminal_size().columns
+        self.stream.write("\r" + format_status_line(self.progress.snapshot(), width) + "\033[K")
+        self.stream.flush()
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.draw()
+
+    # Draw the final state and move to the next line
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.draw()
+        self.stream.write("\n")
+        self.stream.flush()
@@ -0,0 +1,171 @@
+"""
+Contains helper code required to read a declarative sweep specification, the
+axes of the matrix with per-benchmark overrides and exclusion rules, from a
+TOML, YAML or JSON file. For example:
+
+    benchmarks = ["lazybenchmark.csv"]
+    num_cores = [1, 8, 64]
+    num_tests = 10
+    parallel_framework = ["lazyd0", "tapir"]
+    schedule_tasks = ["DELEGATEPRCPRL", "OPENCILKDEFAULT_FINE", "PBBS"]
+    fg = ["yes", "no"]
+    noopt = ["yes", "no"]
+    variant_rules = "none"
+
+    [[override]]
+    benchmark = "pbbs_v2/bfs/*"
+    inputs = ["randLocalGraph_J_5_10000000"]
+    samples = 3
+    run_timeout = 900
+
+    [[exclude]]
+    benchmark = "cilk5/*"
+    fg = "yes"
+
+The harness expands it into work units, see get_spec_units in
+testBenchmark_compile.py.
+"""
+
+import fnmatch
+import json
+import os
+
+# Axes of the matrix, every combination is a cell
+axes = ["inputs", "num_cores", "parallel_framework", "schedule_tasks", "fg", "noopt"]
+
+# Settings of a cell that can be overridden per benchmark
+settings = {"num_tests": int, "samples": int, "run_timeout": float, "variant_rules": str}
+
+# Settings of the whole sweep
+sweep_keys = ["benchmarks", "allocator", "thp"]
+
+# Settings a work unit carries to the agent of a distributed sweep: the
+# settings of its cell and the allocators and THP modes of the sweep
+unit_settings = list(settings) + ["allocator", "thp"]
+
+# Fields of a cell matched by the exclusion rules
+rule_keys = ["benchmark", "dataset", "num_cores", "parallel_framework", "schedule_tasks", "fg", "noopt", "suffix"]
+
+default_axes = {
+    "num_cores": ["1"],
+    "parallel_framework": ["tapir"],
+    "schedule_tasks": ["PBBS"],
+    "fg": ["no"],
+    "noopt": ["no"],
+}
+
+variant_rules = ["builtin", "none"]
+
+# Parse the file by its extension. TOML needs Python 3.11 (tomllib) or the
+# tomli package and YAML the PyYAML package, JSON is always supported.
+def read_file(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError(f"Reading {path} needs Python 3.11 or the tomli package, or write the sweep in JSON")
+        with open(path, "rb") as ifile:
+            return tomllib.load(ifile)
+    if extension in [".yaml", ".yml"]:
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading {path} needs the PyYAML package, or write the sweep in JSON")
+        with open(path) as ifile:
+            return yaml.safe_load(ifile) or {}
+    with open(path) as ifile:
+        return json.load(ifile)
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+# Values of an axis as strings. yes/no axes may be booleans, YAML reads an
+# unquoted yes as true.
+def axis_values(value):
+    values = []
+    for item in as_list(value):
+        if isinstance(item, bool):
+            item = "yes" if item else "no"
+        values.append(str(item))
+    return values
+
+def check_keys(section, allowed, where):
+    for key in section:
+        if key not in allowed:
+            raise ValueError(f"Unknown key {key} in {where} of the sweep spec, expected one of {', '.join(allowed)}")
+
+# Axes and settings of a section (the top level or an override)
+def read_section(section, where):
+    values = {}
+    for key in axes:
+        if key in section:
+            values[key] = axis_values(section[key])
+    for key, kind in settings.items():
+        if key in section:
+            try:
+                values[key] = kind(section[key])
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} of {where} of the sweep spec is not a valid {kind.__name__}")
+    if values.get("variant_rules", "builtin") not in variant_rules:
+        raise ValueError(f"variant_rules of {where} of the sweep spec must be one of {', '.join(variant_rules)}")
+    return values
+
+# Returns the sweep spec of the file: the benchmark csv files (relative to the
+# spec), the allocators and THP modes, the default axes and settings, the
+# overrides [(benchmark patterns, axes and settings)] and the exclusion rules
+# [{field: patterns}]. Raises ValueError for an invalid spec.
+def load(path):
+    document = read_file(path)
+    if not isinstance(document, dict):
+        raise ValueError(f"{path} is not a sweep spec")
+    check_keys(document, sweep_keys + axes + list(settings) + ["override", "exclude"], "the top level")
+
+    spec_dir = os.path.dirname(os.path.abspath(path))
+    spec = {
+        "benchmarks": [os.path.join(spec_dir, csv_file) for csv_file in as_list(document.get("benchmarks", []))],
+        "allocator": [str(value) for value in as_list(document["allocator"])] if "allocator" in document else None,
+        "thp": [str(value) for value in as_list(document["thp"])] if "thp" in document else None,
+        "defaults": dict(default_axes),
+        "overrides": [],
+        "excludes": [],
+    }
+    spec["defaults"].update(read_section(document, "the top level"))
+
+    for index, override in enumerate(as_list(document.get("override", []))):
+        where = f"override {index + 1}"
+        check_keys(override, ["benchmark"] + axes + list(settings), where)
+        if "benchmark" not in override:
+            raise ValueError(f"{where} of the sweep spec has no benchmark pattern")
+        spec["overrides"].append((axis_values(override["benchmark"]), read_section(override, where)))
+
+    for index, rule in enumerate(as_list(document.get("exclude", []))):
+        where = f"exclude {index + 1}"
+        check_keys(rule, rule_keys, where)
+        if not rule:
+            raise ValueError(f"{where} of the sweep spec is empty and would exclude every cell")
+        spec["excludes"].append({key: axis_values(value) for key, value in rule.items()})
+    return spec
+
+def matches(value, patterns):
+    return any(fnmatch.fnmatchcase(str(value), pattern) for pattern in patterns)
+
+# Axes and settings of a benchmark (<suite>/<name>, e.g. pbbs_v2/bfs/det):
+# the defaults, updated by every override that matches it in order
+def settings_for(spec, benchmark):
+    values = dict(spec["defaults"])
+    for patterns, override in spec["overrides"]:
+        if matches(benchmark, patterns):
+            values.update(override)
+    return values
+
+# Is the cell ({field: value} of rule_keys) excluded by one of the rules? A
+# rule excludes the cells that match every one of its fields.
+def excluded(spec, cell):
+    for rule in spec["excludes"]:
+        if all(matches(cell[key], patterns) for key, patterns in rule.items()):
+            return True
+    return False
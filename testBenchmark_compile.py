@@ -4,21 +4,31 @@ Test script to measure performance of pbbs and cilk5
 """
 
 import logging
-import argparse
 import subprocess
 import os
 import csv
-import sys, getopt
-import multiprocessing
+import sys
 import time
-import shutil
+import fnmatch
+import json
+import signal
+import copy
+import contextlib
+import itertools
 from enum import Enum
 from enum import IntEnum
+from dataclasses import dataclass, field
 
 from parse_lazybenchmark_csv import parse_csv
+import machine_env
+import sweep_planner
+import runtime_config
+import trace_events
+import sweep_progress
 
 results_file_categories = ["BENCHMARK", "COMPILES", "DATASET", "NUM CORES",
-                           "STATUS", "DISABLE_NUMA", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "PFOR_MAXGRAINSIZE", "IGNORE_USERS_PFORGRAINSIZE", "TIME(sec)", "ERROR MSG"]
+                           "STATUS", "DISABLE_NUMA", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "PFOR_MAXGRAINSIZE", "IGNORE_USERS_PFORGRAINSIZE",
+                           "ALLOCATOR", "THP", "TIME(sec)", "ERROR MSG"]
 
 ################
 # helper classes
@@ -34,13 +44,180 @@ class ColName(IntEnum):
     TASK_SCHEDULER = 7
     PFORMAXGRAINSIZE = 8
     IGNORE_USER_PFORGAINSIZE = 9
-    TIME = 10
-    ERROR_MSG = 11
+    ALLOCATOR = 10
+    THP = 11
+    TIME = 12
+    ERROR_MSG = 13
 
 num_cols = len(results_file_categories) # Of output csv file.
 
+compile_file_categories = ["BENCHMARK", "SUFFIX", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "PFOR_MAXGRAINSIZE", "IGNORE_USERS_PFORGRAINSIZE",
+                           "STATUS", "COMPILE_TIME(sec)", "USER_TIME(sec)", "SYS_TIME(sec)", "PEAK_RSS(KB)", "OBJECT_SIZE(B)", "BINARY_SIZE(B)", "ERROR MSG"]
+
+class CompileColName(IntEnum):
+    BENCHMARK = 0
+    SUFFIX = 1
+    PARALLEL_FRAMEWORK = 2
+    TASK_SCHEDULER = 3
+    PFORMAXGRAINSIZE = 4
+    IGNORE_USER_PFORGAINSIZE = 5
+    STATUS = 6
+    COMPILE_TIME = 7
+    USER_TIME = 8
+    SYS_TIME = 9
+    PEAK_RSS = 10
+    OBJECT_SIZE = 11
+    BINARY_SIZE = 12
+    ERROR_MSG = 13
+
+num_compile_cols = len(compile_file_categories) # Of compile csv file.
+
+# Counters printed by the LazyD runtime as "-1,<name>,<value>,..." (-1 is the
+# total over all workers), mapped to the metric name used in the csv file.
+sched_stat_names = {
+    "number of success push_workctx": "STEALS",
+    "number of failed push_workctx": "FAILED_STEALS",
+    "number of times a task was created during unwind": "PROMOTED_TASKS",
+    "number of times sending request": "WORK_REQUESTS",
+    "number of times in handler": "REQUESTS_SERVED",
+    "number of total tasks": "TOTAL_TASKS",
+    "work size": "WORK_SIZE",
+}
+
+sched_stat_metrics = ["STEALS", "FAILED_STEALS", "PROMOTED_TASKS", "WORK_REQUESTS", "REQUESTS_SERVED", "TOTAL_TASKS", "WORK_SIZE", "AVG_WORK_SIZE"]
+
+sched_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "STATUS", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "PFOR_MAXGRAINSIZE", "IGNORE_USERS_PFORGRAINSIZE",
+                         "TIME(sec)"] + sched_stat_metrics
+
+sample_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "ORDER", "SAMPLE", "POSITION", "TIMESTAMP", "ROUND", "STATUS", "TIME(sec)"]
+
+class SampleColName(IntEnum):
+    BENCHMARK = 0
+    DATASET = 1
+    NUM_CORES = 2
+    SUFFIX = 3
+    ORDER = 4
+    SAMPLE = 5
+    POSITION = 6
+    TIMESTAMP = 7
+    ROUND = 8
+    STATUS = 9
+    TIME = 10
+
+env_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "POSITION", "GOVERNOR", "TURBO", "SMT", "THP",
+                       "FREQ_MIN(MHz)", "FREQ_MEAN(MHz)", "FREQ_MAX(MHz)", "THROTTLE_DELTA", "DEVIATIONS",
+                       "INPUT_STAGED", "INPUT_RESIDENCY(%)"]
+
+class EnvColName(IntEnum):
+    BENCHMARK = 0
+    DATASET = 1
+    NUM_CORES = 2
+    SUFFIX = 3
+    POSITION = 4
+    GOVERNOR = 5
+    TURBO = 6
+    SMT = 7
+    THP = 8
+    FREQ_MIN = 9
+    FREQ_MEAN = 10
+    FREQ_MAX = 11
+    THROTTLE_DELTA = 12
+    DEVIATIONS = 13
+    INPUT_STAGED = 14
+    INPUT_RESIDENCY = 15
+
+# Position of the next sample in the whole sweep
+sample_position = 0
+
+# dataset_staging.Stager of --stage_dir, None to read the inputs in place
+stager = None
+
+# cgroup_isolation.Isolation of --isolate, None to run in the cgroup of the harness
+isolation = None
+
+# THP mode of the system when the sweep started, set back before the runs in
+# the system mode and when the sweep ends
+original_thp = None
+
+# cpu.stat, memory.peak and cpu pressure of the cgroup of every measured run
+cgroup_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "SAMPLE", "ATTEMPT", "CPUS", "CPU_USAGE(sec)", "USER(sec)", "SYSTEM(sec)",
+                          "THROTTLED(sec)", "CPU_PRESSURE(sec)", "MEMORY_PEAK(B)", "OOM_KILLS"]
+
+cgroup_csv_writer = None
+
+# Energy of every measured run with --energy, from the package and DRAM
+# domains of the powercap interface (see energy). POWER(W) is the energy
+# over the wall time of the run.
+energy_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "PFOR_MAXGRAINSIZE",
+                          "IGNORE_USERS_PFORGRAINSIZE", "ALLOCATOR", "THP", "SAMPLE", "ATTEMPT", "STATUS", "ROUNDS", "TIME(sec)", "WALL(sec)",
+                          "PACKAGE(J)", "DRAM(J)", "ENERGY(J)", "POWER(W)"]
+
+energy_csv_writer = None
+
+# Domains measured with --energy, None if the energy is not measured
+energy_domains = None
+
+# Trace of the phases of the sweep, see trace_events
+tracer = None
+
+# Live counters of the sweep, see sweep_progress. Its status line and the
+# server of its metrics, None if not shown or served.
+progress = sweep_progress.Progress()
+status_line = None
+metrics_server = None
+
+# sentinel.Calibration of --sentinel, None if the machine is not calibrated
+calibration = None
+
+# Every sentinel run, with its drift from the baseline of its core count
+sentinel_file_categories = ["TIMESTAMP", "POSITION", "WORKLOAD", "NUM CORES", "CPUS", "NEXT CELL", "STATUS", "TIME(sec)",
+                            "BASELINE(sec)", "DRIFT(%)"]
+
+sentinel_csv_writer = None
+
+# Noise factor of every results row: the key columns of the row, the mean
+# ratio of its two sentinels to their baseline, their largest drift and
+# whether the row was run again
+noise_file_categories = results_file_categories[:int(ColName.TIME)] + ["FACTOR", "DRIFT(%)", "ACTION"]
+
+noise_csv_writer = None
+
+# Wall time of every phase of the sweep, read back by the planner of later sweeps
+timing_file_categories = ["BENCHMARK", "DATASET", "SUFFIX", "NUM CORES", "PHASE", "WALL(sec)"]
+
+timing_csv_writer = None
+
+# Distribution of the steady-state rounds of every cell
+stats_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "PARALLEL_FRAMEWORK", "TASK_SCHEDULER", "ROUNDS", "WARMUP",
+                         "MEAN(sec)", "MEDIAN(sec)", "P90(sec)", "P99(sec)", "MIN(sec)", "CV(%)", "BIMODAL"]
+
+stats_csv_writer = None
+
+smoke_file_categories = ["BENCHMARK", "DATASET", "SUFFIX", "NUM CORES", "STATUS", "ERROR MSG"]
+
+# Every failed attempt of a run, with its class and what was done about it
+failure_file_categories = ["BENCHMARK", "DATASET", "NUM CORES", "SUFFIX", "SAMPLE", "ATTEMPT", "CLASS", "EXIT CODE", "SIGNAL", "ACTION", "DETAIL"]
+
+failure_csv_writer = None
+
+class SchedColName(IntEnum):
+    BENCHMARK = 0
+    DATASET = 1
+    NUM_CORES = 2
+    STATUS = 3
+    PARALLEL_FRAMEWORK = 4
+    TASK_SCHEDULER = 5
+    PFORMAXGRAINSIZE = 6
+    IGNORE_USER_PFORGAINSIZE = 7
+    TIME = 8
+    STATS = 9
+
 compilation_timeout = 6 * 60 # In seconds.
-check_benchmark_timout = 6 * 60 # In seconds.
+
+# Marker next to a data set being generated: make writes the data set under
+# its final name, so one killed mid-write is only known to be truncated by
+# its marker
+partial_suffix = ".partial"
 
 n_iteration = 1
 
@@ -61,6 +238,21 @@ class CmdStatus:
             return "TIMEOUT"
         return f"Unknown Status: {status}"
 
+# Why a run failed
+class FailureClass:
+    SIGNAL = "SIGNAL"                      # Killed by a signal, e.g. a segfault
+    OOM = "OOM"                            # Out of memory or killed by the OOM killer
+    TIMEOUT = "TIMEOUT"
+    CHECKER_MISMATCH = "CHECKER_MISMATCH"  # The checker rejected the output
+    MISSING_DATASET = "MISSING_DATASET"
+    EXIT = "EXIT"                          # Any other non-zero exit
+
+    # Classes worth retrying
+    transient = [SIGNAL, OOM, TIMEOUT]
+
+oom_messages = ["std::bad_alloc", "Cannot allocate memory", "out of memory", "Out of memory"]
+missing_dataset_messages = ["No such file or directory", "could not open", "Could not open", "cannot open"]
+
 class CilkLowering:
     Serial = 0
     LazyD2 = 1
@@ -129,32 +321,89 @@ class CompilerOptions:
         self.noopt = noopt
         self.finergrainsize = finergrainsize
         self.extension = suffix
+        self.allocator = runtime_config.default_allocator
+        self.thp = None  # THP mode of the run, None to leave the system mode
 
     def get_cilklowering_str(self) :
         return CilkLowering.getDescription(self.cilk_lowering)
 
-class LazyBenchmarkOptions(object):
-    def __init__(self, compile_only, execute_only, num_cores, num_tests, benchmarks_to_run, cilk_lowering, task_scheduler, noopt, finergrainsize, measure_icache, measure_promotedtask, disable_numa, verbose, dry_run, wait_load, disable_pinning):
-        self.compile_only = compile_only
-        self.execute_only = execute_only
-        self.num_cores = num_cores
-        self.num_tests = num_tests
-        self.benchmarks_to_run = benchmarks_to_run
-        self.cilk_lowering = cilk_lowering
-        self.task_scheduler = task_scheduler
-        self.noopt = noopt
-        self.finergrainsize = finergrainsize
-        self.measure_icache = measure_icache
-        self.measure_promotedtask = measure_promotedtask
-        self.disable_numa = disable_numa
-        self.verbose = verbose
-        self.dry_run = dry_run
-        self.wait_load = wait_load
-        if(disable_pinning):
-            self.nv = 0
-        else:
-            self.nv = 1
-
+    # Name of the variant in the csv files: the suffix, followed by the
+    # allocator and THP mode when they are not the default
+    @property
+    def variant(self):
+        variant = self.extension
+        if self.allocator != runtime_config.default_allocator:
+            variant += "+" + self.allocator
+        if self.thp is not None:
+            variant += "+thp-" + self.thp
+        return variant
+
+# Options of a sweep. The lists are the values swept over.
+@dataclass
+class LazyBenchmarkOptions:
+    benchmarks_to_run: list = field(default_factory=list)  # Benchmark objects, see parse_csv
+    compile_only: bool = False
+    execute_only: bool = False
+    num_cores: list = field(default_factory=lambda: ['1'])  # As on the command line, see get_test_num_cores
+    num_tests: int = 1
+    cilk_lowering: list = field(default_factory=lambda: [CilkLowering.CilkPlus])
+    task_scheduler: list = field(default_factory=lambda: ["PBBS"])
+    noopt: list = field(default_factory=lambda: [False])
+    finergrainsize: list = field(default_factory=lambda: [False])
+    measure_icache: bool = False
+    measure_promotedtask: bool = False
+    disable_numa: bool = False
+    verbose: bool = False
+    dry_run: bool = False
+    wait_load: float = 10
+    disable_pinning: bool = False
+    profile_cells: list = None     # None: no profiling, []: every cell
+    profile_freq: int = 999
+    profile_dir: str = None        # Default: <output dir>/profiles
+    order: str = "suffix"          # suffix, abab or random
+    num_samples: int = 1           # Number of invocations of each variant per cell
+    seed: int = 0
+    env_profile: dict = None       # Pinned machine state, None if not checked
+    env_action: str = "warn"       # warn or abort when the state deviates
+    warmup: str = "mser"           # mser or none, rule to drop the warmup rounds
+    retries: int = 2               # Number of retries of a run that failed for a transient reason
+    retry_backoff: float = 10      # Seconds before the first retry, doubled for every retry
+    quarantine_after: int = 3      # Quarantine a variant after this many failed runs
+    smoke: bool = False            # Run every variant on the small inputs before the sweep
+    smoke_cores: int = 2
+    smoke_jobs: int = 0            # 0: number of cpus / smoke_cores
+    budget: float = None           # Seconds, None to run every unit
+    plan_order: str = "longest"    # longest or info
+    history_dirs: list = None      # Result directories read by the planner, None for oDir/lazybenchmark_*
+    binary_inputs: bool = False    # Run pbbs_v2 on the converted inputs, see dataset_cache
+    stage_dir: str = None          # Copy the pbbs_v2 inputs to a directory of this tmpfs, None to read them in place
+    stage_budget: float = None     # Bytes staged at most, None for half the free space of stage_dir
+    allocators: list = field(default_factory=lambda: [runtime_config.default_allocator])  # glibc, jemalloc, tcmalloc, mimalloc or all
+    thp_modes: list = field(default_factory=lambda: [None])  # always, madvise, never or None for the system mode
+    isolate: bool = False          # Run every measured process in its own cgroup v2 leaf, see cgroup_isolation
+    cgroup_root: str = None        # cgroup v2 mount, None to find it in /proc/mounts
+    cgroup_memory: float = None    # memory.max of the leaf of a run in bytes, None for no limit
+    run_timeout: float = None      # Seconds before a run is killed, None for no timeout
+    check_timeout: float = None    # Seconds before a verification is killed, None for no timeout
+    datagen_timeout: float = None  # Seconds before a data set generation is killed, None for no timeout
+    variant_rules: str = "builtin" # builtin: only the variants of the paper (see isPaperVariant), none: every combination
+    units: list = None             # Work units of a sweep spec (see apply_spec), None for the matrix of the options
+    size_sweep: int = 0            # Number of input sizes ending at every standard input (see size_sweep), 0 for the standard inputs
+    size_factor: float = 2         # Ratio of the work of consecutive sizes of --size_sweep
+    metrics_port: int = None       # Serve the live metrics of the sweep on this port of localhost, None for no endpoint
+    status_line: str = "auto"      # Refreshing status line instead of the progress fragments: on, off or auto (when stderr is a terminal)
+    sentinel: str = None           # cilk5 kernel run to calibrate the machine (see sentinel), None to not calibrate
+    sentinel_every: int = 1        # Units between two sentinels
+    sentinel_threshold: float = 5  # Drift in % of a sentinel from which the units it follows are run again
+    sentinel_requeue: int = 1      # Times a unit is run again at most after a drift
+    energy: bool = False           # Measure the energy of every run with the powercap interface
+    energy_root: str = "/"         # Root of the sysfs tree read by --energy, a fake tree for testing
+    quarantined: set = field(default_factory=set)   # (benchmark, suffix) of the variants that are not run
+    failed_runs: dict = field(default_factory=dict) # (benchmark, suffix) -> number of runs that failed after the retries
+
+    @property
+    def nv(self):
+        return 0 if self.disable_pinning else 1
 
     def get_cilklowering_str(self) :
         return CilkLowering.getDescription(self.cilk_lowering)
@@ -162,62 +411,61 @@ class LazyBenchmarkOptions(object):
     def getCilk5Arg(self):
         return CilkLowering.getCilk5Arg(self.cilk_lowering)
 
-################
-# parse command line arguments
-
-# setup command line parsing
-parser = argparse.ArgumentParser(description='Compile and Run benchmarks')
-parser.add_argument("--compile", action='store_true', help="Only compile benchmark")
-parser.add_argument("--num_cores", nargs='+', default=['1'], help="Number of cores used. Default: 1")
-parser.add_argument("--num_tests", default=1, type=int, help="Number of runs per test")
-parser.add_argument("--execute", action='store_true', help="Only execute benchmark, don't compile")
-parser.add_argument("--disable_numa", action='store_true', help="Disable numa when running the benchmark")
-parser.add_argument("--icache", action='store_true', help="Run the icache experiment")
-parser.add_argument("--parallel_framework", nargs='+',
-                    default=['tapir'],
-                    choices=['lazyd0', 'lazyd2', 'nopoll', 'serial', 'tapir'],
-                    help="What parallel framework to use. Default: tapir")
-parser.add_argument("--fg",
-                    default=['no'],
-                    choices=['yes', 'no', 'both'],
-                    help="Use finer grainsize. Only for LazyD and OpenCilk-fg. Default: no")
-parser.add_argument("--noopt",
-                    default=['no'],
-                    choices=['yes', 'no', 'both'],
-                    help="Ignore users grainsize.  Default: no")
-parser.add_argument("--schedule_tasks",
-                    default=["PBBS"],
-                    nargs='+',
-                    choices=['PRC', 'PRL', 'DELEGATEPRC', 'PRCPRL', 'DELEGATEPRCPRL', 'OPENCILKDEFAULT_FINE', 'PBBS'],
-                    help="How to scheduler parallel task in pfor.")
-parser.add_argument("--ifile", default="lazybenchmark.csv", help="Input file")
-parser.add_argument("-v", "--verbose", action='store_true', help="Verbose")
-parser.add_argument("--dryrun", action='store_true', help="Dry run, only print commands that would be executed")
-parser.add_argument("--wait_load", default=10, type=int, help="The minimum load to execute the benchmark (Default=10)")
-parser.add_argument("--disable_pinning", action='store_true', help="Disable worker pinning for LazyD")
-
-# parse arguments
-flags = parser.parse_args()
-compile_only = flags.compile
-execute_only = flags.execute
-num_cores = flags.num_cores
-num_tests = flags.num_tests
-disable_numa = flags.disable_numa
-wait_load = flags.wait_load
-finergrainsize = [flags.fg=='yes'] if flags.fg != 'both' else [True, False]
-measure_icache = flags.icache
-noopt = [flags.noopt=='yes'] if flags.noopt != 'both' else  [True, False]
-input_file = flags.ifile
-parallel_framework = flags.parallel_framework
-task_scheduler = flags.schedule_tasks
-verbose = flags.verbose
-dry_run = flags.dryrun
-disable_pinning = flags.disable_pinning
-cilk_lowering = CilkLowering.strs2enums(parallel_framework)
-
-# display progress (unless doing dryrun or verbose)
+# What a sweep wrote
+@dataclass
+class SweepResult:
+    output_dir: str
+    results_file: str
+    quarantined: set = field(default_factory=set)
+    failed_runs: dict = field(default_factory=dict)
+    trace_file: str = None      # Trace of the phases, see trace_events
+
+# Raised when a sweep cannot go on, e.g. the cgroups of --isolate cannot be
+# created. main() exits with its message.
+class SweepError(Exception):
+    pass
+
+# Raises ValueError for combinations of options that are not supported
+def check_options(options):
+    import sentinel
+    import sweep_spec
+
+    if options.measure_icache and (options.order != "suffix" or options.num_samples != 1):
+        raise ValueError("--icache only supports --order suffix with --samples 1")
+    if options.budget is not None and options.order != "suffix":
+        raise ValueError("--budget runs one work unit at a time and only supports --order suffix")
+    if options.units is not None and options.order != "suffix":
+        raise ValueError("--spec runs one work unit at a time and only supports --order suffix")
+    if options.energy and options.measure_icache:
+        raise ValueError("--energy does not support --icache")
+    if options.status_line not in ["auto", "on", "off"]:
+        raise ValueError("status_line must be auto, on or off")
+    if options.sentinel is not None and options.sentinel not in sentinel.workloads:
+        raise ValueError(f"sentinel must be one of {', '.join(sentinel.workloads)}")
+    if options.sentinel_every < 1 or options.sentinel_threshold <= 0 or options.sentinel_requeue < 0:
+        raise ValueError("--sentinel_every must be at least 1, --sentinel_threshold positive and --sentinel_requeue not negative")
+    if options.size_sweep < 0 or options.size_factor <= 1:
+        raise ValueError("--size_sweep must be positive and --size_factor larger than 1")
+    if options.variant_rules not in sweep_spec.variant_rules:
+        raise ValueError(f"variant_rules must be one of {', '.join(sweep_spec.variant_rules)}")
+    runtime_config.resolve_allocators(options.allocators)
+    runtime_config.check_thp_modes(options.thp_modes)
+
+# Set by main() or run() from the options
+verbose = False
+dry_run = False
+
+# Span of a phase in the trace of the sweep, args are shown with it
+def trace(name, cat="harness", **args):
+    if cat != trace_events.cmd_cat:
+        progress.set_phase(name)
+    if tracer is None:
+        return contextlib.nullcontext(args)
+    return tracer.span(name, cat, **args)
+
+# display progress (unless doing dryrun or verbose, or the status line shows it)
 def showprogress(msg):
-    if dry_run or verbose:
+    if dry_run or verbose or status_line is not None:
         return
     sys.stderr.write(msg)
     sys.stderr.flush()
@@ -239,28 +487,82 @@ def dump_string(str, w, v):
     if(v):
         print(str)
 
+# Popen that keeps the resource usage of the shell and everything it waited
+# for.  ru_maxrss is then the peak RSS of the largest process in the tree.
+class RusagePopen(subprocess.Popen):
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            (pid, sts, self.rusage) = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            pid = self.pid
+            sts = 0
+        return (pid, sts)
+
+# Process groups of the commands running, killed when the harness is interrupted
+running_groups = set()
+
+def kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+# Kill every command still running (the --smoke jobs run in threads)
+def kill_running_commands():
+    for pgid in list(running_groups):
+        kill_group(pgid)
+
 # Run a command
 # Return status and message
-def runcmd(cmd, timeout, error_handler):
+# If stats is a dict, it is filled with the wall time, cpu time, peak rss,
+# decoded output, exit code and stderr of the command.
+def runcmd(cmd, timeout, error_handler, stats=None):
     if dry_run:
         dump_string("Command: " + cmd, 0, 1)
         return CmdStatus.CORRECT, "", "", ""
     else:
         dump_string("Command: " + cmd, 0, verbose)
 
-    p_process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    try:
-        outb, errb = p_process.communicate(timeout)
-        dump_string(outb.decode("utf-8"), 0, verbose)
-        dump_string(errb.decode("utf-8"), 1, verbose)
-        out = str(outb)
-        err = str(errb)
-        status, error_string = error_handler(p_process, out, err)
-        return status, error_string, out, errb
-    except subprocess.TimeoutExpired:
-        logging.warning("\nCompilation timed out\n")
-        p_process.kill()
-        return CmdStatus.TIMEOUT, "Timeout", "", ""
+    with trace("command", trace_events.cmd_cat, cmd=cmd):
+        start_time = time.time()
+        # In its own session so that everything the shell started is killed on
+        # timeout. The session does not get the Ctrl-C of the terminal, the
+        # group is killed when the harness is interrupted.
+        p_process = RusagePopen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        running_groups.add(p_process.pid)
+        try:
+            outb, errb = p_process.communicate(timeout=timeout)
+            if stats is not None:
+                stats["wall_time"] = time.time() - start_time
+                stats["returncode"] = p_process.returncode
+                stats["stderr"] = errb.decode("utf-8", "replace")
+                if p_process.rusage is not None:
+                    stats["user_time"] = p_process.rusage.ru_utime
+                    stats["sys_time"] = p_process.rusage.ru_stime
+                    stats["max_rss_kb"] = p_process.rusage.ru_maxrss
+                stats["log"] = outb.decode("utf-8", "replace") + errb.decode("utf-8", "replace")
+            dump_string(outb.decode("utf-8"), 0, verbose)
+            dump_string(errb.decode("utf-8"), 1, verbose)
+            out = str(outb)
+            err = str(errb)
+            status, error_string = error_handler(p_process, out, err)
+            return status, error_string, out, errb
+        except subprocess.TimeoutExpired:
+            logging.warning(f"\nCommand timed out after {timeout} seconds\n")
+            kill_group(p_process.pid)
+            p_process.communicate()
+            if stats is not None:
+                stats["wall_time"] = time.time() - start_time
+                stats["timed_out"] = True
+            return CmdStatus.TIMEOUT, "Timeout", "", ""
+        except BaseException:
+            # Ctrl-C, or SIGTERM (see main)
+            kill_running_commands()
+            raise
+        finally:
+            running_groups.discard(p_process.pid)
 
 
 
@@ -278,11 +580,48 @@ def run_error_handler(p_process, out, err):
     else:
         return CmdStatus.CORRECT, ""
 
+# Last non-empty line of the output of a command
+def last_line(text):
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return lines[-1][:200] if lines else ""
+
+# Classify a failed run from the stats filled by runcmd. Returns a dict with
+# the class, exit code, signal and the last line of stderr.
+def classify_failure(stats, data_path=None):
+    returncode = stats.get("returncode")
+    stderr = stats.get("stderr", "")
+    failure = {"class": FailureClass.EXIT, "exit_code": "", "signal": "", "detail": last_line(stderr)}
+
+    if stats.get("timed_out"):
+        failure["class"] = FailureClass.TIMEOUT
+        return failure
+    if returncode is None:
+        return failure
+    failure["exit_code"] = returncode
+
+    # The shell reports a child killed by signal N as 128+N
+    signum = None
+    if returncode < 0:
+        signum = -returncode
+    elif 128 < returncode <= 128 + 64:
+        signum = returncode - 128
+    if signum is not None:
+        failure["signal"] = signal.Signals(signum).name if signum in signal.valid_signals() else signum
+
+    if any(message in stderr for message in oom_messages) or signum == signal.SIGKILL or (stats.get("cgroup") or {}).get("oom_kill"):
+        # Nothing else sends SIGKILL to the benchmark but the OOM killer
+        failure["class"] = FailureClass.OOM
+    elif signum is not None:
+        failure["class"] = FailureClass.SIGNAL
+    elif (data_path and not os.path.exists(data_path)) or any(message in stderr for message in missing_dataset_messages):
+        failure["class"] = FailureClass.MISSING_DATASET
+    return failure
+
 
 # Returns list [1, 8, 16, ..., max_cores]
 # Returns [] if specified number of cores is invalid.
 def get_test_num_cores(specified_cores):
-    max_cores = multiprocessing.cpu_count()
+    max_cores = os.cpu_count()
     test_cores = []
     if specified_cores[0] != None:
         string_core = specified_cores[0].split(",")
@@ -339,58 +678,104 @@ def maybeRename(old, new):
 
 # generates an exe suffix for options.
 # Some combinations don't make sense, for those return False
-def makeExeSuffix(benchmark, sched, usergrain, fine, lowering):
-    if verbose:
-        print(benchmark, sched, usergrain, fine, lowering)
+# Is the combination one of the variants of the paper? (variant_rules builtin)
+def isPaperVariant(benchmark, sched, usergrain, fine, lowering):
     if benchmark == 'cilk5':
         if usergrain or fine:
-            return False, ''
+            return False
         if sched != 'PBBS':
-            return False, ''
+            return False
     elif benchmark == 'pbbs_v2':
         if sched == "OPENCILKDEFAULT_FINE":
             if lowering != CilkLowering.CilkPlus:
-                return False, ''
+                return False
             else:
                 if not fine:
-                    return False, ''
+                    return False
         if not (sched == 'DELEGATEPRCPRL' or sched == 'PBBS'):
             if usergrain:
-                return False, ''
+                return False
         if sched == 'PBBS':
             if fine:
-                return False, ''
+                return False
             if lowering in [CilkLowering.LazyD2, CilkLowering.LazyD0, CilkLowering.Nopoll]:
-                return False, ''
+                return False
         if lowering == CilkLowering.CilkPlus:
             if sched == 'DELEGATEPRC' or sched == 'DELEGATEPRCPRL':
-                return False, ''
+                return False
+    return True
+
+# Returns whether the variant is run and its suffix. With variant_rules none,
+# every combination is run.
+def makeExeSuffix(benchmark, sched, usergrain, fine, lowering, variant_rules="builtin"):
+    if verbose:
+        print(benchmark, sched, usergrain, fine, lowering)
+    if variant_rules == "builtin" and not isPaperVariant(benchmark, sched, usergrain, fine, lowering):
+        return False, ''
     suffix = f"{scheduler2suffix[sched]}{usergrain2suffix[usergrain]}{fine2suffix[fine]}{lowering2suffix[lowering]}"
     return True, suffix
 
-def compile_benchmark_cilk5(suffix, task_scheduler, noopt, finergrainsize, cilk_lowering, benchmark_obj, output_dir):
+# Returns the total size of the object files in objdir and the size of exename.
+# With objects, only those object files are counted (the directory holds the
+# objects of other programs).
+def get_artifact_sizes(objdir, exename, objects=None):
+    if dry_run:
+        return 0, 0
+    object_size = 0
+    if os.path.isdir(objdir):
+        for f in os.listdir(objdir):
+            if f.endswith(".o") and (objects is None or f in objects):
+                object_size += os.path.getsize(os.path.join(objdir, f))
+    binary_size = 0
+    if os.path.exists(exename):
+        binary_size = os.path.getsize(exename)
+    return object_size, binary_size
+
+# Save the output of the compiler
+def write_compiler_file(compiler_file_path, stats):
+    if dry_run or "log" not in stats:
+        return
+    with open(compiler_file_path, "w") as compiler_file:
+        compiler_file.write(stats["log"])
+
+def compile_benchmark_cilk5(suffix, task_scheduler, noopt, finergrainsize, cilk_lowering, benchmark_obj, output_dir, stats):
     name = benchmark_obj.benchmark_name+'_'+benchmark_obj.name
     dump_string("Compiling " + name, 0, verbose)
 
-    compiler_file_path = f"{output_dir}/{name}_compiler.txt"
+    # see if option we need it already there?
+    exename = f"{benchmark_obj.benchmark_name}/{benchmark_obj.binary}.{suffix}"
+    if os.path.exists(exename):
+        stats["cached"] = True
+        return CmdStatus.CORRECT, "", "Exists", ""
+
+    compiler_file_path = f"{output_dir}/{name}_{suffix}_compiler.txt"
     compile_cmd = f"./compile-cilk.sh {suffix} {benchmark_obj.name}"
 
-    return runcmd(compile_cmd, compilation_timeout, compile_error_handler);
+    compile_status, compiler_error, out, err = runcmd(compile_cmd, compilation_timeout, compile_error_handler, stats);
+    write_compiler_file(compiler_file_path, stats)
+    if compile_status == CmdStatus.CORRECT:
+        # cilk5/ holds every kernel, the objects of this one are its own and
+        # getoptions.o (see its Makefile)
+        stats["object_size"], stats["binary_size"] = get_artifact_sizes(benchmark_obj.benchmark_name, exename,
+                                                                         [f"{benchmark_obj.binary}.o", "getoptions.o"])
+    return compile_status, compiler_error, out, err
 
 # if exe already exists, leave it, otherwise compile
 # if options don't make sense, return success since we will never run it anyway
-def compile_benchmark_pbbs_v2(suffix, task_scheduler, noopt, finergrainsize, cilk_lowering, benchmark_obj, output_dir):
+def compile_benchmark_pbbs_v2(suffix, task_scheduler, noopt, finergrainsize, cilk_lowering, benchmark_obj, output_dir, stats):
     # executable path and name
     destdir = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}"
     exename = f"{destdir}/{benchmark_obj.binary}.{suffix}"
 
     # see if option we need it already there?
     if os.path.exists(exename):
+        stats["cached"] = True
         return CmdStatus.CORRECT, "", "Exists", ""
 
     goto_dir = f"cd {destdir}"
 
-    dump_string(f"Compiling {benchmark_obj.name.replace('/', '_')}", 0, verbose)
+    name = benchmark_obj.name.replace('/', '_')
+    dump_string(f"Compiling {name}", 0, verbose)
 
     compile_cmd = [goto_dir, "&& make clean &&"]
 
@@ -426,9 +811,11 @@ def compile_benchmark_pbbs_v2(suffix, task_scheduler, noopt, finergrainsize, cil
     compile_cmd.append("make")
     compileString = " ".join(compile_cmd)
 
-    compile_status, compiler_error, out, err = runcmd(compileString, compilation_timeout, compile_error_handler);
+    compile_status, compiler_error, out, err = runcmd(compileString, compilation_timeout, compile_error_handler, stats);
+    write_compiler_file(f"{output_dir}/{benchmark_obj.benchmark_name}_{name}_{suffix}_compiler.txt", stats)
     if compile_status == CmdStatus.CORRECT:
         maybeRename(f"{destdir}/{benchmark_obj.binary}", exename)
+        stats["object_size"], stats["binary_size"] = get_artifact_sizes(destdir, exename)
     return compile_status, compiler_error, out, err
 
 compileFunction = {
@@ -436,43 +823,164 @@ compileFunction = {
     "cilk5": compile_benchmark_cilk5,
 }
 
+# Write the compile time, peak memory and artifact sizes of one variant
+def write_compile_row(compile_csv_writer, benchmark_obj, iopt, compile_status, compiler_error, stats):
+    row = [""] * num_compile_cols
+    row[int(CompileColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
+    row[int(CompileColName.SUFFIX)] = iopt.extension
+    row[int(CompileColName.PARALLEL_FRAMEWORK)] = iopt.get_cilklowering_str()
+    row[int(CompileColName.TASK_SCHEDULER)] = iopt.task_scheduler
+    row[int(CompileColName.PFORMAXGRAINSIZE)] = 8 if iopt.finergrainsize == 1 else 2048
+    row[int(CompileColName.IGNORE_USER_PFORGAINSIZE)] = "Yes" if iopt.noopt == 1 else "No"
+    row[int(CompileColName.STATUS)] = "Cached" if stats.get("cached") else CmdStatus.asString(compile_status)
+    row[int(CompileColName.COMPILE_TIME)] = format(stats["wall_time"], '.3f') if "wall_time" in stats else ""
+    row[int(CompileColName.USER_TIME)] = format(stats["user_time"], '.3f') if "user_time" in stats else ""
+    row[int(CompileColName.SYS_TIME)] = format(stats["sys_time"], '.3f') if "sys_time" in stats else ""
+    row[int(CompileColName.PEAK_RSS)] = stats.get("max_rss_kb", "")
+    row[int(CompileColName.OBJECT_SIZE)] = stats.get("object_size", "")
+    row[int(CompileColName.BINARY_SIZE)] = stats.get("binary_size", "")
+    row[int(CompileColName.ERROR_MSG)] = compiler_error
+    compile_csv_writer.writerow(row)
+
+# Write the wall time of one phase (compile, datagen, run or verify)
+def write_timing_row(benchmark_obj, data_set, suffix, num_cores, phase, wall):
+    if timing_csv_writer is None or dry_run:
+        return
+    timing_csv_writer.writerow([benchmark_obj.name + "/" + benchmark_obj.binary, data_set, suffix, num_cores, phase, format(wall, '.3f')])
+
+# Compile one variant of the benchmark
+def compile_variant(benchmark_obj, iopt, output_dir, compile_csv_writer):
+    cfunc = compileFunction[benchmark_obj.benchmark_name]
+    stats = {}
+    with trace("compile", benchmark=benchmark_obj.name, suffix=iopt.extension) as args:
+        compile_status, compiler_error, out, err = cfunc(iopt.extension,
+                                                         iopt.task_scheduler,
+                                                         iopt.noopt,
+                                                         iopt.finergrainsize,
+                                                         iopt.cilk_lowering,
+                                                         benchmark_obj,
+                                                         output_dir,
+                                                         stats)
+        args["status"] = "Cached" if stats.get("cached") else CmdStatus.asString(compile_status)
+    write_compile_row(compile_csv_writer, benchmark_obj, iopt, compile_status, compiler_error, stats)
+    progress.record_compile(stats.get("wall_time"), compile_status == CmdStatus.CORRECT)
+    if not stats.get("cached") and "wall_time" in stats:
+        write_timing_row(benchmark_obj, "", iopt.extension, "", "compile", stats["wall_time"])
+    return compile_status, compiler_error, out, err
+
 # Helper to compile benchmark. Returns 1 on success and 0 on error. Also returns
 # simplified error string, which is "" if timeout or no error.
 # if everything works, we only return LAST status, error, out, err
-def compile_benchmark(options, benchmark_obj, output_dir):
+def compile_benchmark(options, benchmark_obj, output_dir, compile_csv_writer):
     compile_status, compiler_error, out, err = CmdStatus.CORRECT, "never executed", "", ""
-    for sched in options.task_scheduler:
-        for noopt in options.noopt:
-            for finergrainsize in options.finergrainsize:
-                for cilk_lowering in options.cilk_lowering:
-                    valid, suffix = makeExeSuffix(benchmark_obj.benchmark_name, sched, noopt, finergrainsize, cilk_lowering)
-                    if not valid:
-                        # print(f"COMP Skipping {benchmark_obj.benchmark_name}, {sched}, {noopt}, {finergrainsize}, {cilk_lowering}")
-                        continue
-                    else:
-                        # print(f"COMP          {benchmark_obj.benchmark_name}, {sched}, {noopt}, {finergrainsize}, {cilk_lowering}")
-                        pass
-                    cfunc = compileFunction[benchmark_obj.benchmark_name]
-                    compile_status, compiler_error, out, err = cfunc(suffix,
-                                                                     sched,
-                                                                     noopt,
-                                                                     finergrainsize,
-                                                                     cilk_lowering,
-                                                                     benchmark_obj,
-                                                                     output_dir)
-                    if compile_status != CmdStatus.CORRECT:
-                        return compile_status, compiler_error, out, err
-                    showprogress(f"Compiled-{suffix}:")
+    for iopt in get_suffixes(benchmark_obj, options):
+        compile_status, compiler_error, out, err = compile_variant(benchmark_obj, iopt, output_dir, compile_csv_writer)
+        if compile_status != CmdStatus.CORRECT:
+            return compile_status, compiler_error, out, err
+        showprogress(f"Compiled-{iopt.extension}:")
     return compile_status, compiler_error, out, err
 
 # Helper to create test file
-def create_testfile(benchmark_obj, input_file):
+def create_testfile(options, benchmark_obj, input_file):
     # test_cmd is the command to test the correctness of the benchmark.
     goto_dir =  "cd " + benchmark_obj.benchmark_name + "/" + benchmark_obj.name
     goto_dir_test = goto_dir + "/../" + benchmark_obj.data_dir + "/data/"
     test_cmd = goto_dir_test + " && pwd && make " + input_file
 
-    return runcmd(test_cmd, check_benchmark_timout, run_error_handler);
+    with trace("datagen", benchmark=benchmark_obj.name, dataset=input_file):
+        return runcmd(test_cmd, options.datagen_timeout, run_error_handler);
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Create the data set of a pbbs_v2 benchmark if missing, and convert it with
+# --binary_inputs. Returns False if it could not be created.
+def ensure_dataset(options, benchmark_obj, data_set):
+    # Used to determine when data set name should be written to csv file.
+    # Path from benchmark directory.
+    data_path = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}/../{benchmark_obj.data_dir}/data/{data_set}"
+    partial_path = data_path + partial_suffix
+    if benchmark_obj.benchmark_name == "pbbs_v2" and os.path.exists(partial_path) and not dry_run:
+        # The generation of an earlier sweep was interrupted
+        dump_string(f"Data set {data_set} is incomplete, creating it again\n", 1, verbose)
+        remove_file(data_path)
+    if not os.path.isfile(data_path) and (benchmark_obj.benchmark_name == "pbbs_v2") :
+        dump_string("No data set: " + data_set + " Creating test file", 0, verbose)
+
+        start_time = time.time()
+        if not dry_run:
+            open(partial_path, "w").close()
+        create_status, message, out, err =  create_testfile(options, benchmark_obj, data_set)
+        if create_status != CmdStatus.CORRECT:
+            logging.warning("Failed to create test")
+            if not dry_run:
+                remove_file(data_path)
+                remove_file(partial_path)
+            return False
+        if not dry_run:
+            remove_file(partial_path)
+        write_timing_row(benchmark_obj, data_set, "", "", "datagen", time.time() - start_time)
+        showprogress(f"data:{data_set}")
+    if options.binary_inputs and benchmark_obj.benchmark_name == "pbbs_v2" and not dry_run:
+        convert_dataset(benchmark_obj, data_set, data_path)
+    return True
+
+# Convert the data set into the binary format of the suite once, the text
+# input is used if it cannot be converted
+def convert_dataset(benchmark_obj, data_set, data_path):
+    import dataset_cache
+
+    if dataset_cache.lookup(data_path):
+        return
+    start_time = time.time()
+    data_dir = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}/../{benchmark_obj.data_dir}"
+    with trace("convert", benchmark=benchmark_obj.name, dataset=data_set):
+        bin_path, message = dataset_cache.convert(data_path, data_dir)
+    if bin_path is None:
+        dump_string(f"Not converting {data_set}: {message}\n", 0, verbose)
+        return
+    write_timing_row(benchmark_obj, data_set, "", "", "convert", time.time() - start_time)
+    showprogress(f"bin:{data_set}")
+
+# Input of a pbbs_v2 run: the option of the binary to read it, its path from
+# the harness directory and its path from the benchmark directory. With
+# --binary_inputs, the converted input if it is up to date and the binary
+# lists the option to read it. With --stage_dir, the copy in memory.
+def resolve_input(options, benchmark_obj, suffix, input_file):
+    import dataset_cache
+    import dataset_staging
+
+    bench_dir = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}"
+    option = ""
+    arg_path = f"../{benchmark_obj.data_dir}/data/{input_file}"
+    if dry_run:
+        return option, f"{bench_dir}/{arg_path}", arg_path
+
+    if options.binary_inputs:
+        binary_input = dataset_cache.binary_input(f"{bench_dir}/{arg_path}")
+        if binary_input is not None and dataset_cache.accepts_option(f"{bench_dir}/{benchmark_obj.binary}.{suffix}", binary_input[1]):
+            option = binary_input[1]
+            arg_path = f"../{benchmark_obj.data_dir}/data/{dataset_cache.cache_dir_name}/{os.path.basename(binary_input[0])}"
+    path = f"{bench_dir}/{arg_path}"
+
+    if stager is not None and os.path.isfile(path):
+        with trace("stage", dataset=input_file) as args:
+            staged_path = stager.stage(path)
+            args["staged"] = staged_path is not None
+        if staged_path is None:
+            # Does not fit in the budget, at least read it ahead
+            dataset_staging.prewarm(path)
+        else:
+            path = arg_path = staged_path
+    return option, path, arg_path
+
+# Input argument of a pbbs_v2 run, from the benchmark directory
+def get_input_arg(options, benchmark_obj, suffix, input_file):
+    option, path, arg_path = resolve_input(options, benchmark_obj, suffix, input_file)
+    return f"{option} {arg_path}" if option else arg_path
 
 
 # Get the load average over the last 1 minutes
@@ -480,27 +988,112 @@ def load_avg():
     load1, load5, load15 = os.getloadavg()
     return load1;
 
+# Parse the runtime counters (see sched_stat_names) from the output of a run.
+# Counters of the same name are summed over the iterations.
+def parse_sched_stats(out, sched_stats):
+    for line in str(out).split('\\n'):
+        line_split = line.split(",")
+        if len(line_split) < 3 or line_split[0].strip() != "-1":
+            continue
+        name = line_split[1].strip()
+        if name not in sched_stat_names:
+            continue
+        try:
+            value = float(line_split[2])
+        except ValueError:
+            continue
+        metric = sched_stat_names[name]
+        sched_stats[metric] = sched_stats.get(metric, 0) + value
+
+    set_avg_work_size(sched_stats)
+
+def set_avg_work_size(sched_stats):
+    if sched_stats.get("STEALS", 0) > 0 and "WORK_SIZE" in sched_stats:
+        sched_stats["AVG_WORK_SIZE"] = sched_stats["WORK_SIZE"] / sched_stats["STEALS"]
+
+# Add the counters of a run that passed to those of its cell
+def merge_sched_stats(sched_stats, run_sched_stats):
+    for metric, value in run_sched_stats.items():
+        if metric != "AVG_WORK_SIZE":
+            sched_stats[metric] = sched_stats.get(metric, 0) + value
+    set_avg_work_size(sched_stats)
+
 # Helper to run the benchmark. Returns run status of benchmark. If the run
 # is successful, the execution time is returned. Otherwise, None is returned.
-def run_benchmark(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file):
+# If sched_stats is a dict, it is filled with the runtime counters.
+# If profile_file is given, the benchmark runs under perf record which writes
+# the profile to profile_file.
+# If stats is a dict, it is filled by runcmd (see classify_failure), and with
+# the energy of the run with --energy.
+# variant is the CompilerOptions of the run, for its allocator and THP mode.
+# With cpus, the run is restricted to those cpus.
+# Set the THP mode of the variant system-wide when it is set that way, and
+# the mode of the system before the sweep for a run in the system mode
+def apply_thp(variant):
+    thp = variant.thp if variant is not None else None
+    system_thp = runtime_config.get_run_prefix(None, thp, original_thp)[2]
+    if system_thp is not None and not dry_run:
+        runtime_config.set_system_thp(system_thp)
+
+def run_benchmark(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file, sched_stats=None, profile_file=None, stats=None, variant=None, cpus=None):
+    import cgroup_isolation
+    import energy
+
     # Before executing the code, busy wait until /proc/loadavg is below than 1
     loadctr = 0;
     waitload = lazy_benchmark_options.wait_load
-    while load_avg() > waitload:
-        time.sleep(1)
-        dump_string("Waiting for laod_avg to go below %d\n" % (waitload), 0, verbose)
+    if load_avg() > waitload:
+        with trace("wait_load", load=load_avg()):
+            while load_avg() > waitload:
+                time.sleep(1)
+                dump_string("Waiting for laod_avg to go below %d\n" % (waitload), 0, verbose)
 
     load1, load5, load15 = os.getloadavg()
     dump_string("Load average : the last 1 minutes: " + str(load1) + " the last 5 minutes: " + str(load5) + " the last 15 minutes: " + str(load15) + "\n", 0, verbose)
 
-    if benchmark_obj.benchmark_name == "pbbs_v2":
-        return run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file);
-    elif benchmark_obj.benchmark_name == "cilk5":
-        return run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file);
-    else:
-        assert(0);
+    apply_thp(variant)
+    allocator, thp = (variant.allocator, variant.thp) if variant is not None else (None, None)
+    env, wrapper, system_thp = runtime_config.get_run_prefix(allocator, thp, original_thp)
+
+    leaf = None
+    cgroup_prefix = ""
+    if isolation is not None and not dry_run:
+        leaf = isolation.create_run_leaf(num_cores, cpus)
+        cgroup_prefix = isolation.prefix(leaf)
+    elif cpus is not None:
+        wrapper = f"taskset -c {cgroup_isolation.format_cpus(cpus)} {wrapper}".strip()
+    runtime = (env, wrapper, cgroup_prefix)
+
+    meter = None
+    if energy_domains and stats is not None and not dry_run:
+        meter = energy.EnergyMeter(energy_domains)
+        meter.start()
+
+    with trace("profile_run" if profile_file else "run", benchmark=benchmark_obj.name, dataset=input_file, cores=num_cores,
+               variant=variant.variant if variant is not None else suffix):
+        if benchmark_obj.benchmark_name == "pbbs_v2":
+            result = run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file, sched_stats, profile_file, stats, runtime);
+        elif benchmark_obj.benchmark_name == "cilk5":
+            result = run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file, sched_stats, profile_file, stats, runtime);
+        else:
+            assert(0);
+
+    if meter is not None:
+        stats["energy"] = meter.stop()
 
-def run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file):
+    if leaf is not None:
+        if stats is not None:
+            stats["cgroup"] = isolation.read_stats(leaf)
+        isolation.remove_leaf(leaf)
+    return result
+
+# perf record command used by --profile
+def get_profile_cmd(lazy_benchmark_options, profile_file):
+    return f"perf record -q -e cpu-clock -F {lazy_benchmark_options.profile_freq} -g -o {os.path.abspath(profile_file)}"
+
+# runtime is the (environment, wrapper) of the allocator and THP mode of the
+# run and the command that moves it into its cgroup
+def run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file, sched_stats=None, profile_file=None, stats=None, runtime=("", "", "")):
     nv = lazy_benchmark_options.nv
 
     # run_cmd is the commmand to run the benchmark.
@@ -513,11 +1106,14 @@ def run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores
     icache_cmd = ""
     if (lazy_benchmark_options.measure_icache):
         icache_cmd = "perf stat -x, -e icache.misses,icache.hit"
+    if profile_file:
+        icache_cmd = get_profile_cmd(lazy_benchmark_options, profile_file)
 
-    binary = f"NAIVE_MAPPING={nv} CILK_NWORKERS={num_cores} {numa_cmd} {icache_cmd}  ./{benchmark_obj.binary}.{suffix}"
+    runtime_env, runtime_wrapper, cgroup_prefix = runtime
+    binary = f"NAIVE_MAPPING={nv} CILK_NWORKERS={num_cores} {runtime_env} {runtime_wrapper} {numa_cmd} {icache_cmd}  ./{benchmark_obj.binary}.{suffix}"
 
     arguments = input_file + " " + str(lazy_benchmark_options.num_tests)
-    run_cmd = goto_dir + " && " + binary + " " + arguments
+    run_cmd = cgroup_prefix + goto_dir + " && " + binary + " " + arguments
 
     # Displays command being run from the perspective of the benchmark directory.
     res_time = []
@@ -526,7 +1122,7 @@ def run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores
 
     # The benchmark may have a bug causing an infinite loop. The process
     # is killed after a timeout time to move on to other tests.
-    status, status_str, out, err = runcmd(run_cmd, check_benchmark_timout, run_error_handler);
+    status, status_str, out, err = runcmd(run_cmd, lazy_benchmark_options.run_timeout, run_error_handler, stats);
     if(status == CmdStatus.INCORRECT):
         return CmdStatus.INCORRECT, None
     elif (status == CmdStatus.TIMEOUT):
@@ -540,12 +1136,15 @@ def run_benchmark_cilk5(lazy_benchmark_options, suffix, benchmark_obj, num_cores
         pbbs_time_str_elem_split = pbbs_time_str_elem.split(":")[1]
         res_time.append(float(pbbs_time_str_elem_split))
 
+    if(lazy_benchmark_options.measure_promotedtask and sched_stats is not None):
+        parse_sched_stats(out, sched_stats)
+
     end_time = time.time()
     dump_string(res_time, 0, verbose)
 
     return CmdStatus.CORRECT, res_time
 
-def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file):
+def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cores, output_file, input_file, sched_stats=None, profile_file=None, stats=None, runtime=("", "", "")):
     # directory where we run benchmark
     gotodir = f"cd {benchmark_obj.benchmark_name}/{benchmark_obj.name}"
 
@@ -556,19 +1155,23 @@ def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cor
            f"NAIVE_MAPPING={nv}",
            f"CILK_NWORKERS={num_cores}",
            "LD_LIBRARY_PATH=../../../opencilk/cheetah/build/lib/x86_64-unknown-linux-gnu/",
+           runtime[0],
+           runtime[1],
            "" if lazy_benchmark_options.disable_numa else "numactl --interleave=all"
            ]
 
     # add icache perf if needed
-    if lazy_benchmark_options.measure_icache:
+    if profile_file:
+        cmd.append(get_profile_cmd(lazy_benchmark_options, profile_file))
+    elif lazy_benchmark_options.measure_icache:
         cmd.append("perf stat -x, -e icache.misses,icache.hit")
 
     # actually binary we are testing
     cmd.append(f"./{benchmark_obj.binary}.{suffix}")
 
     # add benchmark arguments
-    cmd.extend(["-o", output_file, "-r", str(lazy_benchmark_options.num_tests), f"../{benchmark_obj.data_dir}/data/{input_file}"])
-    cmdstr = " ".join(cmd)
+    cmd.extend(["-o", output_file, "-r", str(lazy_benchmark_options.num_tests), get_input_arg(lazy_benchmark_options, benchmark_obj, suffix, input_file)])
+    cmdstr = runtime[2] + " ".join(cmd)
 
     # Remove old output file and create new one.
     os.system(f"{gotodir} && touch {output_file}")
@@ -578,7 +1181,7 @@ def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cor
     for iteration in range(n_iteration):
         # The benchmark may have a bug causing an infinite loop. The process
         # is killed after a timeout time to move on to other tests.
-        status, status_str, out, err = runcmd(cmdstr, check_benchmark_timout, run_error_handler)
+        status, status_str, out, err = runcmd(cmdstr, lazy_benchmark_options.run_timeout, run_error_handler, stats)
         if(status == CmdStatus.INCORRECT):
             return CmdStatus.INCORRECT, None
         elif (status == CmdStatus.TIMEOUT):
@@ -593,7 +1196,7 @@ def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cor
             if("Parlay time" in pbbs_time_str_elem_split[0]):
                 res_time.append(float(pbbs_time_str_elem_split[1]))
 
-        if(lazy_benchmark_options.measure_icache):
+        if(lazy_benchmark_options.measure_icache and not profile_file):
             pbbs_icache_str = str(err.decode("utf-8"))
             pbbs_icache_str_arr = pbbs_icache_str.splitlines()
             pbbs_icache_str_split = [s for s in pbbs_icache_str_arr if "icache" in s];
@@ -601,20 +1204,8 @@ def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cor
                 pbbs_icache_str_elem_split = pbbs_icache_str_elem.split(",")
                 res_time.append(float(pbbs_icache_str_elem_split[0]))
 
-        if(lazy_benchmark_options.measure_promotedtask):
-            pbbs_icache_str = str(out)
-            pbbs_icache_str_arr = pbbs_icache_str.split('\\n')
-            pbbs_icache_str_split = [s for s in pbbs_icache_str_arr if "-1," in s];
-
-            for pbbs_icache_str_elem in pbbs_icache_str_split:
-                pbbs_icache_str_elem_split = pbbs_icache_str_elem.split(",")
-
-                if("number of success push_workctx" in pbbs_icache_str_elem_split[1]):
-                    res_time.append(float(pbbs_icache_str_elem_split[2]))
-                elif("work size" in pbbs_icache_str_elem_split[1]):
-                    res_time.append(float(pbbs_icache_str_elem_split[2]))
-                elif("number of total tasks" in pbbs_icache_str_elem_split[1]):
-                    res_time.append(float(pbbs_icache_str_elem_split[2]))
+        if(lazy_benchmark_options.measure_promotedtask and sched_stats is not None):
+            parse_sched_stats(out, sched_stats)
 
 
     end_time = time.time()
@@ -624,12 +1215,13 @@ def run_benchmark_pbbs_v2(lazy_benchmark_options, suffix, benchmark_obj, num_cor
 
 # Helper to run the benchmark. Run status is returned.
 def run_check_benchmark(lazy_benchmark_options, benchmark_obj, output_file, input_file):
-    if benchmark_obj.benchmark_name == "pbbs_v2":
-        return run_check_benchmark_pbbs_v2(lazy_benchmark_options, benchmark_obj, output_file, input_file);
-    elif benchmark_obj.benchmark_name == "cilk5":
-        return run_check_benchmark_cilk5(lazy_benchmark_options, benchmark_obj, output_file, input_file);
-    else:
-        assert(0);
+    with trace("verify", benchmark=benchmark_obj.name, dataset=input_file):
+        if benchmark_obj.benchmark_name == "pbbs_v2":
+            return run_check_benchmark_pbbs_v2(lazy_benchmark_options, benchmark_obj, output_file, input_file);
+        elif benchmark_obj.benchmark_name == "cilk5":
+            return run_check_benchmark_cilk5(lazy_benchmark_options, benchmark_obj, output_file, input_file);
+        else:
+            assert(0);
 
 def run_check_benchmark_cilk5(lazy_benchmark_options, benchmark_obj, output_file, input_file):
     # TODO: Do something with this
@@ -644,193 +1236,1426 @@ def run_check_benchmark_pbbs_v2(lazy_benchmark_options, benchmark_obj, output_fi
     arguments_test = "../" + benchmark_obj.data_dir + "/data/" + input_file + " " + "../../" + benchmark_obj.name + "/" + output_file
     test_cmd = goto_dir_test + " && pwd && " + binary_test + " " + arguments_test
 
-    return runcmd(test_cmd, check_benchmark_timout, run_error_handler)
-
-# options are overall options
-# iopt is the compiler options we are using for this run
-def execute_benchmark(benchmark_obj, options, iopt, csv_writer, csv_file, test_cores, data_set):
-    numTests = options.num_tests
-    for num_cores in test_cores:
-        row = [""] * (num_cols + numTests*n_iteration - 1)
+    return runcmd(test_cmd, lazy_benchmark_options.check_timeout, run_error_handler)
+
+# Write the runtime counters of one run next to its mean time
+def write_sched_row(sched_csv_writer, row, run_time, sched_stats):
+    sched_row = [""] * len(sched_file_categories)
+    sched_row[int(SchedColName.BENCHMARK)] = row[int(ColName.BENCHMARK)]
+    sched_row[int(SchedColName.DATASET)] = row[int(ColName.DATASET)]
+    sched_row[int(SchedColName.NUM_CORES)] = row[int(ColName.NUM_CORES)]
+    sched_row[int(SchedColName.STATUS)] = row[int(ColName.STATUS)]
+    sched_row[int(SchedColName.PARALLEL_FRAMEWORK)] = row[int(ColName.PARALLEL_FRAMEWORK)]
+    sched_row[int(SchedColName.TASK_SCHEDULER)] = row[int(ColName.TASK_SCHEDULER)]
+    sched_row[int(SchedColName.PFORMAXGRAINSIZE)] = row[int(ColName.PFORMAXGRAINSIZE)]
+    sched_row[int(SchedColName.IGNORE_USER_PFORGAINSIZE)] = row[int(ColName.IGNORE_USER_PFORGAINSIZE)]
+    # The counters are summed over every round of every sample, they are
+    # stored per round like TIME.  AVG_WORK_SIZE is already a ratio.
+    rounds = len(run_time) if run_time else 1
+    if run_time:
+        sched_row[int(SchedColName.TIME)] = sum(run_time)/len(run_time)
+    for i, metric in enumerate(sched_stat_metrics):
+        value = sched_stats.get(metric, "")
+        if value != "" and metric != "AVG_WORK_SIZE":
+            value = value / rounds
+        sched_row[int(SchedColName.STATS) + i] = value
+    sched_csv_writer.writerow(sched_row)
+
+# Is the (benchmark, dataset, cores) cell selected by --profile?
+def should_profile(options, benchmark_obj, data_set, num_cores):
+    if options.profile_cells is None:
+        return False
+    if options.profile_cells == []:
+        return True
+    for cell in options.profile_cells:
+        patterns = cell.split(":")
+        values = [benchmark_obj.name, data_set, str(num_cores)]
+        if all(fnmatch.fnmatch(value, pattern) for value, pattern in zip(values, patterns)):
+            return True
+    return False
+
+# Rerun a cell under perf record. The folded stacks are stored in
+# profile_dir/<cell>__<suffix>.folded and the raw profile is gzip compressed.
+def profile_benchmark(options, iopt, benchmark_obj, num_cores, output_file, data_set):
+    import perf_profile
+
+    if not dry_run:
+        os.makedirs(options.profile_dir, exist_ok=True)
+    cell = f"{benchmark_obj.name}__{data_set.strip()}__{num_cores}".replace('/', '-').replace(' ', '_')
+    profile_file = f"{options.profile_dir}/{cell}__{iopt.variant}.perf.data"
+    folded_file = f"{options.profile_dir}/{cell}__{iopt.variant}.folded"
+
+    run_status, run_time = run_benchmark(options, iopt.extension, benchmark_obj, num_cores, output_file, data_set, None, profile_file, variant=iopt)
+    if dry_run:
+        return run_status
+    if run_status != CmdStatus.CORRECT or not os.path.exists(profile_file):
+        logging.warning(f"Profiling {cell} {iopt.variant} failed")
+        return run_status
+
+    with trace("fold_profile", benchmark=benchmark_obj.name, dataset=data_set, cores=num_cores, variant=iopt.variant):
+        folded = perf_profile.fold_and_compress(profile_file, folded_file)
+    dump_string(f"Profile: {folded_file} ({sum(folded.values())} samples)", 0, verbose)
+    showprogress(",profiled")
+    return run_status
+
+# Returns a results row for a variant/cell with room for num_values values
+def make_result_row(benchmark_obj, options, iopt, data_set, num_cores, num_values):
+    row = [""] * (num_cols + num_values - 1)
+    row[int(ColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
+    row[int(ColName.COMPILES)] = "Yes"
+    row[int(ColName.DATASET)] = data_set
+    row[int(ColName.NUM_CORES)] = num_cores
+    row[int(ColName.DISABLE_NUMA)] = "No"
+    if(options.disable_numa):
+        row[int(ColName.DISABLE_NUMA)] = "Yes"
+    row[int(ColName.PARALLEL_FRAMEWORK)] = iopt.get_cilklowering_str()
+    row[int(ColName.TASK_SCHEDULER)] = iopt.task_scheduler
+    row[int(ColName.PFORMAXGRAINSIZE)] = 2048
+    if(iopt.finergrainsize == 1):
+        row[int(ColName.PFORMAXGRAINSIZE)] = 8
+    row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "No"
+    if(iopt.noopt == 1):
+        row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "Yes"
+    row[int(ColName.ALLOCATOR)] = iopt.allocator
+    row[int(ColName.THP)] = iopt.thp if iopt.thp is not None else "system"
+    return row
+
+# Record the position and start time of every round of a sample
+def write_sample_rows(sample_csv_writer, options, benchmark_obj, iopt, data_set, num_cores, sample, position, timestamp, run_status, run_time):
+    if sample_csv_writer is None:
+        return
+    rounds = run_time if run_time else ['N/A']
+    for i, res in enumerate(rounds):
+        sample_row = [""] * len(sample_file_categories)
+        sample_row[int(SampleColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
+        sample_row[int(SampleColName.DATASET)] = data_set
+        sample_row[int(SampleColName.NUM_CORES)] = num_cores
+        sample_row[int(SampleColName.SUFFIX)] = iopt.variant
+        sample_row[int(SampleColName.ORDER)] = options.order
+        sample_row[int(SampleColName.SAMPLE)] = sample
+        sample_row[int(SampleColName.POSITION)] = position
+        sample_row[int(SampleColName.TIMESTAMP)] = format(timestamp, '.3f')
+        sample_row[int(SampleColName.ROUND)] = i
+        sample_row[int(SampleColName.STATUS)] = get_run_status_str(run_status)
+        sample_row[int(SampleColName.TIME)] = res
+        sample_csv_writer.writerow(sample_row)
+
+# Warn about, or abort on, a machine state that deviates from the pinned profile
+def check_env(options, deviations, where):
+    if not deviations:
+        return
+    dump_string(f"Machine state of {where} deviates from the pinned profile: " + "; ".join(deviations), 1, 1)
+    if options.env_action == "abort":
+        raise SweepError("Aborting: machine state deviates from the pinned profile")
 
-        # Create a function for this
-        if(options.measure_icache):
-            row = [""] * (num_cols + (numTests+2)*n_iteration - 1)
+# Record the machine state sampled before and during a run
+def write_env_row(env_csv_writer, benchmark_obj, iopt, data_set, num_cores, position, state, freqs, throttle_delta, deviations, input_state=None):
+    if env_csv_writer is None:
+        return
+    env_row = [""] * len(env_file_categories)
+    env_row[int(EnvColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
+    env_row[int(EnvColName.DATASET)] = data_set
+    env_row[int(EnvColName.NUM_CORES)] = num_cores
+    env_row[int(EnvColName.SUFFIX)] = iopt.variant
+    env_row[int(EnvColName.POSITION)] = position
+    env_row[int(EnvColName.GOVERNOR)] = state["governor"]
+    env_row[int(EnvColName.TURBO)] = state["turbo"]
+    env_row[int(EnvColName.SMT)] = state["smt"]
+    env_row[int(EnvColName.THP)] = state["thp"]
+    for col, freq in zip([EnvColName.FREQ_MIN, EnvColName.FREQ_MEAN, EnvColName.FREQ_MAX], freqs):
+        env_row[int(col)] = format(freq, '.0f') if freq is not None else ""
+    env_row[int(EnvColName.THROTTLE_DELTA)] = throttle_delta if throttle_delta is not None else ""
+    env_row[int(EnvColName.DEVIATIONS)] = "; ".join(deviations)
+    if input_state is not None:
+        env_row[int(EnvColName.INPUT_STAGED)] = "Yes" if input_state[0] else "No"
+        env_row[int(EnvColName.INPUT_RESIDENCY)] = format(input_state[1], '.1f') if input_state[1] is not None else ""
+    env_csv_writer.writerow(env_row)
+
+def write_failure_row(benchmark_obj, iopt, data_set, num_cores, sample, attempt, failure, action):
+    if failure_csv_writer is None:
+        return
+    failure_csv_writer.writerow([benchmark_obj.name + "/" + benchmark_obj.binary, data_set, num_cores, iopt.variant, sample, attempt,
+                                 failure["class"], failure["exit_code"], failure["signal"], action, failure["detail"]])
 
-        if(options.measure_promotedtask):
-            row = [""] * (num_cols + (numTests+3)*n_iteration - 1)
+# Record what the cgroup of a run accounted
+def write_cgroup_row(benchmark_obj, iopt, data_set, num_cores, sample, attempt, cgroup_stats):
+    if cgroup_csv_writer is None or cgroup_stats is None:
+        return
+    def usec(value):
+        return format(value / 1e6, '.3f') if value is not None else ""
+    cgroup_csv_writer.writerow([benchmark_obj.name + "/" + benchmark_obj.binary, data_set, num_cores, iopt.variant, sample, attempt,
+                                cgroup_stats["cpus"], usec(cgroup_stats["usage_usec"]), usec(cgroup_stats["user_usec"]),
+                                usec(cgroup_stats["system_usec"]), usec(cgroup_stats["throttled_usec"]), usec(cgroup_stats["pressure_usec"]),
+                                cgroup_stats["memory_peak"] if cgroup_stats["memory_peak"] is not None else "",
+                                cgroup_stats["oom_kill"] if cgroup_stats["oom_kill"] is not None else ""])
+
+# Record the energy of a run, status being Correct or the class of its failure
+def write_energy_row(options, benchmark_obj, iopt, data_set, num_cores, sample, attempt, status, run_time, run_energy):
+    import energy
+
+    if energy_csv_writer is None or run_energy is None:
+        return
+    joules, wall = run_energy
+    kinds = energy.split_kinds(joules)
+    total = sum(joules.values())
+    row = make_result_row(benchmark_obj, options, iopt, data_set, num_cores, 0)
+    rounds = run_time if run_time else []
+    def fmt(value):
+        return format(value, '.3f') if value is not None else ""
+    energy_csv_writer.writerow([row[int(ColName.BENCHMARK)], data_set, num_cores, iopt.variant, row[int(ColName.PARALLEL_FRAMEWORK)],
+                                row[int(ColName.TASK_SCHEDULER)], row[int(ColName.PFORMAXGRAINSIZE)], row[int(ColName.IGNORE_USER_PFORGAINSIZE)],
+                                row[int(ColName.ALLOCATOR)], row[int(ColName.THP)], sample, attempt, status, len(rounds),
+                                format(sum(rounds), '.4f') if rounds else "", format(wall, '.3f'), fmt(kinds["package"]), fmt(kinds["dram"]),
+                                fmt(total), format(total / wall, '.2f') if wall > 0 else ""])
+
+# Count a run of the variant that failed after its retries. Returns True if
+# the variant is now quarantined.
+def note_failed_run(options, benchmark_obj, iopt):
+    variant = (benchmark_obj.name + "/" + benchmark_obj.binary, iopt.variant)
+    options.failed_runs[variant] = options.failed_runs.get(variant, 0) + 1
+    if options.failed_runs[variant] < options.quarantine_after or variant in options.quarantined:
+        return False
+    options.quarantined.add(variant)
+    progress.record_quarantine()
+    print(f"\nQuarantined {variant[0]} {variant[1]}: failed {options.failed_runs[variant]} runs")
+    logging.warning(f"Quarantined {variant[0]} {variant[1]}")
+    return True
+
+# Run the benchmark and verify its output.  A run that failed for a
+# transient reason (see FailureClass) is retried with exponential backoff.
+# Returns the run status, the times of the rounds and the failure of the
+# last attempt (None if it succeeded).
+def run_with_retries(options, iopt, benchmark_obj, num_cores, data_set, sched_stats, sample, output_file):
+    data_path = None
+    if benchmark_obj.benchmark_name == "pbbs_v2":
+        data_path = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}/../{benchmark_obj.data_dir}/data/{data_set}"
 
-        row[int(ColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
-        row[int(ColName.COMPILES)] = "Yes"
-        row[int(ColName.DATASET)] = data_set
-        row[int(ColName.NUM_CORES)] = num_cores
-        row[int(ColName.DISABLE_NUMA)] = "No"
-        if(options.disable_numa):
-            row[int(ColName.DISABLE_NUMA)] = "Yes"
-        row[int(ColName.PARALLEL_FRAMEWORK)] = iopt.get_cilklowering_str()
-        row[int(ColName.TASK_SCHEDULER)] = iopt.task_scheduler
-        row[int(ColName.PFORMAXGRAINSIZE)] = 2048
-        if(iopt.finergrainsize == 1):
-            row[int(ColName.PFORMAXGRAINSIZE)] = 8
-        row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "No"
-        if(iopt.noopt == 1):
-            row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "Yes"
-
-        dump_string("Running benchmark: %s dataset: %s, num_cores: %s\n" % (benchmark_obj.binary, data_set, num_cores),
-                    0,
-                    verbose)
-
-        # Make sure paths adjusted when executing commands
-        output_file = data_set + "_" + str(num_cores) + "cores_out_file"
-        start_row = int(ColName.TIME)
+    attempt = 0
+    while True:
+        run_stats = {}
+        # The counters of an attempt count only if it passes
+        run_sched_stats = {} if sched_stats is not None else None
+        failure = None
+        start_time = time.time()
+        run_status, run_time = run_benchmark(options, iopt.extension, benchmark_obj, num_cores, output_file, data_set, run_sched_stats, None, run_stats, iopt)
+        run_wall = time.time() - start_time
+        write_timing_row(benchmark_obj, data_set, iopt.extension, num_cores, "run", run_wall)
+        write_cgroup_row(benchmark_obj, iopt, data_set, num_cores, sample, attempt, run_stats.get("cgroup"))
 
-        # Run the benchmark
-        run_status, run_time = run_benchmark(options, iopt.extension, benchmark_obj, num_cores, output_file, data_set)
-        row[int(ColName.STATUS)] = get_run_status_str(run_status)
         if run_status == CmdStatus.CORRECT:
+            start_time = time.time()
             check_status, message, out, err = run_check_benchmark(options, benchmark_obj, output_file, data_set)
-            if check_status == CmdStatus.CORRECT:
-                for res in run_time:
-                    row[start_row] = res;
-                    start_row = start_row + 1
-            else:
-                for res in run_time:
-                    row[start_row] = 'N/A'
-                    start_row = start_row + 1
-                row[int(ColName.STATUS)] = get_run_status_str(CmdStatus.INCORRECT)
-                row[int(ColName.ERROR_MSG)] = "Verification failed"
-                run_status = CmdStatus.INCORRECT
+            write_timing_row(benchmark_obj, data_set, iopt.extension, num_cores, "verify", time.time() - start_time)
+            if check_status != CmdStatus.CORRECT:
+                detail = err.decode("utf-8", "replace") if isinstance(err, bytes) else str(err)
+                failure = {"class": FailureClass.CHECKER_MISMATCH, "exit_code": "", "signal": "", "detail": last_line(detail)}
         else:
-            for res in range(0, numTests):
+            failure = classify_failure(run_stats, data_path)
+
+        write_energy_row(options, benchmark_obj, iopt, data_set, num_cores, sample, attempt, "Correct" if failure is None else failure["class"],
+                         run_time, run_stats.get("energy"))
+        progress.record_run(run_wall, failure is None)
+        if failure is None:
+            if sched_stats is not None:
+                merge_sched_stats(sched_stats, run_sched_stats)
+            return run_status, run_time, None
+
+        if failure["class"] in FailureClass.transient and attempt < options.retries:
+            write_failure_row(benchmark_obj, iopt, data_set, num_cores, sample, attempt, failure, "retry")
+            progress.record_retry()
+            backoff = options.retry_backoff * 2**attempt
+            dump_string(f"Run failed ({failure['class']}), retrying in {backoff} seconds\n", 1, verbose)
+            with trace("retry_backoff", seconds=backoff, failure=failure["class"]):
+                time.sleep(backoff)
+            attempt = attempt + 1
+            continue
+
+        action = "quarantine" if note_failed_run(options, benchmark_obj, iopt) else "give up"
+        write_failure_row(benchmark_obj, iopt, data_set, num_cores, sample, attempt, failure, action)
+        return CmdStatus.INCORRECT, run_time, failure
+
+# Stage the input of a pbbs_v2 run and measure how much of it is in memory
+# before the run. Returns (staged, residency in %) or None for cilk5.
+def get_input_state(options, benchmark_obj, iopt, data_set):
+    import dataset_staging
+
+    if benchmark_obj.benchmark_name != "pbbs_v2":
+        return None
+    option, path, arg_path = resolve_input(options, benchmark_obj, iopt.extension, data_set)
+    return stager is not None and stager.is_staged(path), dataset_staging.residency(path)
+
+# Run one sample (one invocation of the benchmark) and verify its output.
+# Returns the run status, the times of the rounds and the error message.
+# The pinned profile a run of the variant is checked against: a THP mode
+# swept with --thp replaces that of the profile
+def get_env_profile(options, iopt):
+    if iopt.thp is None or "thp" not in options.env_profile:
+        return options.env_profile
+    return dict(options.env_profile, thp=iopt.thp)
+
+def run_sample(options, iopt, benchmark_obj, num_cores, data_set, sched_stats, sample, sample_csv_writer, env_csv_writer=None):
+    global sample_position
+
+    dump_string("Running benchmark: %s dataset: %s, num_cores: %s\n" % (benchmark_obj.binary, data_set, num_cores),
+                0,
+                verbose)
+    progress.set_cell(benchmark_obj.name + "/" + benchmark_obj.binary, data_set, iopt.variant, num_cores)
+
+    # Make sure paths adjusted when executing commands
+    output_file = data_set + "_" + str(num_cores) + "cores_out_file"
+
+    position = sample_position
+    sample_position = sample_position + 1
+    timestamp = time.time()
+
+    # Sample the machine state before and during the run
+    if not dry_run:
+        with trace("machine_state"):
+            apply_thp(iopt)
+            state = machine_env.get_run_state()
+            deviations = []
+            if iopt.thp is not None:
+                # The mode of the run, which may only be set for it (prctl)
+                state["thp"] = iopt.thp
+            if options.env_profile is not None:
+                deviations = machine_env.check_profile(state, get_env_profile(options, iopt))
+            input_state = get_input_state(options, benchmark_obj, iopt, data_set)
+            sampler = machine_env.FreqSampler()
+            sampler.start()
+
+    error_msg = ""
+    run_status, run_time, failure = run_with_retries(options, iopt, benchmark_obj, num_cores, data_set, sched_stats, sample, output_file)
+
+    if not dry_run:
+        freqs = sampler.stop()
+        throttle_count = machine_env.get_throttle_count("/")
+        throttle_delta = None
+        if throttle_count is not None and state["throttle_count"] is not None:
+            throttle_delta = throttle_count - state["throttle_count"]
+            if throttle_delta > 0:
+                deviations.append(f"throttled {throttle_delta} times")
+        write_env_row(env_csv_writer, benchmark_obj, iopt, data_set, num_cores, position, state, freqs, throttle_delta, deviations, input_state)
+        check_env(options, deviations, f"{benchmark_obj.name} {data_set} {num_cores} {iopt.variant}")
+
+    if failure is not None:
+        if failure["class"] == FailureClass.CHECKER_MISMATCH:
+            error_msg = "Verification failed: " + failure["class"]
+        else:
+            error_msg = "Benchmark failed to run: " + failure["class"]
+        run_status = CmdStatus.INCORRECT
+
+    write_sample_rows(sample_csv_writer, options, benchmark_obj, iopt, data_set, num_cores, sample, position, timestamp, run_status, run_time)
+    return run_status, run_time, error_msg
+
+# Write the distribution of the steady-state rounds of a cell.  The warmup
+# rounds are dropped from each invocation separately.
+def write_stats_row(options, iopt, row, rounds_per_sample):
+    import steady_state
+
+    if stats_csv_writer is None or dry_run:
+        return
+    steady, dropped = steady_state.steady_rounds(rounds_per_sample, options.warmup)
+    if not steady:
+        return
+    summary = steady_state.summarize(steady)
+    stats_row = [row[int(ColName.BENCHMARK)], row[int(ColName.DATASET)], row[int(ColName.NUM_CORES)], iopt.variant,
+                 row[int(ColName.PARALLEL_FRAMEWORK)], row[int(ColName.TASK_SCHEDULER)], len(steady), dropped]
+    for stat in ["mean", "median", "p90", "p99", "min"]:
+        stats_row.append(format(summary[stat], '.4f'))
+    stats_row.append(format(summary["cv"], '.2f'))
+    stats_row.append("Yes" if summary["bimodal"] else "No")
+    stats_csv_writer.writerow(stats_row)
+
+# Write the results row of a variant/cell from the samples [(status, times, error)]
+def write_result_row(csv_writer, sched_csv_writer, options, benchmark_obj, iopt, data_set, num_cores, samples, sched_stats):
+    numTests = options.num_tests
+    num_values = numTests*n_iteration*len(samples)
+
+    # Create a function for this
+    if(options.measure_icache):
+        num_values = (numTests+2)*n_iteration*len(samples)
+
+    row = make_result_row(benchmark_obj, options, iopt, data_set, num_cores, num_values)
+
+    start_row = int(ColName.TIME)
+    all_time = []
+    run_status = CmdStatus.CORRECT
+    error_msg = ""
+    for sample_status, run_time, sample_error in samples:
+        if sample_status == CmdStatus.CORRECT:
+            for res in run_time:
+                row[start_row] = res;
+                start_row = start_row + 1
+            all_time.extend(run_time)
+        else:
+            nres = len(run_time) if run_time else numTests
+            for res in range(0, nres):
                 row[start_row] = 'N/A'
                 start_row = start_row + 1
-
-            #row[start_row] = "N/A"
-            row[int(ColName.STATUS)] = get_run_status_str(CmdStatus.INCORRECT)
-            row[int(ColName.ERROR_MSG)] = "Benchmark failed to run"
             run_status = CmdStatus.INCORRECT
+            error_msg = sample_error
+
+    row[int(ColName.STATUS)] = get_run_status_str(run_status)
+    if run_status != CmdStatus.CORRECT:
+        row[int(ColName.ERROR_MSG)] = error_msg
+
+    csv_writer.writerow(row)
+    progress.finish_unit(run_status == CmdStatus.CORRECT)
+    if calibration is not None:
+        calibration.add_row(row)
+    if run_status == CmdStatus.CORRECT:
+        write_stats_row(options, iopt, row, [run_time for sample_status, run_time, sample_error in samples])
+    if options.measure_promotedtask and sched_csv_writer is not None:
+        write_sched_row(sched_csv_writer, row, all_time if run_status == CmdStatus.CORRECT else None, sched_stats)
+
+    return run_status, start_row
+
+# Run the sentinel on num_cores cores, those of its cgroup leaf with
+# --isolate, else pinned with taskset to the first cores the harness may use.
+# Closes the window of the units run since the previous sentinel: records
+# their noise factor and requeues them if the machine drifted.
+def run_sentinel(options, num_cores, next_cell):
+    global calibration
+    import cgroup_isolation
+    import sentinel
+    import statistics
+
+    sentinel_options = copy.copy(options)
+    sentinel_options.num_tests = sentinel.rounds
+    sentinel_options.measure_icache = False
+    sentinel_options.measure_promotedtask = False
+    benchmark_obj = sentinel.make_benchmark(options.sentinel)
+
+    leaf = None
+    cpus = cgroup_isolation.format_cpus(sorted(os.sched_getaffinity(0))[:max(1, int(num_cores))])
+    runtime = ("", f"taskset -c {cpus}", "")
+    if isolation is not None and not dry_run:
+        leaf = isolation.create_run_leaf(num_cores)
+        cpus = isolation.read_stats(leaf)["cpus"]
+        runtime = ("", "", isolation.prefix(leaf))
+    timestamp = time.time()
+    with trace("sentinel", workload=options.sentinel, cores=num_cores) as args:
+        run_status, run_time = run_benchmark_cilk5(sentinel_options, sentinel.serial_suffix, benchmark_obj, 1, "", benchmark_obj.standard_inputs[0],
+                                                   runtime=runtime)
+        args["status"] = CmdStatus.asString(run_status)
+    if leaf is not None:
+        isolation.remove_leaf(leaf)
+    if dry_run:
+        # Nothing was measured, the windows close without drift
+        calibration.num_cores = num_cores
+        calibration.close_window(1.0)
+        return
+
+    row = [format(timestamp, '.3f'), sample_position, options.sentinel, num_cores, cpus, next_cell, get_run_status_str(run_status)]
+    if run_status != CmdStatus.CORRECT or not run_time:
+        sentinel_csv_writer.writerow(row + ["", "", ""])
+        dump_string(f"The sentinel {options.sentinel} failed, the rest of the sweep is not calibrated\n", 1, 1)
+        logging.warning(f"Sentinel {options.sentinel} failed")
+        calibration = None
+        return
+
+    seconds = statistics.median(run_time)
+    ratio = calibration.record(num_cores, seconds)
+    sentinel_csv_writer.writerow(row + [format(seconds, '.4f'), format(calibration.baseline(num_cores), '.4f'), format((ratio - 1) * 100, '.2f')])
+
+    factor, drift, rows = calibration.close_window(ratio)
+    requeued = 0
+    for result_row, action in rows:
+        noise_csv_writer.writerow(result_row[:int(ColName.TIME)] + [format(factor, '.4f'), format(drift, '.2f'), action])
+        requeued += 1 if action == "requeued" else 0
+    if requeued:
+        progress.add_units(requeued)
+        dump_string(f"The sentinel drifted by {drift:.1f}%, running {requeued} units again at the end of the sweep\n", 1, verbose)
+        logging.warning(f"Sentinel drifted by {drift:.1f}% before {next_cell}, {requeued} units requeued")
+
+# Compile the serial build of the sentinel if missing. Returns the
+# calibration of the sweep, None if the sentinel cannot be built.
+def start_calibration(options, output_dir, compile_csv_writer):
+    import sentinel
+
+    benchmark_obj = sentinel.make_benchmark(options.sentinel)
+    iopt = CompilerOptions("PBBS", False, False, CilkLowering.Serial, sentinel.serial_suffix)
+    compile_status, compiler_error, out, err = compile_variant(benchmark_obj, iopt, output_dir, compile_csv_writer)
+    if compile_status != CmdStatus.CORRECT:
+        dump_string(f"Cannot build the sentinel {options.sentinel}: {compiler_error}, the sweep is not calibrated\n", 1, 1)
+        return None
+    return sentinel.Calibration(options.sentinel_every, options.sentinel_threshold, options.sentinel_requeue)
+
+# Run the sentinel before a unit of the cell if it is due
+def calibrate(options, benchmark_obj, data_set, num_cores):
+    if calibration is not None and calibration.due():
+        run_sentinel(options, num_cores, f"{benchmark_obj.name}/{benchmark_obj.binary} {data_set.strip()} {num_cores}")
+
+# A unit was run, rerun() runs it again if the sentinel after it drifted
+def note_unit(key, rerun):
+    if calibration is not None:
+        calibration.add_unit(key, rerun)
+
+# Close the last window and run the requeued units again, until no sentinel
+# drifts or the units were run again --sentinel_requeue times
+def finish_calibration(options):
+    while calibration is not None and (calibration.window or calibration.requeued):
+        if calibration.window:
+            run_sentinel(options, calibration.num_cores, "end")
+        if calibration is None:
+            break
+        for rerun in calibration.take_requeued():
+            rerun()
+
+# options are overall options
+# iopt is the compiler options we are using for this run
+def execute_benchmark(benchmark_obj, options, iopt, csv_writer, csv_file, test_cores, data_set, sched_csv_writer=None, sample_csv_writer=None, env_csv_writer=None):
+    start_row = int(ColName.TIME)
+    variant = (benchmark_obj.name + "/" + benchmark_obj.binary, iopt.variant)
+    for index, num_cores in enumerate(test_cores):
+        if variant in options.quarantined:
+            progress.skip_units(len(test_cores) - index)
+            break
+        calibrate(options, benchmark_obj, data_set, num_cores)
+
+        # Run the benchmark
+        sched_stats = {}
+        samples = []
+        for sample in range(options.num_samples):
+            samples.append(run_sample(options, iopt, benchmark_obj, num_cores, data_set, sched_stats, sample, sample_csv_writer, env_csv_writer))
+
+        run_status, start_row = write_result_row(csv_writer, sched_csv_writer, options, benchmark_obj, iopt, data_set, num_cores, samples, sched_stats)
+        note_unit((variant[0], data_set, num_cores, iopt.variant),
+                  lambda num_cores=num_cores: execute_benchmark(benchmark_obj, options, iopt, csv_writer, csv_file, [num_cores], data_set,
+                                                                sched_csv_writer, sample_csv_writer, env_csv_writer))
 
-        csv_writer.writerow(row)
+        if run_status == CmdStatus.CORRECT and should_profile(options, benchmark_obj, data_set, num_cores):
+            output_file = data_set + "_" + str(num_cores) + "cores_out_file"
+            profile_benchmark(options, iopt, benchmark_obj, num_cores, output_file, data_set)
 
     written_row = start_row
     return written_row
 
-def execute_benchmark_top(benchmark_obj, options, csv_writer, csv_file, test_cores, compile_status, compiler_error):
-    # generate list of executable suffixes to run
+# Returns the order in which the variants of a cell are sampled as a list of
+# (sample, variant).  abab repeats the variants in the same order, random
+# shuffles every block of variants with a generator seeded by the cell.
+def get_sample_order(options, suffixes, benchmark_obj, data_set, num_cores):
+    import random
+
+    rng = random.Random(f"{options.seed}:{benchmark_obj.name}:{data_set}:{num_cores}")
+    schedule = []
+    for sample in range(options.num_samples):
+        block = list(suffixes)
+        if options.order == "random":
+            rng.shuffle(block)
+        schedule.extend([(sample, iopt) for iopt in block])
+    return schedule
+
+# Interleave the samples of the variants of one (benchmark, dataset, cores) cell
+def execute_cell_interleaved(benchmark_obj, options, suffixes, csv_writer, num_cores, data_set, sched_csv_writer=None, sample_csv_writer=None, env_csv_writer=None):
+    calibrate(options, benchmark_obj, data_set, num_cores)
+    samples = {iopt.variant: [] for iopt in suffixes}
+    sched_stats = {iopt.variant: {} for iopt in suffixes}
+    for sample, iopt in get_sample_order(options, suffixes, benchmark_obj, data_set, num_cores):
+        if (benchmark_obj.name + "/" + benchmark_obj.binary, iopt.variant) in options.quarantined:
+            continue
+        samples[iopt.variant].append(run_sample(options, iopt, benchmark_obj, num_cores, data_set, sched_stats[iopt.variant], sample, sample_csv_writer, env_csv_writer))
+
+    for iopt in suffixes:
+        if not samples[iopt.variant]:
+            progress.skip_units(1)
+            continue
+        run_status, start_row = write_result_row(csv_writer, sched_csv_writer, options, benchmark_obj, iopt, data_set, num_cores, samples[iopt.variant], sched_stats[iopt.variant])
+        if run_status == CmdStatus.CORRECT and should_profile(options, benchmark_obj, data_set, num_cores):
+            output_file = data_set + "_" + str(num_cores) + "cores_out_file"
+            profile_benchmark(options, iopt, benchmark_obj, num_cores, output_file, data_set)
+    note_unit((benchmark_obj.name + "/" + benchmark_obj.binary, data_set, num_cores, "+".join(iopt.variant for iopt in suffixes)),
+              lambda: execute_cell_interleaved(benchmark_obj, options, suffixes, csv_writer, num_cores, data_set,
+                                               sched_csv_writer, sample_csv_writer, env_csv_writer))
+    showprogress(f",ran:{num_cores}")
+
+# generate list of executable suffixes to run, those of the work units of the
+# sweep spec if there is one
+def get_suffixes(benchmark_obj, options):
     suffixes = []
+    if options.units is not None:
+        for unit in options.units:
+            if sweep_planner.unit_benchmark(unit) == benchmark_obj.name + "/" + benchmark_obj.binary and \
+               unit["suffix"] not in [iopt.extension for iopt in suffixes]:
+                suffixes.append(unit_variant(unit))
+        return suffixes
     for sched in options.task_scheduler:
         for noopt in options.noopt:
             for finergrainsize in options.finergrainsize:
                 for cilk_lowering in options.cilk_lowering:
-                    valid, suffix = makeExeSuffix(benchmark_obj.benchmark_name, sched, noopt, finergrainsize, cilk_lowering)
+                    valid, suffix = makeExeSuffix(benchmark_obj.benchmark_name, sched, noopt, finergrainsize, cilk_lowering, options.variant_rules)
                     if valid:
                         suffixes.append(CompilerOptions(sched, noopt, finergrainsize, cilk_lowering, suffix))
                     else:
                         # print(f"EXEC Skipping {benchmark_obj.benchmark_name}, {sched}, {noopt}, {finergrainsize}, {cilk_lowering}")
                         pass
-
+    return suffixes
+
+# The variants of an executable that are run: every allocator and THP mode
+def get_runtime_variants(iopt, options):
+    variants = []
+    for allocator in runtime_config.resolve_allocators(options.allocators):
+        for thp in options.thp_modes:
+            variant = copy.copy(iopt)
+            variant.allocator = allocator
+            variant.thp = thp
+            variants.append(variant)
+    return variants
+
+# generate list of variants to run
+def get_variants(benchmark_obj, options):
+    return [variant for iopt in get_suffixes(benchmark_obj, options) for variant in get_runtime_variants(iopt, options)]
+
+def execute_benchmark_top(benchmark_obj, options, csv_writer, csv_file, test_cores, compile_status, compiler_error, sched_csv_writer=None, sample_csv_writer=None, env_csv_writer=None):
+    benchmark = benchmark_obj.name + "/" + benchmark_obj.binary
+    variants = get_variants(benchmark_obj, options)
+    suffixes = [iopt for iopt in variants if (benchmark, iopt.variant) not in options.quarantined]
 
     # Go through the benchmark's data sets.
-    inputs = benchmark_obj.standard_inputs
+    inputs = get_datasets(benchmark_obj, options)
+    progress.skip_units((len(variants) - len(suffixes)) * len(inputs) * len(test_cores))
     for data_set in inputs:
-        # Used to determine when data set name should be written to csv file.
-        # Path from benchmark directory.
-        data_path = f"{benchmark_obj.benchmark_name}/{benchmark_obj.name}/../{benchmark_obj.data_dir}/data/{data_set}"
-        if not os.path.isfile(data_path) and (benchmark_obj.benchmark_name == "pbbs_v2") :
-            dump_string("No data set: " + data_set + " Creating test file", 0, verbose)
+        if not ensure_dataset(options, benchmark_obj, data_set):
+            progress.skip_units(len(suffixes) * len(test_cores))
+            continue
 
-            create_status, message, out, err =  create_testfile(benchmark_obj, data_set)
-            if create_status != CmdStatus.CORRECT:
-                logging.warning("Failed to create test")
-                continue
-            showprogress(f"data:{data_set}")
+        if options.order != "suffix":
+            # for each number of cores, interleave the executables
+            for num_cores in test_cores:
+                execute_cell_interleaved(benchmark_obj, options, suffixes, csv_writer, num_cores, data_set, sched_csv_writer, sample_csv_writer, env_csv_writer)
+            continue
 
         # for each different executable option
         for suffix in suffixes:
             # Run the benchmark for a different number of cores.
-            execute_benchmark(benchmark_obj, options, suffix, csv_writer, csv_file, test_cores, data_set);
-            showprogress(f",ran:{suffix.extension}")
+            execute_benchmark(benchmark_obj, options, suffix, csv_writer, csv_file, test_cores, data_set, sched_csv_writer, sample_csv_writer, env_csv_writer);
+            showprogress(f",ran:{suffix.variant}")
     showprogress("\n")
 
-def main():
+# Data sets of a benchmark: its standard inputs, or the series of sizes
+# ending at each of them with --size_sweep
+def get_datasets(benchmark_obj, options):
+    import size_sweep
+
+    if options.size_sweep > 0:
+        return size_sweep.get_series(benchmark_obj, options.size_sweep, options.size_factor)
+    return benchmark_obj.standard_inputs
+
+# The small inputs of a benchmark. When the csv file gives none, they are
+# derived from its standard inputs (see size_sweep.small_input).
+def get_small_inputs(benchmark_obj):
+    import size_sweep
+
+    small_inputs = [data_set for data_set in benchmark_obj.small_inputs if data_set]
+    if small_inputs:
+        return small_inputs
+    for data_set in benchmark_obj.standard_inputs:
+        small = size_sweep.small_input(benchmark_obj.binary, data_set)
+        if small is not None and small not in small_inputs:
+            small_inputs.append(small)
+    return small_inputs
+
+# Run one variant on one small input, on cpus taken from the queue of free
+# cpu sets, and verify its output
+def run_smoke_job(options, iopt, benchmark_obj, data_set, num_cores, free_cpus):
+    output_file = f"{data_set}_{iopt.variant}_smoke_out_file"
+    cpus = free_cpus.get()
+    try:
+        run_status, run_time = run_benchmark(options, iopt.extension, benchmark_obj, num_cores, output_file, data_set, variant=iopt, cpus=cpus)
+    finally:
+        free_cpus.put(cpus)
+    if run_status != CmdStatus.CORRECT:
+        return run_status, "Benchmark failed to run"
+    check_status, message, out, err = run_check_benchmark(options, benchmark_obj, output_file, data_set)
+    if check_status != CmdStatus.CORRECT:
+        return CmdStatus.INCORRECT, "Verification failed"
+    return CmdStatus.CORRECT, ""
+
+# Run every variant of the benchmarks on their small inputs, num_jobs at a
+# time on disjoint sets of num_cores cpus, and quarantine the variants that
+# fail so the timed sweep skips them.
+def smoke_test(options, benchmarks, num_cores, num_jobs, smoke_csv_writer):
+    import concurrent.futures
+    import queue
+
+    # One round each, and the runs of the phase load the machine themselves.
+    # The workers are not pinned: NAIVE_MAPPING pins them to the first cpus,
+    # those of every job.
+    smoke_options = copy.copy(options)
+    smoke_options.num_tests = 1
+    smoke_options.measure_icache = False
+    smoke_options.measure_promotedtask = False
+    smoke_options.wait_load = float("inf")
+    smoke_options.disable_pinning = True
+
+    all_cpus = isolation.cpus if isolation is not None else sorted(os.sched_getaffinity(0))
+    num_jobs = max(1, min(num_jobs, len(all_cpus) // num_cores))
+    free_cpus = queue.Queue()
+    for job in range(num_jobs):
+        free_cpus.put(all_cpus[job*num_cores:(job+1)*num_cores] or all_cpus)
+
+    jobs = []
+    for benchmark_obj in benchmarks:
+        small_inputs = get_small_inputs(benchmark_obj)
+        if not small_inputs:
+            dump_string(f"No small inputs for {benchmark_obj.name}, not smoke tested\n", 1, verbose)
+            continue
+        for data_set in small_inputs:
+            if not ensure_dataset(options, benchmark_obj, data_set):
+                continue
+            for iopt in get_variants(benchmark_obj, options):
+                jobs.append((benchmark_obj, iopt, data_set))
+
+    # The THP mode of a variant may be set system-wide before its run: the
+    # variants of a mode run together, and the modes one after the other
+    thp_groups = {}
+    for job in jobs:
+        thp_groups.setdefault(job[1].thp, []).append(job)
+
+    showprogress(f"Smoke testing {len(jobs)} runs:")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        try:
+            for group in thp_groups.values():
+                futures = [executor.submit(run_smoke_job, smoke_options, iopt, benchmark_obj, data_set, num_cores, free_cpus)
+                           for benchmark_obj, iopt, data_set in group]
+                for (benchmark_obj, iopt, data_set), future in zip(group, futures):
+                    status, error_msg = future.result()
+                    benchmark = benchmark_obj.name + "/" + benchmark_obj.binary
+                    smoke_csv_writer.writerow([benchmark, data_set, iopt.variant, num_cores, get_run_status_str(status), error_msg])
+                    if status != CmdStatus.CORRECT:
+                        options.quarantined.add((benchmark, iopt.variant))
+        except BaseException:
+            # Interrupted: the jobs not started are dropped, the running ones killed
+            executor.shutdown(wait=False, cancel_futures=True)
+            kill_running_commands()
+            raise
+    showprogress("\n")
 
-    # Get the bencjmark to run
-    benchmarks_to_run = parse_csv(input_file)
+    for benchmark, suffix in sorted(options.quarantined):
+        print(f"Quarantined {benchmark} {suffix}: failed on a small input")
+        logging.warning(f"Quarantined {benchmark} {suffix}")
 
-    output_dir = "oDir/lazybenchmark_output_files_" + time.strftime("%Y%m%d-%H%M%S")
-    results_file = "lazybenchmark_results.csv"
+# Compile the variants of the benchmark, unless only executing
+def compile_or_skip(options, benchmark_obj, output_dir, compile_csv_writer):
+    if(not options.execute_only):
+        compile_status, compiler_error, out, err = compile_benchmark(options, benchmark_obj, output_dir, compile_csv_writer)
+    else:
+        compile_status = CmdStatus.CORRECT;
+        compiler_error = "testPBBS run without compiling benchmark"
+        showprogress(f"Compiled-Skipped:")
+    return compile_status, compiler_error
+
+# Row of the results csv file of a benchmark that is not executed
+def write_compile_status_row(csv_writer, options, benchmark_obj, compile_status, compiler_error):
+    row = [""] * num_cols
+    row[int(ColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
+    if compile_status == CmdStatus.CORRECT:
+        row[int(ColName.COMPILES)] = "Yes"
+    else:
+        row[int(ColName.COMPILES)] = "No"
+    row[int(ColName.ERROR_MSG)] = compiler_error
+    row[int(ColName.PARALLEL_FRAMEWORK)] = options.get_cilklowering_str()
+    row[int(ColName.TASK_SCHEDULER)] = options.task_scheduler
+    row[int(ColName.PFORMAXGRAINSIZE)] = 2048
+    if(options.finergrainsize == 1):
+        row[int(ColName.PFORMAXGRAINSIZE)] = 8
+    row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "No"
+    if(options.noopt == 1):
+        row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "Yes"
+
+    csv_writer.writerow(row)
+
+# Run the work units selected by the planner, in the planned order.  Each
+# variant is compiled and each data set created before its first unit.
+def execute_planned_units(options, selected, output_dir, csv_writer, csv_file, compile_csv_writer, sched_csv_writer=None, sample_csv_writer=None, env_csv_writer=None):
+    benchmarks = {benchmark_obj.name + "/" + benchmark_obj.binary: benchmark_obj for benchmark_obj in options.benchmarks_to_run}
+    compiled = {}   # (benchmark, suffix) -> compile status
+    datasets = {}   # (benchmark, dataset) -> created
+    start_time = time.time()
+    estimated = 0.0
+    for unit, cost, marginal in selected:
+        name = sweep_planner.unit_benchmark(unit)
+        benchmark_obj = benchmarks[name]
+        iopt = unit_variant(unit)
+        unit_opts = unit_options(options, unit)
+        estimated += marginal
+        showprogress(f"{name}:{unit['dataset']}:{unit['suffix']}:{unit['num_cores']}:")
+        variants = [variant for variant in get_runtime_variants(iopt, options) if (name, variant.variant) not in options.quarantined]
+        if not variants:
+            progress.skip_units(len(get_runtime_variants(iopt, options)))
+            showprogress("quarantined\n")
+            continue
 
-    print(f"Will put results and log files in {output_dir}")
-    lazy_benchmark_options = LazyBenchmarkOptions(compile_only, execute_only, num_cores, num_tests, benchmarks_to_run, cilk_lowering, task_scheduler, noopt, finergrainsize, measure_icache, False, disable_numa, verbose, dry_run, wait_load, disable_pinning);
+        if (name, iopt.extension) not in compiled:
+            if options.execute_only:
+                compiled[(name, iopt.extension)] = CmdStatus.CORRECT
+            else:
+                compile_status, compiler_error, out, err = compile_variant(benchmark_obj, iopt, output_dir, compile_csv_writer)
+                compiled[(name, iopt.extension)] = compile_status
+                if compile_status != CmdStatus.CORRECT or options.compile_only:
+                    write_compile_status_row(csv_writer, options, benchmark_obj, compile_status, compiler_error)
+        if compiled[(name, iopt.extension)] != CmdStatus.CORRECT or options.compile_only:
+            if not options.compile_only:
+                progress.skip_units(len(variants))
+            showprogress("skipped\n")
+            continue
 
+        if (name, unit["dataset"]) not in datasets:
+            datasets[(name, unit["dataset"])] = ensure_dataset(options, benchmark_obj, unit["dataset"])
+        if not datasets[(name, unit["dataset"])]:
+            progress.skip_units(len(variants))
+            showprogress("skipped\n")
+            continue
+
+        for variant in variants:
+            execute_benchmark(benchmark_obj, unit_opts, variant, csv_writer, csv_file, [unit["num_cores"]], unit["dataset"], sched_csv_writer, sample_csv_writer, env_csv_writer)
+        showprogress(f"{sweep_planner.format_duration(time.time() - start_time)} (planned {sweep_planner.format_duration(estimated)})\n")
+
+# The (benchmark, dataset, suffix, cores) work unit with the command line
+# options that select it
+def make_unit(benchmark_obj, data_set, iopt, num_cores):
+    lowering2arg = {lowering: arg for arg, lowering in CilkLowering.asarg.items()}
+    benchmark = [benchmark_obj.benchmark_name, benchmark_obj.name, benchmark_obj.binary, benchmark_obj.check_binary,
+                 benchmark_obj.data_dir, ",".join(benchmark_obj.small_inputs)]
+    return {"benchmark": benchmark,
+            "dataset": data_set,
+            "suffix": iopt.extension,
+            "schedule_tasks": iopt.task_scheduler,
+            "noopt": "yes" if iopt.noopt else "no",
+            "fg": "yes" if iopt.finergrainsize else "no",
+            "parallel_framework": lowering2arg[iopt.cilk_lowering],
+            "num_cores": num_cores}
+
+# The executable of a work unit
+def unit_variant(unit):
+    return CompilerOptions(unit["schedule_tasks"], unit["noopt"] == "yes", unit["fg"] == "yes",
+                           CilkLowering.asarg[unit["parallel_framework"]], unit["suffix"])
+
+# The options of a work unit, with its settings of the sweep spec
+def unit_options(options, unit):
+    unit_opts = copy.copy(options)
+    unit_opts.num_tests = unit.get("num_tests", options.num_tests)
+    unit_opts.num_samples = unit.get("samples", options.num_samples)
+    unit_opts.run_timeout = unit.get("run_timeout", options.run_timeout)
+    return unit_opts
+
+# Returns the (benchmark, dataset, suffix, cores) work units of the sweep with
+# the command line options that select each of them, the units of the sweep
+# spec if there is one.
+def get_work_units(options, test_cores):
+    if options.units is not None:
+        return options.units
+    units = []
+    for benchmark_obj in options.benchmarks_to_run:
+        for data_set in get_datasets(benchmark_obj, options):
+            for iopt in get_suffixes(benchmark_obj, options):
+                for num_cores in test_cores:
+                    units.append(make_unit(benchmark_obj, data_set, iopt, num_cores))
+    return units
+
+# Cores of the num_cores axis of a sweep spec, a number or a list like the
+# value of --num_cores
+def get_spec_cores(values):
+    cores = []
+    for value in values:
+        cores.extend(get_test_num_cores([value]))
+    return cores
+
+# Expand the matrix of the sweep spec for every benchmark. Returns the work
+# units, with the settings of the spec, and the number of cells of the matrix,
+# of the cells pruned by the variant rules, by the exclusion rules and as
+# duplicates. The inputs of the spec are not swept by --size_sweep.
+def get_spec_units(spec, benchmarks, options):
+    import sweep_spec
+
+    counts = {"cells": 0, "variant_rules": 0, "excluded": 0, "duplicates": 0}
+    units = []
+    seen = set()
+    for benchmark_obj in benchmarks:
+        path = benchmark_obj.benchmark_name + "/" + benchmark_obj.name
+        values = sweep_spec.settings_for(spec, path)
+        inputs = values.get("inputs", get_datasets(benchmark_obj, options))
+        for data_set, num_cores, framework, sched, fg, noopt in itertools.product(inputs, get_spec_cores(values["num_cores"]),
+                                                                                    values["parallel_framework"], values["schedule_tasks"],
+                                                                                    values["fg"], values["noopt"]):
+            counts["cells"] += 1
+            if framework not in CilkLowering.asarg or sched not in scheduler2suffix or fg not in ["yes", "no"] or noopt not in ["yes", "no"]:
+                raise ValueError(f"Invalid cell {path} {framework} {sched} fg={fg} noopt={noopt} in the sweep spec")
+            valid, suffix = makeExeSuffix(benchmark_obj.benchmark_name, sched, noopt == "yes", fg == "yes", CilkLowering.asarg[framework],
+                                          values.get("variant_rules", "builtin"))
+            if not valid:
+                counts["variant_rules"] += 1
+                continue
+            cell = {"benchmark": path, "dataset": data_set, "num_cores": num_cores, "parallel_framework": framework,
+                    "schedule_tasks": sched, "fg": fg, "noopt": noopt, "suffix": suffix}
+            if sweep_spec.excluded(spec, cell):
+                counts["excluded"] += 1
+                continue
+            key = (path, benchmark_obj.binary, data_set, suffix, num_cores)
+            if key in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(key)
+            unit = make_unit(benchmark_obj, data_set, unit_variant(cell), num_cores)
+            for setting in sweep_spec.settings:
+                if setting in values:
+                    unit[setting] = values[setting]
+            units.append(unit)
+    return units, counts
+
+# Replace the benchmarks, allocators, THP modes and matrix of the options by
+# those of the sweep spec. Returns the counts of get_spec_units.
+def apply_spec(options, spec):
+    if spec["benchmarks"]:
+        options.benchmarks_to_run = [benchmark_obj for csv_file in spec["benchmarks"] for benchmark_obj in parse_csv(csv_file)]
+    if spec["allocator"] is not None:
+        options.allocators = spec["allocator"]
+    if spec["thp"] is not None:
+        options.thp_modes = [None if mode == "system" else mode for mode in spec["thp"]]
+    defaults = spec["defaults"]
+    options.num_tests = defaults.get("num_tests", options.num_tests)
+    options.num_samples = defaults.get("samples", options.num_samples)
+    options.run_timeout = defaults.get("run_timeout", options.run_timeout)
+    options.variant_rules = defaults.get("variant_rules", options.variant_rules)
+    options.units, counts = get_spec_units(spec, options.benchmarks_to_run, options)
+    return counts
+
+def format_spec_counts(counts, num_units):
+    return (f"{counts['cells']} cells in the matrix, {counts['variant_rules']} pruned by the variant rules, "
+            f"{counts['excluded']} excluded, {counts['duplicates']} duplicates: {num_units} work units")
+
+# Set the module state used by the helpers from the options
+def set_output_mode(options):
+    global verbose, dry_run
+    verbose = options.verbose
+    dry_run = options.dry_run
+
+# Returns the work units selected by the planner [(unit, cost, marginal
+# cost)], all the work units and the estimated seconds of the selected ones.
+def plan(options):
+    set_output_mode(options)
+    test_cores = get_test_num_cores(options.num_cores)
+    units = get_work_units(options, test_cores)
+    with trace("plan", units=len(units)):
+        history = sweep_planner.load_history(options.history_dirs if options.history_dirs else sweep_planner.default_history_dirs())
+        selected, total = sweep_planner.plan(units, history, options.budget, options.plan_order, options.execute_only)
+    return selected, units, total
+
+# Compile every variant of the benchmarks, unless only executing. Returns
+# {benchmark path: (compile status, compiler error)}.
+def build(options, output_dir, compile_csv_writer=None):
+    set_output_mode(options)
+    compile_csv_file = None
+    if compile_csv_writer is None:
+        os.makedirs(output_dir, exist_ok=True)
+        compile_csv_file = open(output_dir + "/lazybenchmark_compile.csv", "a", newline="")
+        compile_csv_writer = csv.writer(compile_csv_file)
+        compile_csv_writer.writerow(compile_file_categories)
+
+    compiled = {}
+    with trace("build"):
+        for benchmark_obj in options.benchmarks_to_run:
+            benchmark_path_name = benchmark_obj.benchmark_name + "/" + benchmark_obj.name
+            showprogress(f"{benchmark_path_name}:")
+            compiled[benchmark_path_name] = compile_or_skip(options, benchmark_obj, output_dir, compile_csv_writer)
+            showprogress("\n")
+
+    if compile_csv_file:
+        compile_csv_file.close()
+    return compiled
+
+# Close the trace of the sweep and print where its wall time went, the
+# summary of every phase is kept in lazybenchmark_trace_summary.txt
+def finish_trace():
+    global tracer
+    tracer.close()
+    if tracer.path is not None and not dry_run:
+        summary, wall = trace_events.summarize(trace_events.load(tracer.path))
+        with open(os.path.join(os.path.dirname(tracer.path), "lazybenchmark_trace_summary.txt"), "w") as summary_file:
+            summary_file.write(trace_events.format_summary(summary, wall) + "\n")
+        print(f"Wall time of the sweep by phase ({tracer.path}):")
+        print(trace_events.format_summary(summary, wall, 8))
+    tracer = None
+
+# Start following the sweep of num_units units: serve its metrics with
+# --metrics_port and show its status line
+def start_progress(options, num_units):
+    global progress, status_line, metrics_server
+    progress = sweep_progress.Progress(num_units)
+    if options.metrics_port is not None:
+        try:
+            metrics_server = sweep_progress.serve(progress, options.metrics_port)
+            print(f"Serving the metrics of the sweep on http://127.0.0.1:{metrics_server.server_address[1]}/metrics (JSON on /status)")
+        except OSError as e:
+            dump_string(f"Cannot serve the metrics on port {options.metrics_port}: {e}\n", 1, 1)
+    if options.status_line == "on" or (options.status_line == "auto" and sys.stderr.isatty() and not options.verbose and not options.dry_run):
+        status_line = sweep_progress.StatusLine(progress)
+        status_line.start()
+
+def stop_progress():
+    global status_line, metrics_server
+    if status_line is not None:
+        status_line.stop()
+        status_line = None
+    if metrics_server is not None:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+        metrics_server = None
+
+# Run the sweep described by the options and write its results to
+# output_dir (default oDir/lazybenchmark_output_files_<timestamp>). The
+# phases of the sweep are traced in lazybenchmark_trace.json.
+def run(options, output_dir=None):
+    global tracer
+    if tracer is not None:
+        return run_sweep(options, output_dir)
+    tracer = trace_events.Tracer()
+    try:
+        with trace(trace_events.root_name):
+            return run_sweep(options, output_dir)
+    finally:
+        stop_progress()
+        finish_trace()
+
+# Opens the csv file name of the sweep in output_dir and writes its header.
+# The file is added to files, closed when the sweep ends.
+def open_csv(files, output_dir, name, categories):
+    csv_file = open(output_dir + "/" + name, "a", newline="")
+    files.append(csv_file)
+    csv_writer = csv.writer(csv_file)
+    csv_writer.writerow(categories)
+    return csv_file, csv_writer
+
+def run_sweep(options, output_dir=None):
+    global timing_csv_writer, failure_csv_writer, stats_csv_writer, sample_position, stager, isolation, cgroup_csv_writer
+    global calibration, sentinel_csv_writer, noise_csv_writer, energy_csv_writer, energy_domains, original_thp
+    import cgroup_isolation
+    import dataset_staging
+    import energy
+
+    set_output_mode(options)
+    check_options(options)
+
+    if output_dir is None:
+        output_dir = "oDir/lazybenchmark_output_files_" + time.strftime("%Y%m%d-%H%M%S")
+    if options.profile_dir is None:
+        options.profile_dir = output_dir + "/profiles"
+    results_file = "lazybenchmark_results.csv"
+    compile_results_file = "lazybenchmark_compile.csv"
+    sched_results_file = "lazybenchmark_schedstats.csv"
+    sample_results_file = "lazybenchmark_samples.csv"
+    env_results_file = "lazybenchmark_env.csv"
+    timing_results_file = "lazybenchmark_timing.csv"
+    stats_results_file = "lazybenchmark_stats.csv"
+    smoke_results_file = "lazybenchmark_smoke.csv"
+    failure_results_file = "lazybenchmark_failures.csv"
+    cgroup_results_file = "lazybenchmark_cgroup.csv"
+    sentinel_results_file = "lazybenchmark_sentinel.csv"
+    noise_results_file = "lazybenchmark_noise.csv"
+    energy_results_file = "lazybenchmark_energy.csv"
+    trace_file = "lazybenchmark_trace.json"
+    result = SweepResult(output_dir, output_dir + "/" + results_file, options.quarantined, options.failed_runs,
+                         output_dir + "/" + trace_file)
 
     # Number of cores for which benchmarks should be tested.
-    test_cores = get_test_num_cores(lazy_benchmark_options.num_cores)
+    test_cores = get_test_num_cores(options.num_cores)
+
+    planned_units = None
+    if options.budget is not None or options.units is not None:
+        planned_units, units, total = plan(options)
+        print(f"Running {len(planned_units)} of {len(units)} units, estimated {sweep_planner.format_duration(total)}")
+
+    print(f"Will put results and log files in {output_dir}")
 
     # Write output
     os.mkdir(output_dir)
-    csv_file = open(output_dir + "/" + results_file, "a", newline="")
-    csv_writer = csv.writer(csv_file)
+    if tracer is not None:
+        tracer.open(output_dir + "/" + trace_file)
 
     # Setup logger
-    logging.basicConfig(filename=output_dir+ "/" + 'log.txt', level=logging.DEBUG, format='')
-
-    # Write category names on first row.
-    csv_writer.writerow(results_file_categories)
+    log_handler = logging.FileHandler(output_dir + "/" + 'log.txt')
+    log_handler.setFormatter(logging.Formatter(''))
+    logging.getLogger().setLevel(logging.DEBUG)
+    logging.getLogger().addHandler(log_handler)
+
+    # The files and the module state of the sweep are released when it ends,
+    # also when it fails or is interrupted
+    csv_files = []
+    try:
+        csv_file, csv_writer = open_csv(csv_files, output_dir, results_file, results_file_categories)
+
+        # Record the machine state of the sweep
+        with trace("fingerprint"):
+            fingerprint = machine_env.get_fingerprint()
+            with open(output_dir + "/environment.json", "w") as env_file:
+                json.dump(fingerprint, env_file, indent=2)
+            if options.env_profile is not None:
+                check_env(options, machine_env.check_profile(fingerprint, options.env_profile), "sweep")
+
+        compile_csv_file, compile_csv_writer = open_csv(csv_files, output_dir, compile_results_file, compile_file_categories)
+        sample_csv_file, sample_csv_writer = open_csv(csv_files, output_dir, sample_results_file, sample_file_categories)
+        sample_position = 0
+        env_csv_file, env_csv_writer = open_csv(csv_files, output_dir, env_results_file, env_file_categories)
+        timing_csv_file, timing_csv_writer = open_csv(csv_files, output_dir, timing_results_file, timing_file_categories)
+        failure_csv_file, failure_csv_writer = open_csv(csv_files, output_dir, failure_results_file, failure_file_categories)
+
+        if not options.measure_icache:
+            stats_csv_file, stats_csv_writer = open_csv(csv_files, output_dir, stats_results_file, stats_file_categories)
+
+        sched_csv_writer = None
+        if options.measure_promotedtask:
+            sched_csv_file, sched_csv_writer = open_csv(csv_files, output_dir, sched_results_file, sched_file_categories)
+
+        original_thp = machine_env.get_thp("/")
+
+        if options.isolate and not options.dry_run:
+            try:
+                with trace("isolate"):
+                    isolation = cgroup_isolation.Isolation(options.cgroup_root, options.cgroup_memory)
+            except OSError as e:
+                raise SweepError(f"Cannot create the cgroups of --isolate: {e}")
+            for warning in isolation.warnings:
+                dump_string(f"--isolate: {warning}\n", 1, 1)
+            cgroup_csv_file, cgroup_csv_writer = open_csv(csv_files, output_dir, cgroup_results_file, cgroup_file_categories)
+
+        if options.energy:
+            energy_domains = energy.find_domains(options.energy_root)
+            if energy_domains:
+                dump_string(f"Measuring the energy of {', '.join(sorted(energy_domains))}\n", 0, options.verbose)
+                energy_csv_file, energy_csv_writer = open_csv(csv_files, output_dir, energy_results_file, energy_file_categories)
+            else:
+                dump_string(f"--energy: no readable RAPL counters in {os.path.join(options.energy_root, energy.powercap_dir)}, the energy is not measured\n", 1, 1)
+                energy_domains = None
 
-    if test_cores == []:
-        return
+        if options.stage_dir is not None and not options.dry_run:
+            stager = dataset_staging.Stager(options.stage_dir, options.stage_budget)
+            dump_string(f"Staging the inputs in {stager.stage_dir}, at most {dataset_staging.format_size(stager.budget)}\n", 0, options.verbose)
 
-    for i in range(len(lazy_benchmark_options.benchmarks_to_run)):
-        if (i != (len(lazy_benchmark_options.benchmarks_to_run) - 1)):
-            dump_string("%s, " % lazy_benchmark_options.benchmarks_to_run[i].name, 0, lazy_benchmark_options.verbose)
+        for i in range(len(options.benchmarks_to_run)):
+            if (i != (len(options.benchmarks_to_run) - 1)):
+                dump_string("%s, " % options.benchmarks_to_run[i].name, 0, options.verbose)
+            else:
+                dump_string("%s\n\n" % options.benchmarks_to_run[i].name, 0, options.verbose)
+
+        # Units of the sweep, a row of the results each
+        num_units = 0
+        if test_cores != [] and not options.compile_only:
+            runtime_variants = len(runtime_config.resolve_allocators(options.allocators)) * len(options.thp_modes)
+            num_units = runtime_variants * (len(planned_units) if planned_units is not None else len(get_work_units(options, test_cores)))
+        start_progress(options, num_units)
+
+        # Compile everything first to smoke test every variant
+        compiled = {}
+        if test_cores != [] and options.smoke and not options.compile_only:
+            compiled = build(options, output_dir, compile_csv_writer)
+            smoke_csv_file, smoke_csv_writer = open_csv(csv_files, output_dir, smoke_results_file, smoke_file_categories)
+            smoke_jobs = options.smoke_jobs if options.smoke_jobs > 0 else max(1, os.cpu_count() // max(1, options.smoke_cores))
+            with trace("smoke", jobs=smoke_jobs):
+                smoke_test(options, [benchmark_obj for benchmark_obj in options.benchmarks_to_run
+                                     if compiled[benchmark_obj.benchmark_name + "/" + benchmark_obj.name][0] == CmdStatus.CORRECT],
+                           options.smoke_cores, smoke_jobs, smoke_csv_writer)
+
+        sentinel_csv_file = None
+        if options.sentinel is not None and test_cores != [] and not options.compile_only:
+            calibration = start_calibration(options, output_dir, compile_csv_writer)
+            sentinel_csv_file, sentinel_csv_writer = open_csv(csv_files, output_dir, sentinel_results_file, sentinel_file_categories)
+            noise_csv_file, noise_csv_writer = open_csv(csv_files, output_dir, noise_results_file, noise_file_categories)
+
+        if test_cores == []:
+            pass
+        elif planned_units is not None:
+            execute_planned_units(options, planned_units, output_dir, csv_writer, csv_file, compile_csv_writer, sched_csv_writer, sample_csv_writer, env_csv_writer)
         else:
-            dump_string("%s\n\n" % lazy_benchmark_options.benchmarks_to_run[i].name, 0, lazy_benchmark_options.verbose)
+            # Loop through the benchmarks
+            for benchmark_obj in options.benchmarks_to_run:
+                # Used to determine when benchmark name / compile status should be written
+                # to csv file.
+                benchmark_path_name = benchmark_obj.benchmark_name + "/" + benchmark_obj.name
+                showprogress(f"{benchmark_path_name}:")
+
+                dump_string("\nTest " + benchmark_path_name + ":\n", 0, options.verbose)
+                dump_string("Settting up test:",  0, options.verbose)
+
+                # compile benchmark
+                if benchmark_path_name in compiled:
+                    compile_status, compiler_error = compiled[benchmark_path_name]
+                else:
+                    compile_status, compiler_error = compile_or_skip(options, benchmark_obj, output_dir, compile_csv_writer)
+
+                if (compile_status != CmdStatus.CORRECT) or options.compile_only:
+                    write_compile_status_row(csv_writer, options, benchmark_obj, compile_status, compiler_error)
+                    if not options.compile_only:
+                        progress.skip_units(len(get_datasets(benchmark_obj, options)) * len(get_variants(benchmark_obj, options)) * len(test_cores))
+                    continue
+
+                # execute benchmark
+                execute_benchmark_top(benchmark_obj, options, csv_writer, csv_file, test_cores, compile_status, compiler_error, sched_csv_writer, sample_csv_writer, env_csv_writer)
+
+        if sentinel_csv_file:
+            with trace("requeue"):
+                finish_calibration(options)
+
+        stop_progress()
+        snapshot = progress.snapshot()
+        print(f"Ran {snapshot['units_done'] + snapshot['units_failed']} of {snapshot['units_total']} units: "
+              f"{snapshot['units_failed']} failed, {snapshot['units_skipped']} skipped, in {sweep_progress.format_duration(snapshot['elapsed_seconds'])}")
+    finally:
+        with trace("cleanup"):
+            if stager is not None:
+                stager.cleanup()
+            if isolation is not None:
+                isolation.cleanup()
+            if original_thp is not None and machine_env.get_thp("/") != original_thp and not options.dry_run:
+                runtime_config.set_system_thp(original_thp)
+        for sweep_file in csv_files:
+            sweep_file.close()
+        timing_csv_writer = failure_csv_writer = stats_csv_writer = cgroup_csv_writer = None
+        sentinel_csv_writer = noise_csv_writer = energy_csv_writer = None
+        energy_domains = calibration = stager = isolation = original_thp = None
+        logging.getLogger().removeHandler(log_handler)
+        log_handler.close()
+    return result
 
-    # Loop through the benchmarks
-    for benchmark_obj in lazy_benchmark_options.benchmarks_to_run:
-        # Used to determine when benchmark name / compile status should be written
-        # to csv file.
-        benchmark_path_name = benchmark_obj.benchmark_name + "/" + benchmark_obj.name
-        showprogress(f"{benchmark_path_name}:")
+# setup command line parsing
+def make_parser():
+    import argparse
+    import sentinel
+    import sweep_spec
+
+    parser = argparse.ArgumentParser(description='Compile and Run benchmarks')
+    parser.add_argument("--compile", action='store_true', help="Only compile benchmark")
+    parser.add_argument("--num_cores", nargs='+', default=['1'], help="Number of cores used. Default: 1")
+    parser.add_argument("--num_tests", default=1, type=int, help="Number of runs per test")
+    parser.add_argument("--execute", action='store_true', help="Only execute benchmark, don't compile")
+    parser.add_argument("--disable_numa", action='store_true', help="Disable numa when running the benchmark")
+    parser.add_argument("--icache", action='store_true', help="Run the icache experiment")
+    parser.add_argument("--parallel_framework", nargs='+',
+                        default=['tapir'],
+                        choices=['lazyd0', 'lazyd2', 'nopoll', 'serial', 'tapir'],
+                        help="What parallel framework to use. Default: tapir")
+    parser.add_argument("--fg",
+                        default=['no'],
+                        choices=['yes', 'no', 'both'],
+                        help="Use finer grainsize. Only for LazyD and OpenCilk-fg. Default: no")
+    parser.add_argument("--noopt",
+                        default=['no'],
+                        choices=['yes', 'no', 'both'],
+                        help="Ignore users grainsize.  Default: no")
+    parser.add_argument("--schedule_tasks",
+                        default=["PBBS"],
+                        nargs='+',
+                        choices=['PRC', 'PRL', 'DELEGATEPRC', 'PRCPRL', 'DELEGATEPRCPRL', 'OPENCILKDEFAULT_FINE', 'PBBS'],
+                        help="How to scheduler parallel task in pfor.")
+    parser.add_argument("--ifile", default="lazybenchmark.csv", help="Input file")
+    parser.add_argument("-v", "--verbose", action='store_true', help="Verbose")
+    parser.add_argument("--dryrun", action='store_true', help="Dry run, only print commands that would be executed")
+    parser.add_argument("--wait_load", default=10, type=int, help="The minimum load to execute the benchmark (Default=10)")
+    parser.add_argument("--disable_pinning", action='store_true', help="Disable worker pinning for LazyD")
+    parser.add_argument("--sched_stats", action='store_true', help="Collect the runtime's promoted-task, work-request and steal counters")
+    parser.add_argument("--profile", nargs='*', default=None, metavar="BENCHMARK[:DATASET[:CORES]]",
+                        help="After the timed run, rerun the selected cells (glob patterns, all cells if none given) under perf record")
+    parser.add_argument("--order", default="suffix", choices=["suffix", "abab", "random"],
+                        help="Order of the samples. suffix: all core counts of a variant, then the next variant. "
+                        "abab: interleave the variants of a (benchmark, dataset, cores) cell. "
+                        "random: randomized blocks of the variants of a cell. Default: suffix")
+    parser.add_argument("--samples", default=1, type=int, help="Number of invocations of each variant per cell, each running --num_tests rounds (Default=1)")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of --order random (Default=0)")
+    parser.add_argument("--env_profile", default=None, help="JSON file with the pinned machine state (governor, turbo, smt, thp, kernel, compiler, runtime)")
+    parser.add_argument("--env_action", default="warn", choices=["warn", "abort"], help="What to do when the machine state deviates from --env_profile. Default: warn")
+    parser.add_argument("--save_env_profile", default=None, help="Save the current machine state as a pinned profile to this file and exit")
+    parser.add_argument("--odir", default=None, help="Output directory. Default: oDir/lazybenchmark_output_files_<timestamp>")
+    parser.add_argument("--list_units", action='store_true', help="Print the (benchmark, dataset, suffix, cores) work units of the sweep as JSON and exit")
+    parser.add_argument("--profile_freq", default=999, type=int, help="Sampling frequency of the cpu-clock event used by --profile (Default=999)")
+    parser.add_argument("--plan", action='store_true', help="Print the estimated cost of every work unit and the ETA of the sweep and exit")
+    parser.add_argument("--budget", default=None, help="Only run the work units that fit in this time budget, e.g. 4h, 1h30m, 45m")
+    parser.add_argument("--plan_order", default="longest", choices=["longest", "info"],
+                        help="Order of the work units of --plan/--budget. longest: longest unit first. "
+                        "info: baseline, 1 core, max cores and unmeasured units first, per second of cost. Default: longest")
+    parser.add_argument("--history", nargs='+', default=None,
+                        help="Result directories used to estimate the cost of the units. Default: oDir/lazybenchmark_*")
+    parser.add_argument("--smoke", action='store_true',
+                        help="Before the sweep, run every variant on the small inputs in parallel and skip the variants that fail. "
+                        "A benchmark without small inputs is run on its standard inputs reduced 1000 times in work")
+    parser.add_argument("--smoke_cores", default=2, type=int, help="Number of cores of each --smoke run (Default=2)")
+    parser.add_argument("--smoke_jobs", default=0, type=int, help="Number of --smoke runs in parallel (Default=number of cpus / --smoke_cores)")
+    parser.add_argument("--retries", default=2, type=int, help="Number of retries of a run that crashed, ran out of memory or timed out (Default=2)")
+    parser.add_argument("--retry_backoff", default=10, type=float, help="Seconds before the first retry, doubled for every retry (Default=10)")
+    parser.add_argument("--quarantine_after", default=3, type=int, help="Skip the rest of the sweep of a variant after this many failed runs, not counting retries (Default=3)")
+    parser.add_argument("--warmup", default="mser", choices=["mser", "none"],
+                        help="Rule to drop the warmup rounds of every invocation in lazybenchmark_stats.csv. mser: MSER truncation, none: keep every round. Default: mser")
+    parser.add_argument("--binary_inputs", action='store_true',
+                        help="Convert the pbbs_v2 inputs once into the binary format of the suite, cached in data/.binary, and run the binaries that accept it on the converted input")
+    parser.add_argument("--stage_dir", default=None,
+                        help="Copy the pbbs_v2 inputs to a directory of this tmpfs (e.g. /dev/shm) and prewarm them before their runs")
+    parser.add_argument("--stage_budget", default=None,
+                        help="Size of the inputs staged at once with --stage_dir, e.g. 16G. The least recently used are evicted first. Default: half the free space of --stage_dir")
+    parser.add_argument("--allocator", nargs='+', default=[runtime_config.default_allocator], choices=runtime_config.allocators + ["all"],
+                        help="Memory allocators to run every variant with, preloaded with LD_PRELOAD. all: glibc and every allocator found. Default: glibc")
+    parser.add_argument("--thp", nargs='+', default=["system"], choices=runtime_config.thp_modes + ["system"],
+                        help="Transparent huge page modes to run every variant with, set in sysfs when writable, never is also set with prctl. system: leave the mode of the system. Default: system")
+    parser.add_argument("--isolate", action='store_true',
+                        help="Run every measured process in its own cgroup v2 leaf with a cpuset of --num_cores cpus, and the rest of the harness in a low-priority cgroup")
+    parser.add_argument("--cgroup_root", default=None, help="cgroup v2 mount used by --isolate. Default: found in /proc/mounts")
+    parser.add_argument("--cgroup_memory", default=None, help="Memory limit of every measured run with --isolate, e.g. 64G. Default: no limit")
+    parser.add_argument("--run_timeout", default=None, type=float, help="Seconds before a run is killed (Default=no timeout)")
+    parser.add_argument("--check_timeout", default=None, type=float, help="Seconds before the verification of a run is killed (Default=no timeout)")
+    parser.add_argument("--datagen_timeout", default=None, type=float,
+                        help="Seconds before the generation of a data set is killed, the truncated data set is removed (Default=no timeout)")
+    parser.add_argument("--variant_rules", default="builtin", choices=sweep_spec.variant_rules,
+                        help="builtin: only run the combinations of --schedule_tasks, --noopt, --fg and --parallel_framework of the paper. "
+                        "none: run every combination. Default: builtin")
+    parser.add_argument("--spec", default=None,
+                        help="Sweep spec (TOML, YAML or JSON) with the axes of the matrix, per-benchmark overrides and exclusion rules. "
+                        "Replaces --ifile, --num_cores, --parallel_framework, --schedule_tasks, --fg and --noopt")
+    parser.add_argument("--size_sweep", default=0, type=int, metavar="POINTS",
+                        help="Run every variant on a geometric series of POINTS input sizes ending at each standard input, "
+                        "to find the size from which a variant beats the baseline (see analyzescaling.py). Default: 0, the standard inputs")
+    parser.add_argument("--size_factor", default=2, type=float,
+                        help="Ratio of the work of consecutive sizes of --size_sweep (Default=2)")
+    parser.add_argument("--metrics_port", default=None, type=int,
+                        help="Serve the live counters of the sweep (units done, failed and remaining, current cell, last timings, throughput, ETA) "
+                        "on this port of localhost, in the Prometheus text format on /metrics and as JSON on /status. 0: any free port")
+    parser.add_argument("--status_line", default="auto", choices=["auto", "on", "off"],
+                        help="Show the progress of the sweep on a refreshing status line instead of the progress fragments. "
+                        "auto: when stderr is a terminal, unless verbose or dry run. Default: auto")
+    parser.add_argument("--sentinel", default=None, choices=sorted(sentinel.workloads),
+                        help="Calibrate the machine with the serial build of this cilk5 kernel on a reduced input, run on the cores of the next cell "
+                        "every --sentinel_every units. Its times are kept in lazybenchmark_sentinel.csv and the noise factor of every unit "
+                        "in lazybenchmark_noise.csv (see analyzecsv.py --normalize). Default: not calibrated")
+    parser.add_argument("--sentinel_every", default=1, type=int, help="Units between two sentinels (Default=1)")
+    parser.add_argument("--sentinel_threshold", default=5, type=float,
+                        help="Drift in %% of a sentinel from the baseline of its core count from which the units run since the previous sentinel "
+                        "are run again at the end of the sweep (Default=5)")
+    parser.add_argument("--sentinel_requeue", default=1, type=int, help="Times a unit is run again at most after a drift (Default=1)")
+    parser.add_argument("--energy", action='store_true',
+                        help="Measure the energy of every run from the package and DRAM RAPL counters of /sys/class/powercap (root is usually needed), "
+                        "in lazybenchmark_energy.csv (see analyzecsv.py --energy). Not measured if there are no readable counters")
+    parser.add_argument("--energy_root", default="/", help="Root of the sysfs tree read by --energy, e.g. a fake tree for testing. Default: /")
+    return parser
+
+# Options of the command line
+def options_from_flags(flags):
+    import dataset_staging
+
+    return LazyBenchmarkOptions(
+        benchmarks_to_run=parse_csv(flags.ifile) if flags.spec is None else [],
+        compile_only=flags.compile,
+        execute_only=flags.execute,
+        num_cores=flags.num_cores,
+        num_tests=flags.num_tests,
+        cilk_lowering=CilkLowering.strs2enums(flags.parallel_framework),
+        task_scheduler=flags.schedule_tasks,
+        noopt=[flags.noopt=='yes'] if flags.noopt != 'both' else [True, False],
+        finergrainsize=[flags.fg=='yes'] if flags.fg != 'both' else [True, False],
+        measure_icache=flags.icache,
+        measure_promotedtask=flags.sched_stats,
+        disable_numa=flags.disable_numa,
+        verbose=flags.verbose,
+        dry_run=flags.dryrun,
+        wait_load=flags.wait_load,
+        disable_pinning=flags.disable_pinning,
+        profile_cells=flags.profile,
+        profile_freq=flags.profile_freq,
+        order=flags.order,
+        num_samples=flags.samples,
+        seed=flags.seed,
+        env_profile=machine_env.load_profile(flags.env_profile) if flags.env_profile else None,
+        env_action=flags.env_action,
+        warmup=flags.warmup,
+        retries=flags.retries,
+        retry_backoff=flags.retry_backoff,
+        quarantine_after=flags.quarantine_after,
+        smoke=flags.smoke,
+        smoke_cores=flags.smoke_cores,
+        smoke_jobs=flags.smoke_jobs,
+        budget=sweep_planner.parse_budget(flags.budget) if flags.budget is not None else None,
+        plan_order=flags.plan_order,
+        history_dirs=flags.history,
+        binary_inputs=flags.binary_inputs,
+        stage_dir=flags.stage_dir,
+        stage_budget=dataset_staging.parse_size(flags.stage_budget) if flags.stage_budget is not None else None,
+        allocators=flags.allocator,
+        thp_modes=[None if mode == "system" else mode for mode in flags.thp],
+        isolate=flags.isolate,
+        cgroup_root=flags.cgroup_root,
+        cgroup_memory=dataset_staging.parse_size(flags.cgroup_memory) if flags.cgroup_memory is not None else None,
+        run_timeout=flags.run_timeout,
+        check_timeout=flags.check_timeout,
+        datagen_timeout=flags.datagen_timeout,
+        variant_rules=flags.variant_rules,
+        size_sweep=flags.size_sweep,
+        size_factor=flags.size_factor,
+        metrics_port=flags.metrics_port,
+        status_line=flags.status_line,
+        sentinel=flags.sentinel,
+        sentinel_every=flags.sentinel_every,
+        sentinel_threshold=flags.sentinel_threshold,
+        sentinel_requeue=flags.sentinel_requeue,
+        energy=flags.energy,
+        energy_root=flags.energy_root)
 
-        dump_string("\nTest " + benchmark_path_name + ":\n", 0, lazy_benchmark_options.verbose)
-        dump_string("Settting up test:",  0, lazy_benchmark_options.verbose)
+def main():
+    global tracer
+    # parse arguments
+    parser = make_parser()
+    flags = parser.parse_args()
+
+    if flags.save_env_profile:
+        machine_env.save_profile(machine_env.get_fingerprint(), flags.save_env_profile)
+        print(f"Saved machine state to {flags.save_env_profile}")
+        return
 
-        # compile benchmark
-        if(not lazy_benchmark_options.execute_only):
-            compile_status, compiler_error, out, err = compile_benchmark(lazy_benchmark_options, benchmark_obj, output_dir)
-        else:
-            compile_status = CmdStatus.CORRECT;
-            compiler_error = "testPBBS run without compiling benchmark"
-            showprogress(f"Compiled-Skipped:")
-
-        if (compile_status != CmdStatus.CORRECT) or lazy_benchmark_options.compile_only:
-            # Create  a function for this
-            row = [""] * num_cols
-            row[int(ColName.BENCHMARK)] = benchmark_obj.name + "/" + benchmark_obj.binary
-            if compile_status == CmdStatus.CORRECT:
-                row[int(ColName.COMPILES)] = "Yes"
-            else:
-                row[int(ColName.COMPILES)] = "No"
-            row[int(ColName.ERROR_MSG)] = compiler_error
-            row[int(ColName.PARALLEL_FRAMEWORK)] = lazy_benchmark_options.get_cilklowering_str()
-            row[int(ColName.TASK_SCHEDULER)] = lazy_benchmark_options.task_scheduler
-            row[int(ColName.PFORMAXGRAINSIZE)] = 2048
-            if(lazy_benchmark_options.finergrainsize == 1):
-                row[int(ColName.PFORMAXGRAINSIZE)] = 8
-            row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "No"
-            if(lazy_benchmark_options.noopt == 1):
-                row[int(ColName.IGNORE_USER_PFORGAINSIZE)] = "Yes"
-
-            csv_writer.writerow(row)
-            continue
+    # SIGTERM unwinds like Ctrl-C: the commands running are killed and the
+    # sweep cleans up
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
 
-        # execute benchmark
-        execute_benchmark_top(benchmark_obj, lazy_benchmark_options, csv_writer, csv_file, test_cores, compile_status, compiler_error)
+    # Traced from here, the sweep is run by run() below
+    tracer = trace_events.Tracer()
+    try:
+        with trace(trace_events.root_name):
+            main_traced(parser, flags)
+    finally:
+        stop_progress()
+        finish_trace()
 
+def main_traced(parser, flags):
+    import sweep_spec
 
-    csv_file.close()
+    try:
+        with trace("parse_options", ifile=flags.spec or flags.ifile):
+            lazy_benchmark_options = options_from_flags(flags)
+            if flags.spec:
+                spec = sweep_spec.load(flags.spec)
+                if not spec["benchmarks"]:
+                    spec["benchmarks"] = [flags.ifile]
+                spec_counts = apply_spec(lazy_benchmark_options, spec)
+            check_options(lazy_benchmark_options)
+    except ValueError as e:
+        parser.error(str(e))
+    set_output_mode(lazy_benchmark_options)
+    if flags.spec and not flags.list_units:
+        print(f"Sweep spec {flags.spec}: {format_spec_counts(spec_counts, len(lazy_benchmark_options.units))}")
+
+    if flags.list_units:
+        # Every unit is run with every allocator and THP mode of the sweep
+        test_cores = get_test_num_cores(lazy_benchmark_options.num_cores)
+        units = [dict(unit, allocator=lazy_benchmark_options.allocators,
+                      thp=[mode if mode is not None else "system" for mode in lazy_benchmark_options.thp_modes])
+                 for unit in get_work_units(lazy_benchmark_options, test_cores)]
+        json.dump(units, sys.stdout, indent=1)
+        print("")
+        return
+
+    if flags.plan:
+        selected, units, total = plan(lazy_benchmark_options)
+        sweep_planner.print_plan(selected, units, total, lazy_benchmark_options.budget)
+        return
+
+    try:
+        run(lazy_benchmark_options, flags.odir)
+    except SweepError as e:
+        sys.exit(str(e))
 
 # Main entry
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Round trips of the coordinator and agent protocol of a distributed sweep:
+the coordinator serves its units over HTTP in a thread and the agent side is
+driven with the functions of sweep_agent.py.
+
+    python -m pytest tests
+"""
+
+import http.server
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sweep_agent
+import sweep_coordinator
+import testBenchmark_compile
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+harness = os.path.join(repo_dir, "testBenchmark_compile.py")
+
+results_header = ["BENCHMARK", "COMPILES", "DATASET", "NUM CORES", "STATUS", "TIME", "ERROR MSG"]
+
+def make_units(count):
+    return [{"benchmark": ["pbbs_v2", "bfs/det", "BFS", "BFSCheck", "graphData", ""], "dataset": f"g{index}",
+             "suffix": "tapir", "schedule_tasks": "PBBS", "noopt": "no", "fg": "no", "parallel_framework": "tapir",
+             "num_cores": 1} for index in range(count)]
+
+def results_files(dataset, status="Correct"):
+    return {"lazybenchmark_results.csv": [results_header, ["bfs/det", "yes", dataset, "1", status, "1.0", ""]]}
+
+class CoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp(prefix="sweep_test_")
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    # Serve the coordinator of the units on a free port, returns its URL
+    def serve(self, units, lease_time=60, retries=2, run_args=["--num_tests", "3"]):
+        self.coordinator = sweep_coordinator.Coordinator(units, run_args, self.output_dir, lease_time, retries)
+        handler = type("Handler", (sweep_coordinator.CoordinatorHandler,), {"coordinator": self.coordinator})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def lease(self, url, agent):
+        return sweep_agent.post_with_retries(url, "/lease", {"agent": agent, "fingerprint": {}}, 0, 0)
+
+    def deliver(self, url, lease, files, agent="a1"):
+        status, error = sweep_agent.get_status(0, files)
+        return sweep_agent.post_with_retries(url, "/result", {"unit_id": lease["unit_id"], "lease_id": lease["lease_id"],
+                                                               "agent": agent, "status": status, "error": error, "files": files}, 0, 0)
+
+    def read_merged(self, fname):
+        with open(os.path.join(self.output_dir, fname)) as ifile:
+            return [line.rstrip("\n").split(",") for line in ifile]
+
+    def test_lease_result_merge(self):
+        url = self.serve(make_units(2))
+        for index in range(2):
+            lease = self.lease(url, "a1")
+            self.assertEqual(lease["unit"]["dataset"], f"g{lease['unit_id']}")
+            self.assertEqual(lease["run_args"], ["--num_tests", "3"])
+            self.assertEqual(self.deliver(url, lease, results_files(lease["unit"]["dataset"])), {"ok": True})
+        self.assertEqual(self.lease(url, "a1"), {"done": True})
+
+        # The header of a csv file is merged once
+        merged = self.read_merged("lazybenchmark_results.csv")
+        self.assertEqual(merged[0], results_header)
+        self.assertEqual([row[2] for row in merged[1:]], ["g0", "g1"])
+        self.assertEqual(self.coordinator.status()["status"], {"DONE": 2})
+
+    def test_expired_lease_goes_to_another_agent(self):
+        url = self.serve(make_units(1), lease_time=0)
+        first = self.lease(url, "a1")
+        self.coordinator.expire_leases()
+        second = self.lease(url, "a2")
+        self.assertEqual(second["unit_id"], first["unit_id"])
+        self.assertNotEqual(second["lease_id"], first["lease_id"])
+
+        # The result of the expired lease is refused, that of the new one merged
+        self.assertEqual(self.deliver(url, first, results_files("g0"), "a1"), {"ok": False})
+        self.assertEqual(self.deliver(url, second, results_files("g0"), "a2"), {"ok": True})
+        self.assertEqual(len(self.read_merged("lazybenchmark_results.csv")), 2)
+        self.assertEqual(self.coordinator.units[0]["attempts"], 2)
+
+    def test_failed_unit_is_retried_then_given_up(self):
+        url = self.serve(make_units(1), retries=1)
+        first = self.lease(url, "a1")
+        self.deliver(url, first, results_files("g0", "Failed"), "a1")
+        self.assertEqual(self.coordinator.units[0]["status"], sweep_coordinator.UnitStatus.PENDING)
+        second = self.lease(url, "a2")
+        self.deliver(url, second, results_files("g0", "Failed"), "a2")
+        self.assertEqual(self.coordinator.units[0]["status"], sweep_coordinator.UnitStatus.FAILED)
+        self.assertEqual(self.lease(url, "a1"), {"done": True})
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "lazybenchmark_results.csv")))
+
+    # The settings of a sweep spec reach the command line of the agent
+    def test_spec_settings_reach_the_agent(self):
+        spec_file = os.path.join(self.output_dir, "spec.json")
+        with open(spec_file, "w") as ofile:
+            json.dump({"benchmarks": [os.path.join(repo_dir, "lazybenchmark.csv")], "num_cores": [1], "num_tests": 7, "samples": 3,
+                       "parallel_framework": ["tapir"], "schedule_tasks": ["PBBS"], "fg": ["no"], "noopt": ["no"],
+                       "allocator": ["glibc"], "thp": ["never", "system"],
+                       "override": [{"benchmark": "pbbs_v2/bfs/*", "run_timeout": 900}]}, ofile)
+        sweep_args = ["--spec", spec_file, "--wait_load", "4"]
+        units = sweep_coordinator.list_units(harness, sweep_args)
+        run_args = sweep_coordinator.get_run_args(sweep_args)
+        self.assertEqual(run_args, ["--wait_load", "4"])
+        url = self.serve(units, run_args=run_args)
+
+        leased = {}
+        while True:
+            lease = self.lease(url, "a1")
+            if "unit_id" not in lease:
+                break
+            input_file = os.path.join(self.output_dir, "unit.csv")
+            sweep_agent.write_unit_file(lease["unit"], input_file)
+            cmd = sweep_agent.unit_command(harness, lease, input_file, "out")
+            flags = testBenchmark_compile.make_parser().parse_args(cmd[2:])
+            options = testBenchmark_compile.options_from_flags(flags)
+            leased[lease["unit"]["benchmark"][1]] = options
+            self.deliver(url, lease, results_files(lease["unit"]["dataset"]))
+
+        self.assertEqual(len(leased), len(set(unit["benchmark"][1] for unit in units)))
+        for name, options in leased.items():
+            self.assertEqual((options.num_tests, options.num_samples), (7, 3))
+            self.assertEqual(options.run_timeout, 900 if name.startswith("bfs/") else None)
+            self.assertEqual(options.allocators, ["glibc"])
+            self.assertEqual(options.thp_modes, ["never", None])
+            self.assertEqual(options.wait_load, 4)
+
+    def test_status_is_read_by_column_name(self):
+        files = {"lazybenchmark_results.csv": [["BENCHMARK", "NEW", "STATUS", "ERROR MSG"], ["bfs/det", "x", "Correct", ""]]}
+        self.assertEqual(sweep_agent.get_status(0, files), ("ok", ""))
+        files["lazybenchmark_results.csv"][1][2] = "Timeout"
+        self.assertEqual(sweep_agent.get_status(0, files), ("failed", "Benchmark failed"))
+
+if __name__ == "__main__":
+    unittest.main()
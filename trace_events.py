@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Contains helper code required to trace the phases of the harness (compile,
+data set generation, load waiting, runs, verification, ...) in the Chrome
+trace event format, viewable in Perfetto or chrome://tracing.
+
+Run as a script, it prints where the wall time of a traced sweep went:
+    ./trace_events.py --ifile oDir/lazybenchmark_output_files_*/lazybenchmark_trace.json
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Name of the span that covers the whole sweep, its self time is the time of
+# the harness outside of every traced phase
+root_name = "sweep"
+
+# Spans of the harness. The events are streamed to the file as they end, in
+# the JSON array format, so that the trace of an interrupted sweep can still
+# be read (the closing bracket is optional in this format).
+class Tracer(object):
+    def __init__(self):
+        self.pid = os.getpid()
+        self.epoch = time.time() - time.perf_counter()
+        self.events = []   # Kept until the file is opened
+        self.threads = set()
+        self.path = None
+        self.ofile = None
+        self.lock = threading.Lock()
+
+    # Microseconds since the epoch
+    def now(self):
+        return (self.epoch + time.perf_counter()) * 1e6
+
+    # Stream the events to path from now on, the events so far included
+    def open(self, path):
+        with self.lock:
+            self.path = path
+            self.ofile = open(path, "wb")
+            self.ofile.write(b"[\n")
+            for event in self.events:
+                self.write_locked(event)
+            self.events = []
+
+    def add(self, event):
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        with self.lock:
+            if thread.ident not in self.threads:
+                self.threads.add(thread.ident)
+                self.add_locked({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread.ident,
+                                 "args": {"name": thread.name}})
+            self.add_locked(event)
+
+    def add_locked(self, event):
+        if self.ofile is None:
+            self.events.append(event)
+        else:
+            self.write_locked(event)
+
+    def write_locked(self, event):
+        self.ofile.write(json.dumps(event).encode() + b",\n")
+        self.ofile.flush()
+
+    # Complete event ("X") of the phase, args are shown with it
+    @contextlib.contextmanager
+    def span(self, name, cat="harness", **args):
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.add({"name": name, "cat": cat, "ph": "X", "ts": round(start, 1),
+                      "dur": round(self.now() - start, 1), "args": args})
+
+    def instant(self, name, cat="harness", **args):
+        self.add({"name": name, "cat": cat, "ph": "i", "s": "t", "ts": round(self.now(), 1), "args": args})
+
+    def close(self):
+        with self.lock:
+            if self.ofile is not None:
+                # Replace the comma after the last event
+                if self.ofile.tell() > 2:
+                    self.ofile.seek(-2, os.SEEK_END)
+                self.ofile.write(b"\n]\n")
+                self.ofile.truncate()
+                self.ofile.close()
+                self.ofile = None
+
+# Events of a trace file written by Tracer, possibly unterminated
+def load(path):
+    with open(path) as ifile:
+        text = ifile.read().strip()
+    if text.endswith(","):
+        text = text[:-1]
+    if not text.endswith("]"):
+        text = text + "]"
+    events = json.loads(text)
+    if isinstance(events, dict):
+        events = events.get("traceEvents", [])
+    return events
+
+# Category of the spans of the commands run by the harness, counted in the
+# self time of the phase that ran them
+cmd_cat = "cmd"
+
+# Self time of every complete event: its duration minus the duration of the
+# phases directly nested in it on the same thread, and the time of the
+# commands directly nested in it. Returns [(event, self, commands)].
+def self_times(events):
+    result = []
+    by_thread = {}
+    for event in events:
+        if event.get("ph") == "X":
+            by_thread.setdefault(event["tid"], []).append(event)
+    for tid, thread_events in by_thread.items():
+        thread_events.sort(key=lambda event: (event["ts"], -event["dur"]))
+        stack = []  # [event, time of its nested phases, time of its commands]
+        for event in thread_events:
+            while stack and event["ts"] >= stack[-1][0]["ts"] + stack[-1][0]["dur"]:
+                parent, children, commands = stack.pop()
+                result.append((parent, parent["dur"] - children, commands))
+            if stack:
+                stack[-1][2 if event.get("cat") == cmd_cat else 1] += event["dur"]
+            stack.append([event, 0.0, 0.0])
+        while stack:
+            parent, children, commands = stack.pop()
+            result.append((parent, parent["dur"] - children, commands))
+    return result
+
+# Where the wall time went: [(phase, count, total sec, self sec, commands
+# sec)] of the thread of the sweep, by self time, and the wall time of the
+# sweep. The self time minus the time of the commands is the time of the
+# harness itself. The phases of the other threads (e.g. the parallel --smoke
+# runs) are within the smoke phase of the sweep and are not counted.
+def summarize(events):
+    spans = [event for event in events if event.get("ph") == "X"]
+    if not spans:
+        return [], 0.0
+    roots = [event for event in spans if event["name"] == root_name]
+    main = max(roots or spans, key=lambda event: event["dur"])
+    phases = {}
+    for event, self_time, commands in self_times([event for event in spans if event["tid"] == main["tid"]]):
+        if event.get("cat") == cmd_cat:
+            continue
+        count, total, self_total, commands_total = phases.get(event["name"], (0, 0.0, 0.0, 0.0))
+        phases[event["name"]] = (count + 1, total + event["dur"] / 1e6, self_total + self_time / 1e6, commands_total + commands / 1e6)
+    summary = sorted([(name,) + values for name, values in phases.items()], key=lambda row: -row[3])
+    wall = sum(event["dur"] for event in roots if event["tid"] == main["tid"]) / 1e6 if roots else main["dur"] / 1e6
+    return summary, wall
+
+def format_summary(summary, wall, top=None):
+    lines = [f"{'PHASE':<16} {'COUNT':>7} {'TOTAL(sec)':>12} {'SELF(sec)':>12} {'COMMANDS(sec)':>14} {'SELF%':>7}"]
+    for name, count, total, self_time, commands in summary[:top]:
+        share = 100.0 * self_time / wall if wall > 0 else 0.0
+        name = "(harness)" if name == root_name else name
+        lines.append(f"{name:<16} {count:>7} {total:>12.3f} {self_time:>12.3f} {commands:>14.3f} {share:>6.1f}%")
+    lines.append(f"{'wall':<16} {'':>7} {wall:>12.3f}")
+    return "\n".join(lines)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print where the wall time of a traced sweep went')
+    parser.add_argument("--ifile", required=True, help="lazybenchmark_trace.json to summarize")
+    parser.add_argument("--top", default=None, type=int, help="Only print the phases with the most self time. Default: all")
+
+    flags = parser.parse_args()
+
+    summary, wall = summarize(load(flags.ifile))
+    print(format_summary(summary, wall, flags.top))
+
+# Main entry
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Script to keep the results of every sweep in a SQLite database, with the
+machine fingerprint (environment.json) of the sweep, and to query the history
+of a cell and find the sweeps where its time shifted (change points) and
+the series whose time drifts.
+
+    ./trenddb.py --ingest
+    ./trenddb.py --benchmark 'ndMIS*' --cores 64 --impl 'LazyD*' --days 90
+    ./trenddb.py --benchmark 'ndMIS*' --changepoints
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import math
+import os
+import re
+import sqlite3
+import statistics
+import time
+
+from comparecsv import getcells
+import machine_env
+import steady_state
+
+default_db = "oDir/lazybenchmark_trend.db"
+
+default_result_dirs = "oDir/lazybenchmark_output_files_*"
+
+fp_format = '.4f'
+
+# TIMESTAMP column of lazybenchmark_samples.csv
+sample_timestamp_col = 7
+
+schema = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    timestamp REAL NOT NULL,
+    results_size INTEGER,
+    results_mtime_ns INTEGER,
+    governor TEXT, turbo TEXT, smt TEXT, thp TEXT, kernel TEXT, compiler TEXT, runtime TEXT,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    sweep_id INTEGER NOT NULL REFERENCES sweeps(id) ON DELETE CASCADE,
+    benchmark TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    num_cores INTEGER NOT NULL,
+    impl TEXT NOT NULL,
+    rounds INTEGER,
+    mean REAL, median REAL, min REAL, cv REAL
+);
+CREATE INDEX IF NOT EXISTS results_series ON results(benchmark, num_cores, impl, dataset);
+CREATE INDEX IF NOT EXISTS results_sweep ON results(sweep_id);
+CREATE INDEX IF NOT EXISTS sweeps_timestamp ON sweeps(timestamp);
+"""
+
+def connect(db_path):
+    if os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    db = sqlite3.connect(db_path)
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(schema)
+    return db
+
+# Start time of the sweep: from the name of its directory
+# (lazybenchmark_output_files_<%Y%m%d-%H%M%S>), else its first sample, else
+# the time its results were written
+def sweep_timestamp(result_dir):
+    match = re.search(r"(\d{8}-\d{6})$", os.path.basename(os.path.normpath(result_dir)))
+    if match:
+        return time.mktime(time.strptime(match.group(1), "%Y%m%d-%H%M%S"))
+    timestamps = []
+    try:
+        with open(os.path.join(result_dir, "lazybenchmark_samples.csv")) as ifile:
+            for line in ifile:
+                fields = line.split(",")
+                try:
+                    timestamps.append(float(fields[sample_timestamp_col]))
+                except (IndexError, ValueError):
+                    continue
+    except OSError:
+        pass
+    if timestamps:
+        return min(timestamps)
+    return os.path.getmtime(os.path.join(result_dir, "lazybenchmark_results.csv"))
+
+def read_fingerprint(result_dir):
+    try:
+        with open(os.path.join(result_dir, "environment.json")) as ifile:
+            return json.load(ifile)
+    except (OSError, ValueError):
+        return {}
+
+# Add the results of the sweeps to the database. A sweep already in the
+# database is only read again if its results changed. Returns the number of
+# sweeps read.
+def ingest(db, result_dirs, warmup):
+    ingested = 0
+    for result_dir in result_dirs:
+        results_file = os.path.join(result_dir, "lazybenchmark_results.csv")
+        if not os.path.isfile(results_file):
+            continue
+        with open(results_file) as ifile:
+            if len(ifile.readlines()) < 2:
+                # No result yet (the sweep failed or is starting)
+                continue
+        path = os.path.abspath(result_dir)
+        st = os.stat(results_file)
+        row = db.execute("SELECT id, results_size, results_mtime_ns FROM sweeps WHERE path = ?", (path,)).fetchone()
+        if row is not None and (row[1], row[2]) == (st.st_size, st.st_mtime_ns):
+            continue
+        try:
+            cells = getcells(results_file, warmup)
+        except (IndexError, ValueError) as e:
+            print(f"Skipping {result_dir}: {e}")
+            continue
+
+        fingerprint = read_fingerprint(result_dir)
+        with db:
+            if row is not None:
+                db.execute("DELETE FROM sweeps WHERE id = ?", (row[0],))
+            cursor = db.execute("INSERT INTO sweeps (path, timestamp, results_size, results_mtime_ns, "
+                                + ", ".join(machine_env.profile_fields) + ", fingerprint) VALUES (?, ?, ?, ?, "
+                                + ", ".join("?" for field in machine_env.profile_fields) + ", ?)",
+                                [path, sweep_timestamp(result_dir), st.st_size, st.st_mtime_ns]
+                                + [fingerprint.get(field) for field in machine_env.profile_fields]
+                                + [json.dumps(fingerprint, sort_keys=True)])
+            for (benchmark, dataset, num_cores, impl), times in cells.items():
+                if not times:
+                    continue
+                summary = steady_state.summarize(times)
+                db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (cursor.lastrowid, benchmark, dataset, int(num_cores), impl, len(times),
+                            summary["mean"], summary["median"], summary["min"], summary["cv"]))
+        ingested += 1
+    return ingested
+
+# Results of the cells matching the glob patterns, over the last days if
+# given, ordered by series and time
+def query(db, benchmark="*", dataset="*", num_cores=None, impl="*", days=None):
+    sql = ("SELECT r.benchmark, r.dataset, r.num_cores, r.impl, s.timestamp, s.path, r.rounds, r.mean, r.median, r.cv, "
+           + ", ".join("s." + field for field in machine_env.profile_fields)
+           + " FROM results r JOIN sweeps s ON r.sweep_id = s.id"
+           + " WHERE r.benchmark GLOB ? AND r.dataset GLOB ? AND r.impl GLOB ?")
+    args = [benchmark, dataset, impl]
+    if num_cores is not None:
+        sql += " AND r.num_cores = ?"
+        args.append(num_cores)
+    if days is not None:
+        sql += " AND s.timestamp >= ?"
+        args.append(time.time() - days * 24 * 3600)
+    sql += " ORDER BY r.benchmark, r.dataset, r.num_cores, r.impl, s.timestamp"
+    return db.execute(sql, args).fetchall()
+
+# Sum of squared deviations from the mean of values[lo:hi], from the prefix
+# sums of the values and of their squares
+def segment_cost(sums, squares, lo, hi):
+    n = hi - lo
+    total = sums[hi] - sums[lo]
+    return (squares[hi] - squares[lo]) - total * total / n
+
+# Noise of the series, from its second differences, so that neither a shift
+# nor a drift counts as noise
+def noise_sigma(values):
+    diffs = [abs(c - 2 * b + a) for a, b, c in zip(values, values[1:], values[2:])]
+    sigma = statistics.median(diffs) / (0.6745 * math.sqrt(6)) if diffs else 0.0
+    return max(sigma, 1e-3 * abs(statistics.median(values)), 1e-12)
+
+# Change points of the mean of the series by binary segmentation: split where
+# the cost (squared deviations) drops the most, while it drops by more than
+# the penalty. Returns the indices where a new segment starts and the cost of
+# the segments.
+def segment(values, min_size, penalty):
+    n = len(values)
+    sums = [0.0]
+    squares = [0.0]
+    for value in values:
+        sums.append(sums[-1] + value)
+        squares.append(squares[-1] + value * value)
+
+    points = []
+    segments = [(0, n)]
+    total = 0.0
+    while segments:
+        lo, hi = segments.pop()
+        whole = segment_cost(sums, squares, lo, hi)
+        best, split = None, None
+        for k in range(lo + min_size, hi - min_size + 1):
+            cost = segment_cost(sums, squares, lo, k) + segment_cost(sums, squares, k, hi)
+            if best is None or cost < best:
+                best, split = cost, k
+        if best is not None and whole - best > penalty:
+            points.append(split)
+            segments.extend([(lo, split), (split, hi)])
+        else:
+            total += whole
+    return sorted(points), total
+
+# Least squares slope of the values shared by the segments starting at
+# points, each segment keeping its own level. In the unit of the values per
+# sweep.
+def fit_slope(values, points):
+    bounds = [0] + points + [len(values)]
+    sxy, sxx = 0.0, 0.0
+    for lo, hi in zip(bounds, bounds[1:]):
+        mean_x = (lo + hi - 1) / 2
+        mean_y = statistics.mean(values[lo:hi])
+        sxy += sum((x - mean_x) * (values[x] - mean_y) for x in range(lo, hi))
+        sxx += sum((x - mean_x) ** 2 for x in range(lo, hi))
+    return sxy / sxx if sxx > 0 else 0.0
+
+# Number of times the slope and the steps on top of it are fitted in turn
+trend_iterations = 5
+
+# Change points (steps) and drift of the mean of the series. The steps are
+# found by binary segmentation with a penalty of 2 log(n) times the noise
+# variance (BIC) per step. The series is also fitted as steps on top of a
+# line, which costs one more penalty: if that fits better, the series drifts
+# and only the steps on top of the line are kept, so that a ramp is not cut
+# into several steps. Returns the indices where a new segment starts and the
+# slope of the drift per sweep, None if it does not drift.
+def changepoints(values, min_size=2):
+    n = len(values)
+    if n < 2 * min_size:
+        return [], None
+    penalty = 2 * math.log(n) * noise_sigma(values) ** 2
+
+    points, cost = segment(values, min_size, penalty)
+    trend_points = []
+    for iteration in range(trend_iterations):
+        slope = fit_slope(values, trend_points)
+        trend_points, trend_cost = segment([value - slope * x for x, value in enumerate(values)], min_size, penalty)
+    if trend_cost + penalty * (len(trend_points) + 1) < cost + penalty * len(points):
+        return trend_points, slope
+    return points, None
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+# One row per sweep of every series
+def process_query(rows):
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Impl", "Date", "Sweep", "Rounds", "Mean(s)", "Median(s)", "CV(%)",
+                     "Compiler", "Runtime", "Kernel"]]
+    for row in rows:
+        fields = dict(zip(machine_env.profile_fields, row[10:]))
+        table_result.append(list(row[:4]) + [format_time(row[4]), os.path.basename(row[5]), row[6], format(row[7], fp_format),
+                                             format(row[8], fp_format), format(row[9], '.2f'),
+                                             fields["compiler"], fields["runtime"], fields["kernel"]])
+    return table_result
+
+# Fields of the fingerprint that differ between two rows of a series
+def changed_fields(previous_row, current_row):
+    previous = dict(zip(machine_env.profile_fields, previous_row[10:]))
+    current = dict(zip(machine_env.profile_fields, current_row[10:]))
+    return [field for field in machine_env.profile_fields if previous[field] != current[field]]
+
+# The drift and the change points of the median of every series that shift
+# it by more than threshold %, with the fields of the fingerprint that changed
+# at the sweep of the change (over the series for a drift). The levels of a
+# step are taken on each side of it, after removing the drift.
+def process_changepoints(rows, threshold, min_size):
+    table_result = [["Benchmark", "Dataset", "Num Cores", "Impl", "Kind", "Date", "Sweep", "Sweeps", "Before(s)", "After(s)", "Shift(%)",
+                     "Changed"]]
+    series = {}
+    for row in rows:
+        series.setdefault(row[:4], []).append(row)
+    for key, series_rows in series.items():
+        medians = [row[8] for row in series_rows]
+        points, slope = changepoints(medians, min_size)
+        residuals = [median - (slope or 0.0) * x for x, median in enumerate(medians)]
+        bounds = [0] + points + [len(medians)]
+
+        if slope is not None:
+            first = statistics.mean(residuals[:bounds[1]])
+            last = first + slope * (len(medians) - 1)
+            shift = (last - first) / first * 100 if first > 0 else 0.0
+            if abs(shift) >= threshold:
+                table_result.append(list(key) + ["drift", format_time(series_rows[0][4]), os.path.basename(series_rows[0][5]),
+                                                 str(len(medians)), format(first, fp_format), format(last, fp_format),
+                                                 format(shift, '.2f'), " ".join(changed_fields(series_rows[0], series_rows[-1]))])
+
+        for start, split, end in zip(bounds, bounds[1:], bounds[2:]):
+            level = (slope or 0.0) * (split - 0.5)
+            before = statistics.mean(residuals[start:split]) + level
+            after = statistics.mean(residuals[split:end]) + level
+            shift = (after - before) / before * 100 if before > 0 else 0.0
+            if abs(shift) < threshold:
+                continue
+            table_result.append(list(key) + ["step", format_time(series_rows[split][4]), os.path.basename(series_rows[split][5]),
+                                             f"{split - start}+{end - split}", format(before, fp_format), format(after, fp_format),
+                                             format(shift, '.2f'), " ".join(changed_fields(series_rows[split - 1], series_rows[split]))])
+    return table_result
+
+def generate_table(table_results):
+    for row in table_results:
+        print(", ".join(str(col) for col in row))
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep the results of every sweep in a database and find where they shifted')
+    parser.add_argument("--db", default=default_db, help=f"SQLite database. Default: {default_db}")
+    parser.add_argument("--ingest", nargs='*', default=None, metavar="DIR",
+                        help=f"Add the results of these sweep directories to the database. Default: {default_result_dirs}")
+    parser.add_argument("--warmup", default="mser", choices=["mser", "none"], help="Rule to drop the warmup rounds of the ingested results. Default: mser")
+    parser.add_argument("--benchmark", default="*", help="Glob pattern of the benchmarks, e.g. 'ndMIS*'. Default: all")
+    parser.add_argument("--dataset", default="*", help="Glob pattern of the datasets. Default: all")
+    parser.add_argument("--cores", default=None, type=int, help="Number of cores. Default: all")
+    parser.add_argument("--impl", default="*", help="Glob pattern of the implementations, e.g. 'LazyD*'. Default: all")
+    parser.add_argument("--days", default=None, type=float, help="Only the sweeps of the last days. Default: all")
+    parser.add_argument("--changepoints", action='store_true', help="Show the sweeps where the median time of a series shifted and the series that drift")
+    parser.add_argument("--threshold", default=5.0, type=float, help="Only show the shifts larger than this percentage. Default: 5")
+    parser.add_argument("--min_sweeps", default=2, type=int, help="Number of sweeps on each side of a change point. Default: 2")
+
+    flags = parser.parse_args()
+
+    db = connect(flags.db)
+    if flags.ingest is not None:
+        result_dirs = flags.ingest if flags.ingest else sorted(glob.glob(default_result_dirs))
+        print(f"Ingested {ingest(db, result_dirs, flags.warmup)} sweeps into {flags.db}")
+        if not flags.changepoints and (flags.benchmark, flags.dataset, flags.cores, flags.impl, flags.days) == ("*", "*", None, "*", None):
+            return
+
+    rows = query(db, flags.benchmark, flags.dataset, flags.cores, flags.impl, flags.days)
+    if flags.changepoints:
+        generate_table(process_changepoints(rows, flags.threshold, max(1, flags.min_sweeps)))
+    else:
+        generate_table(process_query(rows))
+
+# Main entry
+if __name__ == "__main__":
+    main()